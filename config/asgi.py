@@ -2,6 +2,10 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the project through it (e.g. ``uvicorn config.asgi:application``) for the
+long-lived /now/stream/ event stream and the async lookup views (pupil_now, the
+simulator, /pupils/where/, /timeline/, autocomplete); under WSGI each listener
+or waiting lookup holds a thread. ``manage.py bench_timetable`` compares the two.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .databases import databases
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -41,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'timetable.metrics.MetricsMiddleware',  # inactive unless TIMETABLE_METRICS is True
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,10 +52,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'timetable.schools.SchoolMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+# Per-view query count / DB / template timings in Server-Timing headers and /metrics
+TIMETABLE_METRICS = False
+
+# School (slug) used when a request names none, and by commands and the shell
+TIMETABLE_DEFAULT_SCHOOL = 'default'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -72,15 +83,43 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Chosen by TIMETABLE_DATABASE_URL / TIMETABLE_REPLICA_URLS, see config/databases.py.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+DATABASES = databases(BASE_DIR / 'db.sqlite3')
+
+# pupil lookups and the simulator read from these (timetable/routers.py)
+TIMETABLE_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['timetable.routers.ReplicaRouter']
 
 
+# Cache for rendered timetable fragments (timetable/fragments.py).
+# Local memory by default (and in tests). For production set TIMETABLE_CACHE_URL
+# to redis://host:6379/0 for a Redis-compatible server shared by all workers,
+# or to a directory for a file-based cache.
+TIMETABLE_CACHE_URL = os.environ.get('TIMETABLE_CACHE_URL', '')
+
+if TIMETABLE_CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': TIMETABLE_CACHE_URL,
+        }
+    }
+elif TIMETABLE_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': TIMETABLE_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'timetable',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,22 +1,50 @@
-from django.contrib import admin
-from .models import Class, Pupil, Teacher, Subject, TimeEntry
+from django.contrib import admin, messages
+from django.urls import reverse
+from django.utils.html import format_html
+from . import ics
+from .changelist import CachedRelatedFilter, EstimatedCountPaginator, KeysetPaginator, PaginatedInlineFormSet
+from .changesets import apply_changeset
+from .models import (BellPeriod, BellSchedule, CalendarDay, Class, LessonChange, Pupil, Room, School, Teacher,
+                     Subject, TimeEntry, TimetableVersion)
+from .versions import PublishError, diff, live_rows, publish
+
+
+@admin.register(School)
+class SchoolAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug')
+    search_fields = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
 
 
 @admin.register(Teacher)
 class TeacherAdmin(admin.ModelAdmin):
-    list_display = ('first_name', 'last_name')
+    list_display = ('first_name', 'last_name', 'school')
+    list_filter = ('school',)
     search_fields = ('first_name', 'last_name')
+    filter_horizontal = ('subjects',)
 
 
 class PupilInline(admin.TabularInline):
     model = Pupil
     extra = 1
+    ordering = ('last_name', 'first_name')
+    # a page of pupils at a time (?pupils_page=N)
+    formset = PaginatedInlineFormSet
+    template = 'admin/timetable/paginated_tabular.html'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        try:
+            formset.page = int(request.GET.get('pupils_page', 1))
+        except ValueError:
+            pass
+        return formset
 
 
 @admin.register(Class)
 class ClassAdmin(admin.ModelAdmin):
-    list_display = ('number', 'letter')
-    list_filter = ('number',)
+    list_display = ('number', 'letter', 'school')
+    list_filter = ('school', 'number')
     search_fields = ('letter',)
     ordering = ('number', 'letter')
     inlines = [PupilInline]
@@ -25,14 +53,33 @@ class ClassAdmin(admin.ModelAdmin):
 @admin.register(Pupil)
 class PupilAdmin(admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'school_class')
-    list_filter = ('school_class__number', 'school_class__letter')
+    list_filter = ('school', 'school_class__number', 'school_class__letter')
+    list_select_related = ('school_class',)
     search_fields = ('first_name', 'last_name')
     ordering = ('school_class__number', 'school_class__letter', 'last_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('calendar_feed',)
+
+    @admin.display(description="Calendar feed")
+    def calendar_feed(self, obj):
+        if not obj.pk:
+            return "-"
+        url = reverse('timetable:calendar_feed', args=('pupil', ics.pupil_token(obj.pk)))
+        return format_html('<a href="{}">{}</a>', url, url)
+
+
+@admin.register(Room)
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'capacity', 'school')
+    list_filter = ('school', 'kind')
+    search_fields = ('name',)
 
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
-    list_display = ('get_full_name',)
+    list_display = ('get_full_name', 'room_kind', 'school')
+    list_filter = ('school', 'room_kind')
     search_fields = ('name',)
 
     def get_full_name(self, obj):
@@ -49,32 +96,52 @@ class TimeEntryAdmin(admin.ModelAdmin):
         'subject',
         'teacher',
         'group',
+        'room',
         'start_time_display',
         'end_time_display',
     )
     list_filter = (
+        'school',
         'day',
         'session',
         'school_class__number',
         'school_class__letter',
-        'subject',
-        'teacher',
+        ('subject', CachedRelatedFilter),
+        ('teacher', CachedRelatedFilter),
         'group',
+        ('room', admin.EmptyFieldListFilter),
     )
+    list_select_related = ('school_class', 'subject', 'teacher', 'room')
     search_fields = (
         'school_class__letter',
         'teacher__first_name',
         'teacher__last_name',
         'subject__name',
     )
-    ordering = (
-        'day',
-        'session',
-        'school_class__number',
-        'school_class__letter',
-        'group',
-    )
-    autocomplete_fields = ('teacher', 'school_class', 'subject')
+    # the unique constraint's columns: an index-only sort that keyset pagination can seek on
+    ordering = ('school_id', 'day', 'session', 'school_class_id', 'group')
+    paginator = KeysetPaginator
+    show_full_result_count = False
+    autocomplete_fields = ('teacher', 'school_class', 'subject', 'room')
+    actions = ['swap_slots']
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        paginator.keyset = self.ordering
+        return paginator
+
+    @admin.action(description="Swap the slots of the two selected lessons")
+    def swap_slots(self, request, queryset):
+        selected = list(queryset.values_list('pk', 'school_id')[:3])
+        if len(selected) != 2 or selected[0][1] != selected[1][1]:
+            self.message_user(request, "Select exactly two lessons of one school to swap.", messages.ERROR)
+            return
+        report = apply_changeset([{'op': 'swap', 'entries': [pk for pk, _ in selected]}], school_id=selected[0][1])
+        if report.ok:
+            self.message_user(request, "Swapped the two lessons.", messages.SUCCESS)
+        else:
+            for _, message in report.errors:
+                self.message_user(request, message, messages.ERROR)
 
     # Display methods
     def start_time_display(self, obj):
@@ -88,3 +155,69 @@ class TimeEntryAdmin(admin.ModelAdmin):
     def day_display(self, obj):
         return obj.get_day_display()
     day_display.short_description = "Day"
+
+
+class BellPeriodInline(admin.TabularInline):
+    model = BellPeriod
+    extra = 0
+
+
+@admin.register(BellSchedule)
+class BellScheduleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'school', 'is_default', 'day_start', 'lesson_minutes', 'sessions', 'version')
+    list_filter = ('school',)
+    readonly_fields = ('version',)
+    inlines = [BellPeriodInline]
+
+
+@admin.register(CalendarDay)
+class CalendarDayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'closed', 'schedule', 'follows', 'note', 'school')
+    list_filter = ('school', 'closed')
+    date_hierarchy = 'date'
+    search_fields = ('note',)
+
+
+@admin.register(LessonChange)
+class LessonChangeAdmin(admin.ModelAdmin):
+    list_display = ('date', 'week', 'day', 'session', 'school_class', 'group', 'cancelled', 'subject', 'teacher',
+                    'room', 'note')
+    list_filter = ('school', 'cancelled', 'week')
+    list_select_related = ('school_class', 'subject', 'teacher', 'room')
+    autocomplete_fields = ('school_class', 'subject', 'teacher', 'room')
+    date_hierarchy = 'date'
+
+
+@admin.register(TimetableVersion)
+class TimetableVersionAdmin(admin.ModelAdmin):
+    list_display = ('number', 'status', 'entry_count', 'note', 'created_at', 'published_at', 'school')
+    list_filter = ('school', 'status')
+    readonly_fields = ('number', 'status', 'entry_count', 'created_at', 'published_at', 'previous', 'live_diff')
+    actions = ['publish_version']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('rows')  # rows are only needed for one version
+
+    def has_add_permission(self, request):
+        return False  # versions come from snapshots and drafts (manage.py timetable_versions)
+
+    @admin.display(description="Against the live week")
+    def live_diff(self, obj):
+        changes = diff(live_rows(obj.school_id), obj.rows)
+        return (f"{len(changes.added)} added, {len(changes.removed)} removed, "
+                f"{len(changes.changed)} changed when published")
+
+    @admin.action(description="Publish the selected version (undoes live edits made since)")
+    def publish_version(self, request, queryset):
+        selected = list(queryset[:2])
+        if len(selected) != 1:
+            self.message_user(request, "Select exactly one version to publish.", messages.ERROR)
+            return
+        try:
+            changes = publish(selected[0])
+        except PublishError as exc:
+            self.message_user(request, str(exc), messages.ERROR)
+            return
+        self.message_user(request, f"Published {selected[0]}: {len(changes.added)} added, "
+                                   f"{len(changes.removed)} removed, {len(changes.changed)} changed.",
+                          messages.SUCCESS)
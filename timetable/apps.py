@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimetableConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'timetable'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the now-index receivers)
@@ -0,0 +1,172 @@
+"""
+Bell schedules: session start/end tables.
+
+A SessionTable is computed once per BellSchedule version and then only read:
+times() is a tuple index and current_session() is a bisect over the start times.
+Tables are cached per process and school, and dropped from signals when a schedule changes.
+Without any schedule for the school, the built-in default is used:
+08:30 start, 45 min lessons, 5 min breaks, 45 min big break after the 4th lesson.
+"""
+import threading
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .routers import use_replicas
+from .schools import current_school_id
+from .singleflight import Flight
+
+
+class SessionTable:
+    """Immutable start/end table for sessions 1..n of one bell schedule."""
+
+    __slots__ = ('name', 'version', 'starts', 'ends', 'labels', 'bells')
+
+    def __init__(self, name, version, periods):
+        # periods: [(start, end), ...] for sessions 1..n, in order
+        self.name = name
+        self.version = version
+        self.starts = tuple(p[0] for p in periods)
+        self.ends = tuple(p[1] for p in periods)
+        self.labels = tuple((s.strftime("%H:%M"), e.strftime("%H:%M")) for s, e in periods)
+        self.bells = tuple(sorted(set(self.starts + self.ends)))
+
+    @classmethod
+    def from_rules(cls, name, version, day_start, lesson_minutes, short_break_minutes,
+                   long_break_minutes, long_break_after, sessions, overrides=None):
+        overrides = overrides or {}
+        lesson = timedelta(minutes=lesson_minutes)
+        current = datetime.combine(datetime.min, day_start)
+        periods = []
+        for s in range(1, sessions + 1):
+            start, end = current.time(), (current + lesson).time()
+            periods.append(overrides.get(s, (start, end)))
+            current += lesson
+            if s == long_break_after:
+                current += timedelta(minutes=long_break_minutes)
+            else:
+                current += timedelta(minutes=short_break_minutes)
+        return cls(name, version, periods)
+
+    @classmethod
+    def from_schedule(cls, schedule):
+        overrides = {p.session: (p.start_time, p.end_time) for p in schedule.periods.all()}
+        return cls.from_rules(
+            schedule.name, schedule.version, schedule.day_start, schedule.lesson_minutes,
+            schedule.short_break_minutes, schedule.long_break_minutes,
+            schedule.long_break_after, schedule.sessions, overrides,
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def times(self, session):
+        """(start, end) of a session as datetime.time."""
+        if session < 1 or session > len(self.starts):
+            raise ValueError(f"session_index must be between 1 and {len(self.starts)}")
+        return self.starts[session - 1], self.ends[session - 1]
+
+    def label(self, session):
+        """("HH:MM", "HH:MM") of a session."""
+        return self.labels[session - 1]
+
+    def current_session(self, now_time):
+        """Return session index (int) or None if outside lessons."""
+        i = bisect_right(self.starts, now_time)
+        if i and now_time < self.ends[i - 1]:
+            return i
+        return None
+
+    def next_boundary(self, now_time):
+        """The next start or end time after now_time, or None after the last bell."""
+        i = bisect_right(self.bells, now_time)
+        return self.bells[i] if i < len(self.bells) else None
+
+
+DEFAULT_TABLE = SessionTable.from_rules(
+    'default', 0, time(8, 30), lesson_minutes=45, short_break_minutes=5,
+    long_break_minutes=45, long_break_after=4, sessions=8,
+)
+
+_lock = threading.Lock()
+_loads = Flight()
+_tables = {}  # (school id, schedule name or None for the default) -> SessionTable
+_generation = 0  # bumped by invalidate(): a table loaded across it isn't kept
+
+
+def get_table(name=None, school_id=None):
+    """SessionTable for a school's named schedule, or its default one (school: the current one)."""
+    if school_id is None:
+        school_id = current_school_id()
+    table = _tables.get((school_id, name))
+    if table is not None:
+        return table
+    # threads that miss together load it once
+    return _loads.do((school_id, name), partial(_load_table, name, school_id))
+
+
+def _load_table(name, school_id):
+    from .models import BellSchedule
+
+    generation = _generation
+    qs = BellSchedule.objects.filter(school_id=school_id).prefetch_related('periods')
+    with use_replicas(False):
+        schedule = qs.filter(name=name).first() if name else qs.filter(is_default=True).first()
+    if schedule is not None:
+        table = SessionTable.from_schedule(schedule)
+    elif name is None:
+        table = DEFAULT_TABLE
+    else:
+        raise LookupError(f"Unknown bell schedule '{name}'")
+    with _lock:
+        if generation == _generation:
+            _tables[(school_id, name)] = table
+    return table
+
+
+def invalidate(school_id=None):
+    global _generation
+    with _lock:
+        _generation += 1
+        if school_id is None:
+            _tables.clear()
+        else:
+            for key in [k for k in _tables if k[0] == school_id]:
+                del _tables[key]
+
+
+def session_times(session_index, schedule=None, school_id=None):
+    return get_table(schedule, school_id).times(session_index)
+
+
+def get_current_session(now_time, schedule=None, school_id=None):
+    return get_table(schedule, school_id).current_session(now_time)
+
+
+async def aget_table(name=None, school_id=None):
+    """get_table() for async views; only a table that isn't loaded yet costs a thread hop."""
+    table = _tables.get((school_id or current_school_id(), name))
+    if table is None:
+        table = await sync_to_async(get_table)(name, school_id)
+    return table
+
+
+async def aget_current_session(now_time, schedule=None, school_id=None):
+    return (await aget_table(schedule, school_id)).current_session(now_time)
+
+
+def seconds_to_next_bell(now=None, schedule=None, school_id=None, table=None):
+    """
+    Seconds from `now` (aware, default: now) to the next bell, or to midnight after the last one.
+    `table` (e.g. a calendar DayPlan's) is used instead of looking the schedule up.
+    """
+    now = timezone.localtime(now or timezone.now())
+    bell = (table or get_table(schedule, school_id)).next_boundary(now.time())
+    if bell is None:
+        target = datetime.combine(now.date() + timedelta(days=1), time.min, now.tzinfo)
+    else:
+        target = datetime.combine(now.date(), bell, now.tzinfo)
+    return max((target - now).total_seconds(), 0)
@@ -0,0 +1,286 @@
+"""
+Benchmark suite for the hot paths, run against synthetic schools.
+
+Each scale seeds a fresh school (see synthetic.py) in the test database and
+times pupil_now, the simulator, the week grid, the admin changelists,
+TimeEntry.save() and a room allocation of the whole week. It also serves a burst of pupil_now lookups, as at a bell,
+through the WSGI handler from a pool of worker threads and through the ASGI
+handler as concurrent coroutines, to compare the two deployments (in-process,
+so the numbers leave out the HTTP server and the network). A bell surge then
+moves the clock to the start of the next session, where nothing is cached yet,
+and serves the same burst through ASGI twice: cold, and after the warm-up a
+minute before the bell (see warmup.py). Each counts the fragments rendered during
+the surge; the warmed one must render none. Its latency is dominated by serving
+the requests, not rendering, so the two p99s are reported but not compared.
+Results are plain dicts, so they can be written as JSON and compared with an
+earlier run to spot regressions between releases.
+"""
+import asyncio
+import io
+import platform
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
+from urllib.parse import urlencode
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import fragments
+from .models import Class, Pupil, TimeEntry
+from .rooms import allocate
+from .schools import current_school_id
+from .synthetic import MAX_CLASSES, seed_school
+from .warmup import WARM_AHEAD_SECONDS, next_start, warm
+
+# 1x: a typical school; 10x and 100x multiply it (classes capped by Class uniqueness)
+BASE_SIZE = {'classes': 14, 'pupils': 400, 'teachers': 28}
+
+# a Monday during session 2, so pupil_now really looks lessons up
+BENCH_NOW = datetime(2025, 10, 13, 9, 30)
+
+
+def scale_size(scale):
+    return {
+        'classes': min(BASE_SIZE['classes'] * scale, MAX_CLASSES),
+        'pupils': BASE_SIZE['pupils'] * scale,
+        'teachers': BASE_SIZE['teachers'] * scale,
+    }
+
+
+def measure(call, iterations):
+    """Time `call` and count its queries; returns a stats dict in milliseconds."""
+    call()  # warm caches and lazy indexes, as in a running server
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    with CaptureQueriesContext(connection) as queries:
+        call()
+    timings.sort()
+    return {
+        'n': iterations,
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': len(queries),
+    }
+
+
+def _burst_stats(timings, elapsed):
+    timings.sort()
+    return {
+        'n': len(timings),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'max_ms': round(timings[-1], 3),
+        'requests_per_s': round(len(timings) / elapsed, 1),
+    }
+
+
+def _get_environ(path, params):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': urlencode(params),
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+    }
+
+
+def _get_scope(path, params):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': urlencode(params).encode(), 'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+
+
+# Both bursts: every request arrives at once, and its time is from then until
+# it is answered, i.e. what a client at the bell waits, queueing included.
+
+def wsgi_burst(requests, threads):
+    """GET each (path, params) through config.wsgi, served by `threads` worker threads."""
+    from config.wsgi import application
+
+    def get(request):
+        response = application(_get_environ(*request), lambda status, headers: None)
+        b''.join(response)
+        response.close()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        timings = list(pool.map(get, requests))
+    return _burst_stats(timings, time.perf_counter() - start)
+
+
+def asgi_burst(requests):
+    """GET each (path, params) through config.asgi, all in flight at once on one event loop."""
+    from config.asgi import application
+
+    async def burst():
+        disconnect = asyncio.Event()  # never set: clients stay connected
+
+        async def get(request):
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnect.wait()
+
+            async def send(message):
+                pass
+
+            await application(_get_scope(*request), receive, send)
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(get(r) for r in requests))
+        return _burst_stats(list(timings), time.perf_counter() - start)
+
+    return asyncio.run(burst())
+
+
+def bell_surge(requests, now, warm_up):
+    """
+    asgi_burst() of `requests` just after the next session starts (after `now`),
+    with the fragments warmed a minute before the bell or not. Also counts the
+    lookups that shared another one's computation and the fragments rendered.
+    """
+    school_id = current_school_id()
+    bell = next_start(now, school_id)
+    if warm_up:
+        with mock.patch('django.utils.timezone.now', return_value=bell - timedelta(seconds=WARM_AHEAD_SECONDS)):
+            warm(bell, school_id)
+    shared = fragments._lookups.shared
+    with mock.patch('django.utils.timezone.now', return_value=bell + timedelta(seconds=1)), \
+            mock.patch.object(fragments, '_render', wraps=fragments._render) as render:
+        stats = asgi_burst(requests)
+    return {**stats, 'coalesced': fragments._lookups.shared - shared, 'renders': render.call_count}, bell
+
+
+def _save_throughput(iterations, rng):
+    """Delete some entries and save() them back one by one, inside a rolled back transaction."""
+    pks = list(TimeEntry.objects.values_list('pk', flat=True))
+    sample = rng.sample(pks, min(iterations, len(pks)))
+    with transaction.atomic():
+        entries = list(TimeEntry.objects.filter(pk__in=sample))
+        TimeEntry.objects.filter(pk__in=sample).delete()
+        timings = []
+        for e in entries:
+            e.pk = None
+            e.start_time = e.end_time = None
+            start = time.perf_counter()
+            e.save()
+            timings.append((time.perf_counter() - start) * 1000)
+        transaction.set_rollback(True)
+    timings.sort()
+    return {
+        'n': len(timings),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'max_ms': round(timings[-1], 3),
+        'saves_per_s': round(1000 / statistics.fmean(timings), 1),
+    }
+
+
+def run_scale(scale, iterations=50, seed=0, clients=200, threads=8):
+    size = scale_size(scale)
+    rng = random.Random(seed)
+    seeded = seed_school(seed=seed, flush=True, **size)
+
+    admin = get_user_model().objects.filter(username='bench').first()
+    if admin is None:
+        admin = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench')
+    client = Client()
+    client.force_login(admin)
+
+    pupils = list(Pupil.objects.values_list('first_name', 'last_name'))
+    class_ids = list(Class.objects.values_list('pk', flat=True))
+    now = timezone.make_aware(BENCH_NOW)
+
+    def pupil_now():
+        first, last = rng.choice(pupils)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            client.get('/pupil-now/', {'q': f"{first} {last}"})
+
+    def simulator():
+        client.post('/simulator/', {
+            'class_id': rng.choice(class_ids),
+            'day': rng.choice(['mon', 'tue', 'wed', 'thu', 'fri']),
+            'time': f"{rng.randint(8, 14):02d}:{rng.choice(['00', '20', '40'])}",
+        })
+
+    def week_grid():
+        client.get(f'/grid/class/{rng.choice(class_ids)}/')
+
+    results = {
+        'size': {**size, 'entries': seeded.entries},
+        'pupil_now': measure(pupil_now, iterations),
+        'simulator': measure(simulator, iterations),
+        'week_grid': measure(week_grid, iterations),
+        'admin_timeentry_changelist': measure(
+            lambda: client.get('/admin/timetable/timeentry/'), max(iterations // 5, 3)),
+        'admin_pupil_changelist': measure(
+            lambda: client.get('/admin/timetable/pupil/'), max(iterations // 5, 3)),
+        'timeentry_save': _save_throughput(iterations, rng),
+        'room_allocation': measure(lambda: allocate(dry_run=True, replace=True), 3),
+    }
+
+    # a bell: every client looks a pupil up at once
+    burst = [('/pupil-now/', {'q': f"{first} {last}"}) for first, last in (rng.choice(pupils) for _ in range(clients))]
+    with mock.patch('django.utils.timezone.now', return_value=now):
+        results['pupil_now_wsgi_burst'] = wsgi_burst(burst, threads)
+        results['pupil_now_asgi_burst'] = asgi_burst(burst)
+    # the next two bells: a session's fragments are only cached from its first lookup, or its warm-up
+    results['bell_surge_cold'], bell = bell_surge(burst, timezone.localtime(now), warm_up=False)
+    results['bell_surge_warmed'], _ = bell_surge(burst, bell + timedelta(seconds=1), warm_up=True)
+    if results['bell_surge_warmed']['renders'] or not results['bell_surge_cold']['renders']:
+        raise RuntimeError(f"The warm-up did not take the rendering off the bell: "
+                           f"{results['bell_surge_cold']['renders']} fragments rendered cold, "
+                           f"{results['bell_surge_warmed']['renders']} warmed.")
+    return results
+
+
+def run(scales=(1, 10), iterations=50, seed=0, label='', clients=200, threads=8):
+    return {
+        'label': label,
+        'created': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'iterations': iterations,
+        'clients': clients,
+        'threads': threads,
+        'scales': {f"{scale}x": run_scale(scale, iterations, seed, clients, threads) for scale in scales},
+    }
+
+
+def compare(current, previous, threshold=20.0):
+    """Lines describing scenarios whose p50 got more than `threshold` percent slower."""
+    regressions = []
+    for scale, scenarios in current['scales'].items():
+        old_scenarios = previous.get('scales', {}).get(scale, {})
+        for name, stats in scenarios.items():
+            old = old_scenarios.get(name)
+            if name == 'size' or not old or not old.get('p50_ms'):
+                continue
+            change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+            if change > threshold:
+                regressions.append(
+                    f"{scale} {name}: p50 {old['p50_ms']}ms -> {stats['p50_ms']}ms (+{change:.0f}%)")
+            if stats.get('queries', 0) > old.get('queries', 0):
+                regressions.append(f"{scale} {name}: queries {old['queries']} -> {stats['queries']}")
+    return regressions
@@ -0,0 +1,169 @@
+"""
+School-wide "now" snapshot pushed to hallway screens over Server-Sent Events.
+
+One Broadcaster per school and process computes the snapshot (every class's
+running lesson, teacher and group, as the date's calendar plan runs them) and fans the already
+encoded message out to every connected client's asyncio.Queue. Clients never query
+the database themselves.
+
+- At each bell (start/end time from the bell schedule) a full `snapshot` event
+  is sent.
+- When a TimeEntry changes (signals.py calls notify_changed()), the snapshot is
+  recomputed and only the changed lessons are sent as a `diff` event.
+- A client too slow to keep up has its queue replaced with the latest snapshot.
+
+Served by config/asgi.py only. Under WSGI Django would read the endless async
+stream to its end before sending a byte, so the view answers 501 there.
+"""
+import asyncio
+import contextvars
+import json
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from . import bells
+from .calendar import calendar
+from .models import Class
+from .schools import PerSchool, current_school_id
+
+QUEUE_SIZE = 16
+KEEPALIVE_SECONDS = 15
+MAX_SLEEP_SECONDS = 3600
+
+
+def build_snapshot(now=None, school_id=None):
+    school_id = school_id or current_school_id()
+    now = timezone.localtime(now or timezone.now())
+    plan = calendar.of(school_id).plan(now.date())
+    day = plan.day
+    session = plan.table.current_session(now.time()) if day else None
+    lessons = {}
+    if session is not None:
+        # lesson changes and the day's bell times applied (see calendar.py)
+        for school_class in Class.objects.filter(school_id=school_id):
+            for row in plan.lessons(session, school_class.pk):
+                lessons[f"{school_class.pk}:{row['group_code']}"] = {
+                    'class_id': school_class.pk,
+                    'class': str(school_class),
+                    'subject': row['subject'],
+                    'teacher': row['teacher'],
+                    'group': row['group_code'],
+                    'session': session,
+                    'start': row['start'],
+                    'end': row['end'],
+                    'note': row.get('note', ''),
+                }
+    return {
+        'day': day,
+        'session': session,
+        'time': now.strftime("%H:%M:%S"),
+        'lessons': lessons,
+    }
+
+
+def encode(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n".encode()
+
+
+def seconds_to_next_bell(now=None, school_id=None):
+    # wake just after the bell, and at least hourly
+    now = timezone.localtime(now or timezone.now())
+    table = calendar.of(school_id or current_school_id()).plan(now.date()).table
+    return min(bells.seconds_to_next_bell(now, table=table) + 0.05, MAX_SLEEP_SECONDS)
+
+
+class Broadcaster:
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self.loop = None
+        self.clients = set()
+        self.snapshot = None
+        self.snapshot_message = b''
+        self._ticker = None
+        self._started = None
+        self._refresh_pending = False
+
+    async def ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # first client, or a new event loop (tests, server restart)
+            self.loop = loop
+            self.clients = set()
+            self.snapshot = None
+            self._refresh_pending = False
+            self._started = loop.create_task(self._first_snapshot())
+            self._ticker = loop.create_task(self._tick())
+        # every client waits on the same first computation
+        await asyncio.shield(self._started)
+
+    async def _first_snapshot(self):
+        self._set_snapshot(await sync_to_async(build_snapshot)(school_id=self.school_id))
+
+    def _set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.snapshot_message = encode('snapshot', snapshot)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.clients.discard(queue)
+
+    def publish(self, message):
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # the client missed messages; let it resync from a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot_message)
+
+    async def _tick(self):
+        while True:
+            # in a thread: a new day's calendar plan may need queries
+            await asyncio.sleep(await sync_to_async(seconds_to_next_bell)(school_id=self.school_id))
+            self._set_snapshot(await sync_to_async(build_snapshot)(school_id=self.school_id))
+            self.publish(self.snapshot_message)
+
+    async def _refresh(self):
+        self._refresh_pending = False
+        old = self.snapshot or {'lessons': {}}
+        new = await sync_to_async(build_snapshot)(school_id=self.school_id)
+        self._set_snapshot(new)
+        changed = {k: v for k, v in new['lessons'].items() if old['lessons'].get(k) != v}
+        removed = [k for k in old['lessons'] if k not in new['lessons']]
+        if changed or removed:
+            self.publish(encode('diff', {
+                'day': new['day'], 'session': new['session'], 'time': new['time'],
+                'changed': changed, 'removed': removed,
+            }))
+
+    def notify_changed(self):
+        """Thread-safe: schedule a diff after a timetable edit (called from signals)."""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.clients or self._refresh_pending:
+            return
+        self._refresh_pending = True
+        # a fresh context: the caller's may belong to an asgiref sync thread
+        loop.call_soon_threadsafe(lambda: loop.create_task(self._refresh()), context=contextvars.Context())
+
+    async def stream(self):
+        """Async iterator of SSE bytes for one client."""
+        await self.ensure_started()
+        queue = self.subscribe()
+        try:
+            yield self.snapshot_message
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+
+broadcaster = PerSchool(Broadcaster)
@@ -0,0 +1,185 @@
+"""
+Calendar exceptions: the dates that differ from the repeating week.
+
+TimeEntry is one week that repeats. On top of it:
+- CalendarDay: a date that is closed (a holiday), runs on another BellSchedule
+  (a shortened or exam day), or follows another weekday's lessons.
+- LessonChange: one (session, class, group) that is cancelled, taught by
+  another teacher / in another subject or room, or added, either on one date or
+  in every A or B week. Weeks alternate from School.rotation_start.
+
+Calendar loads a school's exceptions once (three queries) into dicts keyed by
+date and by (week, day). Each date is resolved into a DayPlan on first use: its
+effective weekday, bell table and the changes of every slot, dated changes
+winning over weekly ones. The lessons of (date, session, class) are then the
+now index's rows with the slot's changes applied, memoized per plan, so a
+lookup is a few dict gets and no queries. Signals drop the Calendar when an
+exception, a bell schedule or the timetable changes.
+"""
+import threading
+from dataclasses import dataclass, field
+from datetime import date as date_type
+
+from asgiref.sync import sync_to_async
+
+from .bells import DEFAULT_TABLE, get_table
+from .conflicts import group_clash
+from .models import GROUP_CHOICES, WEEKDAY_TO_CODE, CalendarDay, LessonChange, School
+from .now_index import now_index
+from .routers import use_replicas
+from .schools import PerSchool
+
+MAX_PLANS = 400  # resolved dates kept per school; more than a school year
+GROUP_LABELS = dict(GROUP_CHOICES)
+
+
+def rotation_week(day, rotation_start):
+    """'A' or 'B' for a date, counting weeks from rotation_start (a Monday of an A week); '' without one."""
+    if rotation_start is None:
+        return ''
+    return 'AB'[(day - rotation_start).days // 7 % 2]
+
+
+def _changed(row, change):
+    row = dict(row, note=change.note)
+    if change.subject_id:
+        row['subject'] = str(change.subject)
+    if change.teacher_id:
+        row['teacher'] = str(change.teacher)
+    return row
+
+
+def _added(change, start, end):
+    return {
+        'subject': str(change.subject),
+        'teacher': str(change.teacher),
+        'group': GROUP_LABELS[change.group],
+        'group_code': change.group,
+        'start': start,
+        'end': end,
+        'note': change.note,
+    }
+
+
+@dataclass
+class DayPlan:
+    """How one date of a school runs."""
+    school_id: int
+    date: date_type
+    day: str = None      # the weekday whose lessons run; None on closed days and weekends
+    week: str = ''       # 'A', 'B', or '' without a rotation
+    closed: bool = False
+    note: str = ''
+    table: object = DEFAULT_TABLE  # SessionTable of the day
+    custom_times: bool = False     # table is not the school's usual one
+    changes: dict = field(default_factory=dict)  # (session, class id) -> {group: LessonChange}
+    _lessons: dict = field(default_factory=dict, repr=False)
+
+    def differs(self, session, class_id):
+        """Whether the slot's lessons differ from the usual week's."""
+        return self.custom_times or (session, class_id) in self.changes
+
+    def apply(self, session, class_id, rows):
+        """The usual week's formatted rows of a slot (ordered by group) as they run on this date."""
+        changes = self.changes.get((session, class_id))
+        if changes:
+            groups = {r['group_code'] for r in rows}
+            result = [_changed(r, changes[r['group_code']]) if r['group_code'] in changes else r
+                      for r in rows if not getattr(changes.get(r['group_code']), 'cancelled', False)]
+            # an added lesson has no row of its own: the date's bell times
+            start, end = self.table.label(session) if session <= len(self.table) else ('', '')
+            running = {r['group_code'] for r in result}
+            for c in sorted(changes.values(), key=lambda c: c.pk):  # the earlier change wins a clash
+                if c.group in groups or c.cancelled or not (c.subject_id and c.teacher_id):
+                    continue
+                if group_clash(c.group, running) is None:  # 'all' and group lessons never share a slot
+                    result.append(_added(c, start, end))
+                    running.add(c.group)
+            rows = sorted(result, key=lambda r: r['group_code'])
+        if self.custom_times and rows and session <= len(self.table):
+            start, end = self.table.label(session)
+            rows = [dict(r, start=start, end=end) for r in rows]
+        return tuple(rows)
+
+    def lessons(self, session, class_id):
+        """The lessons of a class in a session on this date; no queries once the now index is built."""
+        if self.day is None:
+            return ()
+        key = (session, class_id)
+        rows = self._lessons.get(key)
+        if rows is None:
+            base = now_index.of(self.school_id).lessons(self.day, session, class_id)
+            rows = self._lessons[key] = self.apply(session, class_id, base) if self.differs(*key) else base
+        return rows
+
+
+class Calendar:
+    """Process-wide per-date overlay of one school's calendar exceptions."""
+
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self._lock = threading.RLock()
+        self._loaded = None  # (days, dated changes, weekly changes, rotation start)
+        self._plans = {}     # date -> DayPlan
+
+    @use_replicas(False)
+    def _load(self):
+        days = {d.date: d for d in CalendarDay.objects.filter(school_id=self.school_id).select_related('schedule')}
+        dated, weekly = {}, {}
+        changes = LessonChange.objects.filter(school_id=self.school_id).select_related('subject', 'teacher')
+        for c in changes:
+            by_slot = dated.setdefault(c.date, {}) if c.date else weekly.setdefault((c.week, c.day), {})
+            by_slot.setdefault((c.session, c.school_class_id), {})[c.group] = c
+        rotation_start = School.objects.filter(pk=self.school_id).values_list('rotation_start', flat=True).first()
+        return days, dated, weekly, rotation_start
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = None
+            self._plans = {}
+
+    def _resolve(self, day):
+        if self._loaded is None:
+            self._loaded = self._load()
+        days, dated, weekly, rotation_start = self._loaded
+        plan = DayPlan(self.school_id, day, week=rotation_week(day, rotation_start))
+        usual = get_table(school_id=self.school_id)
+        plan.table = usual
+        special = days.get(day)
+        code = WEEKDAY_TO_CODE.get(day.weekday())
+        if special is not None:
+            plan.note = special.note
+            plan.closed = special.closed
+            code = None if special.closed else (special.follows or code)
+            if special.schedule_id:
+                plan.table = get_table(special.schedule.name, self.school_id)
+                plan.custom_times = plan.table is not usual
+        plan.day = code
+        if code is not None:
+            plan.changes = {key: dict(groups) for key, groups in weekly.get((plan.week, code), {}).items()}
+            for key, groups in dated.get(day, {}).items():
+                plan.changes.setdefault(key, {}).update(groups)
+        return plan
+
+    def plan(self, day):
+        """The DayPlan of a date; resolved on first use, then a dict lookup."""
+        plan = self._plans.get(day)
+        if plan is None:
+            with self._lock:
+                plan = self._plans.get(day)
+                if plan is None:
+                    plan = self._resolve(day)
+                    if len(self._plans) >= MAX_PLANS:
+                        self._plans = {}
+                    self._plans[day] = plan
+        return plan
+
+    async def aplan(self, day):
+        """plan() for async views: only a date not resolved yet costs a thread hop."""
+        plan = self._plans.get(day)
+        if plan is None:
+            plan = await sync_to_async(self.plan)(day)
+        return plan
+
+
+calendar = PerSchool(Calendar)
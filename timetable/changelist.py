@@ -0,0 +1,188 @@
+"""
+Admin changelist helpers for large timetables.
+
+- EstimatedCountPaginator: the unfiltered row count comes from the database
+  statistics (pg_class on PostgreSQL, sqlite_stat1 after ANALYZE on SQLite)
+  instead of a COUNT(*) over the whole table. Filtered lists are still counted.
+- KeysetPaginator: remembers the sort key of the last row of every page it
+  served, so "next page" is an index seek (WHERE key > last) instead of an
+  OFFSET that reads and throws away every earlier row. Pages reached by
+  jumping fall back to OFFSET. Signals forget the keys on any timetable change,
+  as an insert or delete shifts every later page.
+- CachedRelatedFilter: teacher/subject/class filter choices from the cached
+  TeacherBooks (substitutes.py) of the filtered school, or of every school the
+  list shows, instead of a query per related table and page load.
+- PaginatedInlineFormSet: shows one page of an inline at a time.
+"""
+import threading
+from collections import OrderedDict
+
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
+
+from .models import Class, School, Subject, Teacher
+from .substitutes import teacher_book
+
+# tables smaller than this are simply counted
+ESTIMATE_ABOVE = 10000
+KEYSET_CACHE_SIZE = 512
+
+
+def estimated_count(model, using='default'):
+    """Row count from the planner statistics, or None when there are none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # stat is "<rows> <rows per distinct prefix> ..."
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    try:
+        estimate = int(str(row[0]).split()[0])
+    except (ValueError, IndexError):
+        return None
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_count(qs.model, qs.db)
+            if estimate is not None and estimate > ESTIMATE_ABOVE:
+                return estimate
+        return super().count
+
+
+class _Boundaries:
+    """LRU of (query, page number) -> sort key of that page's last row, shared by all requests."""
+
+    def __init__(self, size=KEYSET_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._keys.get(key)
+            if value is not None:
+                self._keys.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._keys[key] = value
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.size:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+boundaries = _Boundaries()
+
+
+def after(fields, values):
+    """Q for rows sorting strictly after `values` in ascending `fields` order."""
+    q = Q(pk__in=[])
+    for i, name in enumerate(fields):
+        q |= Q(**dict(zip(fields[:i], values[:i])), **{f'{name}__gt': values[i]})
+    # the redundant range on the leading column lets the index seek instead of scan
+    return Q(**{f'{fields[0]}__gte': values[0]}) & q
+
+
+class KeysetPaginator(EstimatedCountPaginator):
+    # ascending, non-null columns forming a unique key; set by the admin
+    keyset = ()
+
+    def _keyset_usable(self):
+        # the changelist may repeat the admin ordering; repeats don't change the sort
+        order_by = tuple(dict.fromkeys(self.object_list.query.order_by))
+        return bool(self.keyset) and order_by == tuple(self.keyset)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self._keyset_usable():
+            return super().page(number)
+        token = str(self.object_list.query)
+        previous = boundaries.get((token, number - 1)) if number > 1 else None
+        if number == 1:
+            rows = list(self.object_list[:self.per_page])
+        elif previous is not None:
+            rows = list(self.object_list.filter(after(self.keyset, previous))[:self.per_page])
+        else:
+            bottom = (number - 1) * self.per_page
+            rows = list(self.object_list[bottom:bottom + self.per_page])
+        if rows:
+            boundaries.set((token, number), tuple(getattr(rows[-1], name) for name in self.keyset))
+        return self._get_page(rows, number, self)
+
+
+def _class_order(choice):
+    # "10A" < "5A" as text; a shorter name is a lower grade
+    return len(choice[1]), choice[1]
+
+
+def _name_order(choice):
+    return choice[1].casefold()
+
+
+class CachedRelatedFilter(admin.RelatedFieldListFilter):
+    """Filter choices for Class/Subject/Teacher from the cached TeacherBooks."""
+
+    def field_choices(self, field, request, model_admin):
+        attr = {Class: 'class_names', Subject: 'subject_names', Teacher: 'names'}.get(field.related_model)
+        if attr is None:
+            return super().field_choices(field, request, model_admin)
+        schools = dict(School.objects.values_list('pk', 'name'))
+        try:
+            school_ids = [int(request.GET['school__id__exact'])]
+        except (KeyError, ValueError):
+            # unfiltered, the list shows every school's rows
+            school_ids = sorted(schools, key=lambda pk: schools[pk])
+        key = _class_order if field.related_model is Class else _name_order
+        choices = []
+        for school_id in school_ids:
+            names = sorted(getattr(teacher_book.of(school_id).get(), attr).items(), key=key)
+            if len(school_ids) > 1:
+                # the same name can be in several schools
+                names = [(pk, f"{name} ({schools[school_id]})") for pk, name in names]
+            choices += names
+        return choices
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Edit one page of related objects; the page comes from the admin (see get_formset)."""
+    per_page = 50
+    page = 1
+
+    def get_queryset(self):
+        if not hasattr(self, '_paged_queryset'):
+            qs = super().get_queryset()
+            self.total = qs.count()
+            self.pages = max((self.total - 1) // self.per_page + 1, 1)
+            self.page = min(max(self.page, 1), self.pages)
+            start = (self.page - 1) * self.per_page
+            self._paged_queryset = qs[start:start + self.per_page]
+        return self._paged_queryset
+
+    @property
+    def page_range(self):
+        self.get_queryset()
+        return range(1, self.pages + 1)
@@ -0,0 +1,237 @@
+"""
+Atomic multi-entry timetable edits.
+
+A changeset is a list of operations (plain dicts, like import rows):
+
+    {"op": "move", "entry": 12, "day": "tue", "session": 3}   # also "teacher", "group"
+    {"op": "swap", "entries": [12, 31]}                       # exchange their slots
+    {"op": "delete", "entry": 40}
+
+The operations are applied in order to in-memory copies of the entries, and
+only the final state is validated (conflicts.check_many), so a swap or a
+rotation never trips over its own intermediate states. If it is valid, it is
+written in one transaction: one DELETE, one bulk UPDATE, plus one more UPDATE
+that first parks entries whose target slot is still held by another moved
+entry (the unique constraint is checked row by row).
+"""
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.db import transaction
+
+from .bells import get_table
+from .conflicts import Occupancy, lock_for
+from .models import DAY_CHOICES, GROUP_CHOICES, SESSION_CHOICES, Teacher, TimeEntry
+from .schools import current_school_id
+from .signals import timetable_changed
+
+DAYS = {code for code, _ in DAY_CHOICES}
+GROUPS = {code for code, _ in GROUP_CHOICES}
+SESSIONS = {i for i, _ in SESSION_CHOICES}
+
+SLOT_FIELDS = ('day', 'session', 'start_time', 'end_time')
+STATE_FIELDS = ('day', 'session', 'school_class_id', 'group', 'teacher_id', 'start_time', 'end_time')
+# parked entries get session PARK_SESSION + n, which no real lesson uses
+PARK_SESSION = 1000
+
+
+class ChangesetError(Exception):
+    pass
+
+
+@dataclass
+class ChangesetReport:
+    updated: int = 0
+    deleted: int = 0
+    errors: list = field(default_factory=list)  # [(operation number, message), ...]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _pk(value):
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        return int(value)
+    except (TypeError, ValueError):
+        raise ChangesetError(f"Invalid entry id '{value}'.")
+
+
+def _entry_ids(op):
+    kind = op.get('op')
+    if kind == 'swap':
+        pks = op.get('entries')
+        if not isinstance(pks, list) or len(pks) != 2:
+            raise ChangesetError("swap needs a list of exactly two entries.")
+        pks = [_pk(pk) for pk in pks]
+        if pks[0] == pks[1]:
+            raise ChangesetError("swap needs two different entries.")
+        return pks
+    if kind in ('move', 'delete'):
+        return [_pk(op.get('entry'))]
+    raise ChangesetError(f"Unknown operation '{kind}', expected move, swap or delete.")
+
+
+def _new_teachers(operations):
+    """Unsaved entries standing for the teachers that moves assign, for lock_for()."""
+    teachers = []
+    for op in operations:
+        if op.get('op') == 'move' and 'teacher' in op:
+            try:
+                teachers.append(TimeEntry(teacher_id=_pk(op['teacher'])))
+            except ChangesetError:
+                pass  # reported by _move()
+    return teachers
+
+
+def _move(entry, op, teacher_ids):
+    day = str(op.get('day', entry.day)).strip().lower()
+    if day not in DAYS:
+        raise ChangesetError(f"Invalid day '{op.get('day')}'.")
+    try:
+        session = int(op.get('session', entry.session))
+    except (TypeError, ValueError):
+        session = None
+    if session not in SESSIONS:
+        raise ChangesetError(f"Invalid session '{op.get('session')}', expected 1..8.")
+    group = str(op.get('group', entry.group)).strip().lower()
+    if group not in GROUPS:
+        raise ChangesetError(f"Invalid group '{op.get('group')}'.")
+    if 'teacher' in op:
+        teacher_id = _pk(op['teacher'])
+        if teacher_id not in teacher_ids:
+            raise ChangesetError(f"Unknown teacher '{op['teacher']}'.")
+        entry.teacher_id = teacher_id
+    sessions = len(get_table(school_id=entry.school_id))
+    if session > sessions:
+        raise ChangesetError(f"Invalid session '{session}', the bell schedule has only {sessions} sessions.")
+    if session != entry.session:
+        # stored times belong to the old session; without them the new one's bells apply
+        entry.start_time = entry.end_time = None
+    entry.day, entry.session, entry.group = day, session, group
+
+
+def _state(entry):
+    return tuple(getattr(entry, name) for name in STATE_FIELDS)
+
+
+def _key(state):
+    # the unique constraint: day, session, class, group
+    return state[:4]
+
+
+def _swap(a, b):
+    for name in SLOT_FIELDS:
+        va, vb = getattr(a, name), getattr(b, name)
+        setattr(a, name, vb)
+        setattr(b, name, va)
+
+
+def apply_changeset(operations, dry_run=False, school_id=None):
+    """
+    Validate a changeset as a whole and apply it in one transaction.
+
+    Only entries of `school_id` (default: the current school) can be changed.
+    Nothing is written if any operation is malformed or the final timetable
+    breaks a rule. Returns a ChangesetReport with 1-based operation numbers.
+    """
+    school_id = school_id or current_school_id()
+    report = ChangesetReport()
+    operations = list(operations)
+
+    with transaction.atomic():
+        wanted = {}
+        for n, op in enumerate(operations, start=1):
+            try:
+                for pk in _entry_ids(op):
+                    wanted.setdefault(pk, n)
+            except ChangesetError as exc:
+                report.errors.append((n, str(exc)))
+        if report.errors:
+            return report
+
+        # locks in TimeEntry.save's order: classes and teachers first, then the rows
+        current = TimeEntry.objects.filter(school_id=school_id).in_bulk(list(wanted))
+        lock_for(list(current.values()) + _new_teachers(operations))
+        entries = TimeEntry.objects.select_for_update().filter(school_id=school_id).in_bulk(list(wanted))
+        for pk, n in wanted.items():
+            if pk not in entries:
+                report.errors.append((n, f"No timetable entry with id {pk}."))
+        if report.errors:
+            report.errors.sort()
+            return report
+
+        originals = {pk: _state(e) for pk, e in entries.items()}
+        teacher_ids = None
+        deleted = set()
+        last_op = {}
+        for n, op in enumerate(operations, start=1):
+            pks = _entry_ids(op)
+            gone = [pk for pk in pks if pk in deleted]
+            if gone:
+                report.errors.append((n, f"Entry {gone[0]} is deleted earlier in this changeset."))
+                continue
+            try:
+                if op['op'] == 'delete':
+                    deleted.add(pks[0])
+                elif op['op'] == 'swap':
+                    _swap(entries[pks[0]], entries[pks[1]])
+                else:
+                    if 'teacher' in op and teacher_ids is None:
+                        teacher_ids = set(Teacher.objects.filter(school_id=school_id).values_list('pk', flat=True))
+                    _move(entries[pks[0]], op, teacher_ids)
+            except ChangesetError as exc:
+                report.errors.append((n, str(exc)))
+            for pk in pks:
+                last_op[pk] = n
+        if report.errors:
+            return report
+
+        changed = [e for pk, e in entries.items() if pk not in deleted and _state(e) != originals[pk]]
+
+        # already held, unless an entry changed between the two reads above
+        before = [TimeEntry(school_class_id=o[2], teacher_id=o[4]) for o in originals.values()]
+        lock_for(before + changed)
+        occupancy = Occupancy.load(school_id, days={o[0] for o in originals.values()} | {e.day for e in changed})
+        for pk in deleted:
+            occupancy.remove(pk)
+        for i, problems in occupancy.check_many(changed).items():
+            n = last_op[changed[i].pk]
+            report.errors.append((n, f"{changed[i]}: " + ' '.join(message for _, message in problems)))
+        report.errors.sort()
+
+        if dry_run or report.errors:
+            return report
+
+        if deleted:
+            report.deleted = TimeEntry.objects.filter(pk__in=deleted).delete()[1].get(TimeEntry._meta.label, 0)
+        if changed:
+            _write(changed, originals)
+            report.updated = len(changed)
+            # bulk_update skips post_save, so the caches have to be told directly
+            transaction.on_commit(partial(timetable_changed, school_id))
+
+    return report
+
+
+def _write(changed, originals):
+    """Bulk UPDATE the changed entries, parking first those whose current slot another one takes."""
+    targets = {_key(_state(e)) for e in changed}
+    parked = [e for e in changed if _key(originals[e.pk]) in targets and _key(_state(e)) != _key(originals[e.pk])]
+    fields = {
+        name.removesuffix('_id')
+        for e in changed
+        for name, new, old in zip(STATE_FIELDS, _state(e), originals[e.pk])
+        if new != old
+    }
+    if parked:
+        final = {e.pk: e.session for e in parked}
+        for i, e in enumerate(parked):
+            e.session = PARK_SESSION + i
+        TimeEntry.objects.bulk_update(parked, ['session'])
+        for e in parked:
+            e.session = final[e.pk]
+        fields.add('session')
+    TimeEntry.objects.bulk_update(changed, sorted(fields))
@@ -0,0 +1,179 @@
+"""
+Timetable conflict checking on occupancy bitmaps.
+
+Occupancy holds one week mask (see slots.py) per teacher, per room and per
+(class, group) of one school, loaded with a single query. Checking an entry is a few bit
+tests, and every violated rule is reported, not just the first:
+
+- a teacher can't be in two lessons at the same time
+- a room can't hold two lessons at the same time
+- if a class has 'all' at a slot, nothing else can be there
+- 'all' can't be added when a group lesson exists
+- at most two group lessons ('1' and '2') per class and slot, no duplicates
+
+check_many() validates the final state of several changed entries together
+(e.g. swapping two lessons), so intermediate states don't matter.
+"""
+from collections import namedtuple
+
+from django.core.exceptions import NON_FIELD_ERRORS
+
+from .models import GROUP_CHOICES, Class, Room, Teacher, TimeEntry
+from .slots import DAYS, slot_bit
+
+GROUP_LABELS = dict(GROUP_CHOICES)
+
+TEACHER_BUSY = "This teacher is already scheduled for another lesson at this time."
+ROOM_BUSY = "This room is already taken by another lesson at this time."
+ALL_EXISTS = "This class already has 'all' scheduled at this session; no other groups allowed."
+SPLIT_EXISTS = "Cannot schedule 'all' for this class/session because group split already exists."
+TWO_GROUPS = "This class already has 2 group lessons at this session."
+GROUP_EXISTS = "Group '{}' for this class is already scheduled at this session."
+
+Slot = namedtuple('Slot', 'bit class_id group teacher_id room_id', defaults=(None,))
+
+
+def group_clash(group, groups):
+    """The message if a lesson for `group` can't join a class's slot already holding `groups`, else None."""
+    if 'all' in groups:
+        return ALL_EXISTS
+    if group == 'all' and groups:
+        return SPLIT_EXISTS
+    return None
+
+
+def slot_of(entry):
+    return Slot(slot_bit(entry.day, entry.session), entry.school_class_id, entry.group, entry.teacher_id,
+                entry.room_id)
+
+
+class Occupancy:
+    def __init__(self):
+        self.teachers = {}  # teacher_id -> mask
+        self.rooms = {}     # room_id -> mask
+        self.groups = {}    # (class_id, group) -> mask
+        self.entries = {}   # pk -> Slot
+        self.at_bit = {}    # bit -> set of pks, to undo a removal exactly
+
+    @classmethod
+    def load(cls, school_id, days=None, day=None, session=None, exclude=()):
+        """Occupancy of a school's stored timetable, optionally limited to some days or one slot."""
+        occupancy = cls()
+        qs = TimeEntry.objects.filter(school_id=school_id)
+        if day is not None:
+            qs = qs.filter(day=day)
+        if session is not None:
+            qs = qs.filter(session=session)
+        if days is not None:
+            qs = qs.filter(day__in=days)
+        if exclude:
+            qs = qs.exclude(pk__in=exclude)
+        rows = qs.values_list('pk', 'day', 'session', 'school_class_id', 'group', 'teacher_id', 'room_id')
+        for pk, d, s, class_id, group, teacher_id, room_id in rows:
+            if d in DAYS:
+                occupancy.add(Slot(slot_bit(d, s), class_id, group, teacher_id, room_id), pk)
+        return occupancy
+
+    def add(self, slot, pk=None):
+        b = 1 << slot.bit
+        self.teachers[slot.teacher_id] = self.teachers.get(slot.teacher_id, 0) | b
+        if slot.room_id is not None:
+            self.rooms[slot.room_id] = self.rooms.get(slot.room_id, 0) | b
+        key = (slot.class_id, slot.group)
+        self.groups[key] = self.groups.get(key, 0) | b
+        if pk is not None:
+            self.entries[pk] = slot
+            self.at_bit.setdefault(slot.bit, set()).add(pk)
+
+    def remove(self, pk):
+        slot = self.entries.pop(pk, None)
+        if slot is None:
+            return
+        others = self.at_bit.get(slot.bit, set())
+        others.discard(pk)
+        b = 1 << slot.bit
+        # clear the bits, then put back whatever another entry still holds
+        self.teachers[slot.teacher_id] = self.teachers.get(slot.teacher_id, 0) & ~b
+        if slot.room_id is not None:
+            self.rooms[slot.room_id] = self.rooms.get(slot.room_id, 0) & ~b
+        key = (slot.class_id, slot.group)
+        self.groups[key] = self.groups.get(key, 0) & ~b
+        for other in others:
+            o = self.entries[other]
+            if o.teacher_id == slot.teacher_id:
+                self.teachers[o.teacher_id] |= b
+            if slot.room_id is not None and o.room_id == slot.room_id:
+                self.rooms[o.room_id] |= b
+            if (o.class_id, o.group) == key:
+                self.groups[key] |= b
+
+    def _has(self, class_id, group, bit):
+        return (self.groups.get((class_id, group), 0) >> bit) & 1
+
+    def violations(self, slot):
+        """[(field, message), ...] for placing `slot` into the current occupancy."""
+        found = []
+        bit = slot.bit
+        if slot.teacher_id is not None and (self.teachers.get(slot.teacher_id, 0) >> bit) & 1:
+            found.append(('teacher', TEACHER_BUSY))
+        if slot.room_id is not None and (self.rooms.get(slot.room_id, 0) >> bit) & 1:
+            found.append(('room', ROOM_BUSY))
+        has_all = self._has(slot.class_id, 'all', bit)
+        split = [g for g in ('1', '2') if self._has(slot.class_id, g, bit)]
+        if has_all:
+            found.append((NON_FIELD_ERRORS, ALL_EXISTS))
+        if slot.group == 'all' and split:
+            found.append((NON_FIELD_ERRORS, SPLIT_EXISTS))
+        if len(split) >= 2:
+            found.append((NON_FIELD_ERRORS, TWO_GROUPS))
+        if slot.group != 'all' and slot.group in split:
+            found.append((NON_FIELD_ERRORS, GROUP_EXISTS.format(GROUP_LABELS.get(slot.group, slot.group))))
+        return found
+
+    def errors(self, entry):
+        """Violations of one entry as a ValidationError-ready dict (empty if fine)."""
+        errors = {}
+        for field, message in self.violations(slot_of(entry)):
+            errors.setdefault(field, []).append(message)
+        return errors
+
+    def check_many(self, entries):
+        """
+        Validate entries as one change: their stored versions are taken out first,
+        then each is placed in turn. Returns {index: [(field, message), ...]} for the bad ones.
+        """
+        for entry in entries:
+            if entry.pk:
+                self.remove(entry.pk)
+        problems = {}
+        for i, entry in enumerate(entries):
+            slot = slot_of(entry)
+            found = self.violations(slot)
+            if found:
+                problems[i] = found
+            self.add(slot, entry.pk)
+        return problems
+
+
+def check_many(entries):
+    """Validate a set of new/changed entries of one school against its stored timetable, with one query."""
+    entries = list(entries)
+    if not entries:
+        return {}
+    occupancy = Occupancy.load(entries[0].school_id, days={e.day for e in entries})
+    return occupancy.check_many(entries)
+
+
+def lock_for(entries):
+    """
+    Lock the classes, teachers and rooms involved, in a fixed order, for the rest of the
+    transaction, so concurrent edits of the same slots are serialized. SQLite has
+    no row locks (select_for_update is a no-op) but only allows one writer anyway.
+    """
+    class_ids = sorted({e.school_class_id for e in entries if e.school_class_id})
+    teacher_ids = sorted({e.teacher_id for e in entries if e.teacher_id})
+    room_ids = sorted({e.room_id for e in entries if e.room_id})
+    list(Class.objects.select_for_update().filter(pk__in=class_ids).order_by('pk').values_list('pk', flat=True))
+    list(Teacher.objects.select_for_update().filter(pk__in=teacher_ids).order_by('pk').values_list('pk', flat=True))
+    if room_ids:
+        list(Room.objects.select_for_update().filter(pk__in=room_ids).order_by('pk').values_list('pk', flat=True))
@@ -0,0 +1,167 @@
+"""
+Cached rendered lesson fragments.
+
+The lesson rows shown for a pupil only depend on (class, group, day, session)
+and the timetable, so they are rendered once and kept in the Django cache
+(settings.CACHES: local memory by default, a file or Redis-compatible cache
+in production). Keys carry the school and its timetable version, which every
+TimeEntry, reference, bell schedule or calendar change bumps (see signals.py), and
+entries expire at the next bell, when the running session changes anyway.
+A slot that runs differently on a date (see calendar.py) is keyed on the date too.
+
+The versions live in the cache itself, so with a shared backend all
+processes agree on them. Each process also remembers the version its own
+in-process caches (now index, calendar, grids, ...) are current with: reading
+another one means a different process changed the timetable, so they are
+dropped (signals.drop_local_caches) before anything is rendered from them.
+SchoolMiddleware reads the version at most every VERSION_CHECK_SECONDS for the
+views that don't read it anyway. The default local-memory cache is per
+process, so running several processes needs a shared cache.
+
+At a bell most lookups want the same fragments at once. Concurrent lookups of
+the same slots share one computation (see singleflight.py), and warmup.py
+renders the coming session's fragments a minute before it starts.
+"""
+import time
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .bells import seconds_to_next_bell
+from .locate import lessons_for
+from .now_index import now_index
+from .schools import current_school_id
+from .singleflight import AsyncFlight, Flight
+
+VERSION_KEY = 'timetable:{}:version'
+LESSON_TEMPLATE = 'timetable/lesson_cells.html'
+SIMULATOR_TIMEOUT = 3600
+VERSION_CHECK_SECONDS = 1
+
+_renders = Flight()       # fragment key -> rendering in progress, across threads
+_lookups = AsyncFlight()  # (school, date, session, slots) -> lookup in progress, across coroutines
+_seen = {}  # school id -> (version this process's caches are current with, time.monotonic() it was read)
+
+
+def _saw(school_id, version, expected):
+    seen = _seen.get(school_id)
+    if seen is not None and version < seen[0]:
+        return  # read before another thread's newer one
+    if expected is not None and version != expected:
+        from .signals import drop_local_caches  # signals imports this module
+
+        drop_local_caches(school_id)
+    _seen[school_id] = (version, time.monotonic())
+
+
+def timetable_version(school_id=None):
+    school_id = school_id or current_school_id()
+    key = VERSION_KEY.format(school_id)
+    version = cache.get(key)
+    if version is None:
+        # start from the clock, so a version lost to eviction or a restart
+        # can't come back to a number old fragments are stored under
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    _saw(school_id, version, _seen.get(school_id, (None,))[0])
+    return version
+
+
+def bump_version(school_id):
+    seen = _seen.get(school_id, (None,))[0]
+    try:
+        version = cache.incr(VERSION_KEY.format(school_id))
+    except ValueError:
+        timetable_version(school_id)
+        return
+    # one more than this process saw, unless another process bumped it too
+    _saw(school_id, version, None if seen is None else seen + 1)
+
+
+def check_version(school_id):
+    """Read a school's version if it wasn't for VERSION_CHECK_SECONDS, dropping stale in-process caches."""
+    if time.monotonic() - _seen.get(school_id, (None, 0))[1] >= VERSION_CHECK_SECONDS:
+        timetable_version(school_id)
+
+
+async def acheck_version(school_id):
+    """check_version() for async code: a thread hop only when the version is due to be read."""
+    if time.monotonic() - _seen.get(school_id, (None, 0))[1] >= VERSION_CHECK_SECONDS:
+        await sync_to_async(timetable_version)(school_id)
+
+
+def _lesson_key(school_id, version, day, session, class_id, group, date=None):
+    return (f'timetable:{school_id}:lessons:{version}:{date or "-"}:{day}:{session}:'
+            f'{class_id}:{group or "-"}')
+
+
+def _render(index, plan, day, session, class_id, group):
+    slot = plan.lessons(session, class_id) if plan is not None else index.lessons(day, session, class_id)
+    return [render_to_string(LESSON_TEMPLATE, {'e': e}) for e in lessons_for(slot, group)]
+
+
+def slot_rows(day, session, slots, now=None, school_id=None, plan=None, timeout=None):
+    """
+    Rendered table cells for the running lesson(s) of (class id, group) slots of a
+    school, as {slot: [cells of one <tr>, ...]}. One cache round trip for all of
+    them; a missing fragment is rendered once however many threads want it at once,
+    and kept for `timeout` seconds (default: until the bell after `now`).
+    With a calendar DayPlan, `day` is ignored and the date's lessons are shown.
+    """
+    school_id = school_id or current_school_id()
+    version = timetable_version(school_id)
+    if plan is not None:
+        day = plan.day
+    keys = {}
+    for class_id, group in slots:
+        date = plan.date if plan is not None and plan.differs(session, class_id) else None
+        keys[(class_id, group)] = _lesson_key(school_id, version, day, session, class_id, group, date)
+    found = cache.get_many(set(keys.values()))
+    missing = {}
+    index = now_index.of(school_id)
+    for (class_id, group), key in keys.items():
+        if key not in found and key not in missing:
+            missing[key] = _renders.do(key, partial(_render, index, plan, day, session, class_id, group))
+    if missing:
+        if timeout is None:
+            table = plan.table if plan is not None else None
+            timeout = seconds_to_next_bell(now, school_id=school_id, table=table)
+        cache.set_many(missing, timeout=max(timeout, 1))
+        found.update(missing)
+    return {slot: [mark_safe(cells) for cells in found[key]] for slot, key in keys.items()}
+
+
+def _slots(pupils):
+    return tuple(sorted({(p['class_id'], p['group']) for p in pupils}, key=str))  # group may be None
+
+
+def lesson_rows(day, session, pupils, now=None, school_id=None, plan=None):
+    """slot_rows() per pupil of a school: {pupil id: [cells of one <tr>, ...]}."""
+    rows = slot_rows(day, session, _slots(pupils), now, school_id, plan)
+    return {p['id']: rows[(p['class_id'], p['group'])] for p in pupils}
+
+
+async def alesson_rows(day, session, pupils, now=None, school_id=None, plan=None):
+    """
+    lesson_rows() for async views: the cache round trip (and any rendering) in one
+    thread hop, shared by every concurrent lookup of the same slots, as at a bell.
+    """
+    school_id = school_id or current_school_id()
+    slots = _slots(pupils)
+    key = (school_id, plan.date if plan is not None else day, session, slots)
+    rows = await _lookups.do(key, partial(sync_to_async(slot_rows), day, session, slots, now, school_id, plan))
+    return {p['id']: rows[(p['class_id'], p['group'])] for p in pupils}
+
+
+def simulator_results(selected_class, day, at, render):
+    """Rendered simulator results for (class, day, time), rendering with `render()` on a miss."""
+    school_id = selected_class.school_id
+    key = f'timetable:{school_id}:simulator:{timetable_version(school_id)}:{selected_class.pk}:{day}:{at:%H%M}'
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, timeout=SIMULATOR_TIMEOUT)
+    return mark_safe(html)
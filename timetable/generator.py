@@ -0,0 +1,304 @@
+"""
+Automatic timetable generator.
+
+The solver works on plain integers, never on ORM objects. Every week slot is a
+bit (day_index * 8 + session - 1, so 40 bits), and each teacher and class keeps
+its occupancy as one int. A lesson fits a slot when the bit is clear in the
+class mask and in every teacher mask involved. Only the sessions the school's
+bell schedule has are used.
+
+Placement is greedy with the most-constrained lesson first (fewest free slots
+left compared to hours still needed). When a lesson has no free slot, one repair
+step tries to move a lesson of the same class out of the way. If that fails too,
+the attempt restarts with a different random tie-break until the time budget runs out,
+and the best attempt wins.
+
+A spec looks like:
+
+    {
+      "classes": {
+        "5A": {"math": 5, "english": {"hours": 2, "split": true}},
+        ...
+      },
+      "qualifications": {"Alice Johnson": ["math", "physics"], ...}
+    }
+
+A split lesson is taught to groups '1' and '2' at the same time by two teachers.
+"qualifications" is optional; when it is missing, Teacher.subjects is used.
+"""
+import random
+import time as _time
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .bells import get_table
+from .importer import References, import_entries
+from .models import Teacher, TimeEntry
+from .schools import current_school_id
+from .slots import DAY_MASKS, SESSIONS_PER_DAY, bit_slot, bits, sessions_mask, slot_bit
+
+
+@dataclass
+class Requirement:
+    class_id: int
+    subject_id: int
+    hours: int
+    split: bool = False
+
+
+@dataclass
+class Problem:
+    requirements: list
+    qualified: dict                                   # subject_id -> [teacher_id, ...]
+    teacher_busy: dict = field(default_factory=dict)  # teacher_id -> mask taken by other classes
+    class_busy: dict = field(default_factory=dict)    # class_id -> mask taken already
+    sessions: int = SESSIONS_PER_DAY                  # lessons a day, from the school's bell schedule
+
+
+@dataclass
+class Solution:
+    entries: list = field(default_factory=list)  # (day, session, class_id, subject_id, teacher_id, group)
+    unplaced: list = field(default_factory=list)  # (class_id, subject_id, hours missing)
+    attempts: int = 0
+
+    @property
+    def complete(self):
+        return not self.unplaced
+
+
+class _Lesson:
+    __slots__ = ('class_id', 'subject_id', 'teachers', 'left', 'slots', 'days')
+
+    def __init__(self, req, teachers):
+        self.class_id = req.class_id
+        self.subject_id = req.subject_id
+        self.teachers = teachers
+        self.left = req.hours
+        self.slots = []
+        self.days = 0  # bit per day the subject already has a lesson
+
+
+class _Attempt:
+    def __init__(self, problem, rng):
+        self.rng = rng
+        self.usable = sessions_mask(min(problem.sessions, SESSIONS_PER_DAY))
+        self.teacher_mask = dict(problem.teacher_busy)
+        self.class_mask = dict(problem.class_busy)
+        self.owner = {}  # (class_id, bit) -> _Lesson
+        self.lessons = []
+        self.failed = []
+        self._assign_teachers(problem)
+
+    def _assign_teachers(self, problem):
+        # scarce subjects pick teachers first; load is balanced by hours given
+        load = {}
+        reqs = list(problem.requirements)
+        self.rng.shuffle(reqs)
+        reqs.sort(key=lambda r: len(problem.qualified.get(r.subject_id, ())))
+        for req in reqs:
+            candidates = [t for t in problem.qualified.get(req.subject_id, ())
+                          if load.get(t, 0) + req.hours <= self.usable.bit_count()]
+            need = 2 if req.split else 1
+            if len(candidates) < need:
+                self.failed.append((req.class_id, req.subject_id, req.hours))
+                continue
+            candidates.sort(key=lambda t: (load.get(t, 0) + self.teacher_mask.get(t, 0).bit_count(),
+                                           self.rng.random()))
+            teachers = tuple(candidates[:need])
+            for t in teachers:
+                load[t] = load.get(t, 0) + req.hours
+            self.lessons.append(_Lesson(req, teachers))
+
+    def free(self, lesson):
+        busy = self.class_mask.get(lesson.class_id, 0)
+        for t in lesson.teachers:
+            busy |= self.teacher_mask.get(t, 0)
+        return self.usable & ~busy
+
+    def place(self, lesson, bit):
+        b = 1 << bit
+        self.class_mask[lesson.class_id] = self.class_mask.get(lesson.class_id, 0) | b
+        for t in lesson.teachers:
+            self.teacher_mask[t] = self.teacher_mask.get(t, 0) | b
+        self.owner[(lesson.class_id, bit)] = lesson
+        lesson.slots.append(bit)
+        lesson.days |= 1 << (bit // SESSIONS_PER_DAY)
+        lesson.left -= 1
+
+    def unplace(self, lesson, bit):
+        b = ~(1 << bit)
+        self.class_mask[lesson.class_id] &= b
+        for t in lesson.teachers:
+            self.teacher_mask[t] &= b
+        del self.owner[(lesson.class_id, bit)]
+        lesson.slots.remove(bit)
+        lesson.days = 0
+        for s in lesson.slots:
+            lesson.days |= 1 << (s // SESSIONS_PER_DAY)
+        lesson.left += 1
+
+    def best_slot(self, lesson, free):
+        class_mask = self.class_mask.get(lesson.class_id, 0)
+        best, best_score = None, None
+        for bit in bits(free):
+            day = bit // SESSIONS_PER_DAY
+            score = (
+                (lesson.days >> day) & 1,                # spread a subject across the week
+                (class_mask & DAY_MASKS[day]).bit_count(),  # balance the class's days
+                bit % SESSIONS_PER_DAY,                  # keep days compact, mornings first
+                self.rng.random(),
+            )
+            if best_score is None or score < best_score:
+                best, best_score = bit, score
+        return best
+
+    def repair(self, lesson):
+        """Free a slot for `lesson` by moving one other lesson of the same class."""
+        teachers_busy = 0
+        for t in lesson.teachers:
+            teachers_busy |= self.teacher_mask.get(t, 0)
+        # slots where the teachers are free but the class is taken
+        for bit in bits(self.class_mask.get(lesson.class_id, 0) & ~teachers_busy & self.usable):
+            other = self.owner.get((lesson.class_id, bit))
+            if other is None:
+                continue  # taken by a fixed entry
+            self.unplace(other, bit)
+            alternatives = self.free(other) & ~(1 << bit)
+            if alternatives:
+                self.place(other, self.best_slot(other, alternatives))
+                self.place(lesson, bit)
+                return True
+            self.place(other, bit)
+        return False
+
+    def run(self, deadline):
+        pending = [l for l in self.lessons if l.left > 0]
+        while pending:
+            if _time.monotonic() > deadline:
+                # out of time: what is left is unplaced, not silently dropped
+                self.failed.extend((l.class_id, l.subject_id, l.left) for l in pending)
+                break
+            # most constrained first: least slack between free slots and hours left
+            scored = [((self.free(l).bit_count() - l.left), self.rng.random(), i)
+                      for i, l in enumerate(pending)]
+            _, _, i = min(scored)
+            lesson = pending[i]
+            free = self.free(lesson)
+            if free:
+                self.place(lesson, self.best_slot(lesson, free))
+            elif not self.repair(lesson):
+                self.failed.append((lesson.class_id, lesson.subject_id, lesson.left))
+                pending.pop(i)
+                continue
+            if lesson.left == 0:
+                pending.pop(i)
+
+    def solution(self):
+        sol = Solution(unplaced=list(self.failed))
+        for lesson in self.lessons:
+            groups = ('1', '2') if len(lesson.teachers) == 2 else ('all',)
+            for bit in sorted(lesson.slots):
+                day, session = bit_slot(bit)
+                for teacher_id, group in zip(lesson.teachers, groups):
+                    sol.entries.append((day, session, lesson.class_id, lesson.subject_id, teacher_id, group))
+        return sol
+
+
+def solve(problem, time_budget=5.0, seed=None):
+    """Search for a full week within time_budget seconds; return the best Solution found."""
+    rng = random.Random(seed)
+    deadline = _time.monotonic() + time_budget
+    best, best_missing = None, float('inf')
+    attempts = 0
+    while True:
+        attempts += 1
+        attempt = _Attempt(problem, rng)
+        attempt.run(deadline)
+        sol = attempt.solution()
+        missing = sum(h for _, _, h in sol.unplaced)
+        if missing < best_missing:
+            best, best_missing = sol, missing
+        if best.complete or _time.monotonic() > deadline:
+            break
+    best.attempts = attempts
+    return best
+
+
+def load_problem(spec, replace=False, school_id=None):
+    """
+    Turn a spec dict into a Problem with database ids.
+
+    Existing entries of classes outside the spec (and, unless replace is set,
+    of the classes in it) are loaded as fixed occupancy. Names are looked up in
+    `school_id` (default: the current school).
+    """
+    school_id = school_id or current_school_id()
+    refs = References(school_id)
+    requirements = []
+    for class_name, subjects in spec.get('classes', {}).items():
+        class_id = refs.school_class(class_name)
+        for subject_name, hours in subjects.items():
+            split = False
+            if isinstance(hours, dict):
+                split = bool(hours.get('split'))
+                hours = hours.get('hours', 0)
+            requirements.append(Requirement(class_id, refs.subject(subject_name), int(hours), split))
+
+    qualified = {}
+    if 'qualifications' in spec:
+        for teacher_name, subjects in spec['qualifications'].items():
+            teacher_id = refs.teacher(teacher_name)
+            for subject_name in subjects:
+                qualified.setdefault(refs.subject(subject_name), []).append(teacher_id)
+    else:
+        qualifications = Teacher.subjects.through.objects.filter(teacher__school_id=school_id)
+        for teacher_id, subject_id in qualifications.values_list('teacher_id', 'subject_id'):
+            qualified.setdefault(subject_id, []).append(teacher_id)
+
+    # only the sessions the school's bell schedule has
+    problem = Problem(requirements, qualified, sessions=len(get_table(school_id=school_id)))
+    classes = {r.class_id for r in requirements}
+    existing = TimeEntry.objects.filter(school_id=school_id)
+    if replace:
+        existing = existing.exclude(school_class_id__in=classes)
+    for day, session, class_id, teacher_id in existing.values_list('day', 'session', 'school_class_id', 'teacher_id'):
+        b = 1 << slot_bit(day, session)
+        problem.teacher_busy[teacher_id] = problem.teacher_busy.get(teacher_id, 0) | b
+        problem.class_busy[class_id] = problem.class_busy.get(class_id, 0) | b
+    return problem
+
+
+def write_solution(solution, replace=False, school_id=None):
+    """Store a solution through the bulk importer; returns its ImportReport."""
+    school_id = school_id or current_school_id()
+    rows = [
+        {'day': day, 'session': session, 'class': class_id, 'subject': subject_id,
+         'teacher': teacher_id, 'group': group}
+        for day, session, class_id, subject_id, teacher_id, group in solution.entries
+    ]
+    with transaction.atomic():
+        if replace:
+            classes = {e[2] for e in solution.entries} | {u[0] for u in solution.unplaced}
+            TimeEntry.objects.filter(school_id=school_id, school_class_id__in=classes).delete()
+        report = import_entries(rows, school_id=school_id)
+        if not report.ok:
+            transaction.set_rollback(True)
+        return report
+
+
+def draft_solution(solution, replace=False, school_id=None, note=''):
+    """
+    Keep a solution, with the rest of the school's week, as a draft version
+    (see versions.py) instead of writing it to the live timetable.
+    """
+    from .versions import live_rows, save_version
+
+    school_id = school_id or current_school_id()
+    rows = live_rows(school_id)
+    if replace:
+        classes = {e[2] for e in solution.entries} | {u[0] for u in solution.unplaced}
+        rows = [r for r in rows if r[2] not in classes]
+    rows += [[day, session, class_id, group, subject_id, teacher_id, None, None, None]
+             for day, session, class_id, subject_id, teacher_id, group in solution.entries]
+    return save_version(rows, note=note, school_id=school_id)
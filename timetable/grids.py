@@ -0,0 +1,115 @@
+"""
+Materialized week grids (5 days x 8 sessions) for a class, a teacher or a room.
+
+Each grid is serialized to JSON once and kept as bytes together with its ETag,
+so a poll is a dict lookup and, with If-None-Match, a 304. The ETag is a hash
+of the body, so every process sends the same one for the same week; there is
+no Last-Modified, as a process only knows when it last rebuilt. Grids are kept
+per school; a timetable change drops that school's grids (see signals.py) and
+the next request rebuilds them from one query.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+
+from .bells import get_table
+from .models import DAY_CHOICES, Class, Room, Teacher, TimeEntry
+from .routers import use_replicas
+from .schools import current_school_id
+
+GRID_KINDS = {
+    # kind -> (model, TimeEntry filter field)
+    'class': (Class, 'school_class_id'),
+    'teacher': (Teacher, 'teacher_id'),
+    'room': (Room, 'room_id'),
+}
+
+
+@dataclass(frozen=True)
+class Grid:
+    body: bytes
+    etag: str
+
+
+_lock = threading.Lock()
+_grids = {}       # (school id, kind, pk) -> Grid
+_generation = {}  # school id -> int
+
+
+def invalidate(school_id=None):
+    """Drop the grids of one school, or of every school."""
+    with _lock:
+        schools = {k[0] for k in _grids} | set(_generation) if school_id is None else {school_id}
+        for key in [k for k in _grids if k[0] in schools]:
+            del _grids[key]
+        for school in schools:
+            _generation[school] = _generation.get(school, 0) + 1
+
+
+def _lesson(e, start, end):
+    return {
+        'subject': str(e.subject),
+        'teacher': str(e.teacher),
+        'class': str(e.school_class),
+        'group': e.group,
+        'room': str(e.room) if e.room_id else '',
+        'start': start,
+        'end': end,
+    }
+
+
+@use_replicas(False)
+def build_grid(kind, pk, school_id):
+    """Serialize the week of one class/teacher, or return None if the school has no such one."""
+    model, field = GRID_KINDS[kind]
+    obj = model.objects.filter(pk=pk, school_id=school_id).first()
+    if obj is None:
+        return None
+
+    table = get_table(school_id=school_id)
+    days = [code for code, _ in DAY_CHOICES]
+    cells = {day: [[] for _ in range(len(table))] for day in days}
+    entries = (TimeEntry.objects.filter(school_id=school_id, **{field: pk})
+               .select_related('school_class', 'subject', 'teacher', 'room')
+               .order_by('day', 'session', 'group'))
+    for e in entries:
+        if e.session > len(table):
+            continue
+        start, end = table.label(e.session)
+        if e.start_time:
+            start = e.start_time.strftime("%H:%M")
+        if e.end_time:
+            end = e.end_time.strftime("%H:%M")
+        cells[e.day][e.session - 1].append(_lesson(e, start, end))
+
+    data = {
+        'kind': kind,
+        'id': pk,
+        'name': str(obj),
+        'days': days,
+        'sessions': [
+            {'session': i, 'start': s, 'end': e} for i, (s, e) in enumerate(table.labels, start=1)
+        ],
+        'grid': cells,
+    }
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return Grid(body, hashlib.sha1(body).hexdigest())
+
+
+def get_grid(kind, pk, school_id=None):
+    if kind not in GRID_KINDS:
+        return None
+    if school_id is None:
+        school_id = current_school_id()
+    key = (school_id, kind, pk)
+    grid = _grids.get(key)
+    if grid is None:
+        generation = _generation.get(school_id, 0)
+        grid = build_grid(kind, pk, school_id)
+        if grid is not None:
+            with _lock:
+                # don't keep a grid built from data that changed meanwhile
+                if generation == _generation.get(school_id, 0):
+                    _grids[key] = grid
+    return grid
@@ -0,0 +1,183 @@
+"""
+iCalendar (ICS) feeds of a class, a teacher or a pupil.
+
+The week pattern becomes one weekly recurring VEVENT per lesson, with the
+stored or bell schedule times in settings.TIME_ZONE. A pupil's feed is the
+feed of their class and group, so all pupils of a group share one.
+
+Feeds are streamed from a generator, and the finished body is kept in the
+Django cache under the school's timetable version (see fragments.py). The
+ETag is that version, so the hourly re-poll of a calendar app is answered
+with a 304 without building anything, and a new subscriber gets the cached
+bytes. Pupil feed URLs carry a signed token instead of the pupil id.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .bells import get_table
+from .fragments import timetable_version
+from .models import DAY_CHOICES, GROUP_CHOICES, Class, Teacher, TimeEntry
+from .now_index import now_index
+
+FEED_KINDS = {
+    # kind -> (model, TimeEntry filter field)
+    'class': (Class, 'school_class_id'),
+    'teacher': (Teacher, 'teacher_id'),
+}
+BYDAY = {'mon': 'MO', 'tue': 'TU', 'wed': 'WE', 'thu': 'TH', 'fri': 'FR'}
+FEED_TIMEOUT = 7 * 24 * 3600  # a new version makes old bodies unreachable anyway
+CHUNK_SIZE = 16 * 1024
+
+_signer = signing.Signer(salt='timetable.ics.pupil')
+
+
+def pupil_token(pupil_id):
+    return _signer.sign(str(pupil_id))
+
+
+def resolve(kind, key, school_id):
+    """(kind, pk, group) behind a feed URL, or None. Pupils resolve to their class and group."""
+    if kind == 'pupil':
+        try:
+            pupil_id = int(_signer.unsign(key))
+        except (signing.BadSignature, ValueError):
+            return None
+        pupil = now_index.of(school_id).pupil(pupil_id)
+        if pupil is None:
+            return None
+        return 'class', pupil['class_id'], pupil['group'] or None
+    if kind not in FEED_KINDS:
+        return None
+    try:
+        return kind, int(key), None
+    except ValueError:
+        return None
+
+
+def feed_etag(kind, pk, group, school_id):
+    return f'{timetable_version(school_id)}-{kind}-{pk}-{group or "all"}'
+
+
+def _escape(text):
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Fold a content line at 75 octets (RFC 5545 3.1), never inside a UTF-8 character."""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return data + b'\r\n'
+    parts, limit = [], 75
+    while len(data) > limit:
+        cut = limit
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        limit = 74  # continuation lines start with a space
+    parts.append(data)
+    return b'\r\n '.join(parts) + b'\r\n'
+
+
+def _vtimezone(tzid, zone, on):
+    # one fixed offset: fine for zones without daylight saving time, like Asia/Tashkent
+    seconds = int(datetime.combine(on, datetime.min.time(), zone).utcoffset().total_seconds())
+    sign = '+' if seconds >= 0 else '-'
+    offset = f"{sign}{abs(seconds) // 3600:02d}{abs(seconds) % 3600 // 60:02d}"
+    return [
+        'BEGIN:VTIMEZONE', f'TZID:{tzid}',
+        'BEGIN:STANDARD', 'DTSTART:19700101T000000',
+        f'TZOFFSETFROM:{offset}', f'TZOFFSETTO:{offset}',
+        'END:STANDARD', 'END:VTIMEZONE',
+    ]
+
+
+def _lines(kind, obj, group, school_id):
+    field = FEED_KINDS[kind][1]
+    tzid = settings.TIME_ZONE
+    zone = ZoneInfo(tzid)
+    # recurrences start in the current week
+    today = timezone.localdate()
+    monday = today - timedelta(days=today.weekday())
+    dates = {code: monday + timedelta(days=i) for i, (code, _) in enumerate(DAY_CHOICES)}
+    stamp = timezone.now().astimezone(ZoneInfo('UTC')).strftime('%Y%m%dT%H%M%SZ')
+    name = f"{obj} ({dict(GROUP_CHOICES).get(group, group)})" if group else str(obj)
+
+    yield from (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//timetable//feeds//EN', 'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_escape(name)}', f'X-WR-TIMEZONE:{tzid}',
+    )
+    yield from _vtimezone(tzid, zone, monday)
+
+    table = get_table(school_id=school_id)
+    entries = (TimeEntry.objects.filter(school_id=school_id, **{field: obj.pk})
+               .select_related('school_class', 'subject', 'teacher')
+               .order_by('day', 'session', 'group'))
+    if group:
+        entries = entries.filter(group__in=('all', group))
+    for e in entries.iterator(chunk_size=500):
+        if e.day not in dates:
+            continue
+        start, end = e.start_time, e.end_time
+        if not start or not end:
+            if e.session > len(table):
+                continue
+            computed = table.times(e.session)
+            start, end = start or computed[0], end or computed[1]
+        day = dates[e.day]
+        summary = str(e.subject) if e.group == 'all' else f"{e.subject} ({e.get_group_display()})"
+        other = e.teacher if kind == 'class' else e.school_class
+        yield from (
+            'BEGIN:VEVENT',
+            # from the slot, not the pk: publishing a version replaces the rows
+            f'UID:timetable-{e.school_class_id}-{e.day}-{e.session}-{e.group}-{kind}-{obj.pk}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART;TZID={tzid}:{datetime.combine(day, start):%Y%m%dT%H%M%S}',
+            f'DTEND;TZID={tzid}:{datetime.combine(day, end):%Y%m%dT%H%M%S}',
+            f'RRULE:FREQ=WEEKLY;BYDAY={BYDAY[e.day]}',
+            f'SUMMARY:{_escape(summary)}',
+            f'DESCRIPTION:{_escape(other)}',
+            'END:VEVENT',
+        )
+    yield 'END:VCALENDAR'
+
+
+def _stream(lines, key):
+    """Chunks of the folded lines; the whole body goes to the cache once it is complete."""
+    body, pending = [], []
+    size = 0
+    for line in lines:
+        data = _fold(line)
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            chunk = b''.join(pending)
+            body.append(chunk)
+            pending, size = [], 0
+            yield chunk
+    chunk = b''.join(pending)
+    body.append(chunk)
+    yield chunk
+    cache.set(key, b''.join(body), timeout=FEED_TIMEOUT)
+
+
+def feed(kind, pk, group, school_id):
+    """
+    Iterator over the feed's bytes, or None if the school has no such class/teacher.
+    Served from the cache while the timetable version is unchanged.
+    """
+    key = f'timetable:{school_id}:ics:{feed_etag(kind, pk, group, school_id)}'
+    body = cache.get(key)
+    if body is not None:
+        return iter([body])
+    model, _ = FEED_KINDS[kind]
+    obj = model.objects.filter(pk=pk, school_id=school_id).first()
+    if obj is None:
+        return None
+    return _stream(_lines(kind, obj, group, school_id), key)
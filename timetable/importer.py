@@ -0,0 +1,224 @@
+"""
+Bulk timetable import.
+
+TimeEntry.save() runs full_clean() and one occupancy query per row. That is
+fine in the admin but too slow for loading a whole week, so the importer loads
+the occupancy once (conflicts.py), checks the entire batch against it in
+memory and writes it with a single bulk_create inside one transaction.
+
+Rows are plain dicts (see ROW_FIELDS). Extra keys are ignored.
+"""
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import time
+from functools import partial
+
+from django.db import transaction
+
+from .bells import get_table
+from .models import (
+    DAY_CHOICES, GROUP_CHOICES, SESSION_CHOICES,
+    Class, Room, Subject, Teacher, TimeEntry,
+)
+from .conflicts import Occupancy, lock_for, slot_of
+from .schools import current_school_id
+from .signals import timetable_changed
+
+ROW_FIELDS = ('day', 'class', 'session', 'subject', 'teacher', 'group', 'room', 'start_time', 'end_time')
+
+DAYS = {code for code, _ in DAY_CHOICES}
+GROUPS = {code for code, _ in GROUP_CHOICES}
+SESSIONS = {i for i, _ in SESSION_CHOICES}
+
+CLASS_RE = re.compile(r'^\s*(\d+)\s*-?\s*([^\d\s])\s*$')
+
+
+class RowError(Exception):
+    pass
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    errors: list = field(default_factory=list)  # [(row number, message), ...]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class References:
+    """Lookup tables for one school's classes, subjects, teachers and rooms, loaded with one query each."""
+
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self.classes = {(c.number, c.letter.upper()): c.pk for c in Class.objects.filter(school_id=school_id)}
+        self.class_ids = set(self.classes.values())
+        self.subjects = {}
+        self.subject_ids = set()
+        for s in Subject.objects.filter(school_id=school_id):
+            self.subject_ids.add(s.pk)
+            self.subjects[s.name.lower()] = s.pk
+            self.subjects[str(s).lower()] = s.pk
+        self.teachers = {}
+        self.teacher_ids = set()
+        for t in Teacher.objects.filter(school_id=school_id):
+            self.teacher_ids.add(t.pk)
+            key = f"{t.first_name} {t.last_name}".casefold()
+            # a name shared by two teachers can't be resolved, only ids can
+            self.teachers[key] = None if key in self.teachers else t.pk
+        self.rooms = {}
+        self.room_ids = set()
+        for r in Room.objects.filter(school_id=school_id):
+            self.room_ids.add(r.pk)
+            self.rooms[r.name.strip().casefold()] = r.pk
+
+    # ints are taken as primary keys, strings as names
+
+    def school_class(self, value):
+        if isinstance(value, int) and value in self.class_ids:
+            return value
+        m = CLASS_RE.match(str(value or ''))
+        if not m:
+            raise RowError(f"Invalid class '{value}', expected something like '5A'.")
+        pk = self.classes.get((int(m.group(1)), m.group(2).upper()))
+        if pk is None:
+            raise RowError(f"Unknown class '{value}'.")
+        return pk
+
+    def subject(self, value):
+        if isinstance(value, int) and value in self.subject_ids:
+            return value
+        pk = self.subjects.get(str(value or '').strip().lower())
+        if pk is None:
+            raise RowError(f"Unknown subject '{value}'.")
+        return pk
+
+    def teacher(self, value):
+        if isinstance(value, int) and value in self.teacher_ids:
+            return value
+        value = str(value or '').strip()
+        if value.isdigit() and int(value) in self.teacher_ids:
+            return int(value)
+        key = ' '.join(value.split()).casefold()
+        if key not in self.teachers:
+            raise RowError(f"Unknown teacher '{value}'.")
+        if self.teachers[key] is None:
+            raise RowError(f"Teacher name '{value}' is ambiguous, use the teacher id.")
+        return self.teachers[key]
+
+    def room(self, value):
+        # optional; room names are often numbers, so only ints are ids
+        if isinstance(value, int) and value in self.room_ids:
+            return value
+        value = str(value or '').strip()
+        if not value:
+            return None
+        pk = self.rooms.get(value.casefold())
+        if pk is None:
+            raise RowError(f"Unknown room '{value}'.")
+        return pk
+
+
+def _parse_time(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, time):
+        return value
+    try:
+        return time.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError(f"Invalid time '{value}', expected HH:MM.")
+
+
+def _build_entry(row, refs):
+    day = str(row.get('day', '')).strip().lower()
+    if day not in DAYS:
+        raise RowError(f"Invalid day '{row.get('day')}'.")
+    try:
+        session = int(row.get('session'))
+    except (TypeError, ValueError):
+        session = None
+    if session not in SESSIONS:
+        raise RowError(f"Invalid session '{row.get('session')}', expected 1..8.")
+    group = str(row.get('group') or 'all').strip().lower()
+    if group not in GROUPS:
+        raise RowError(f"Invalid group '{row.get('group')}'.")
+
+    sessions = len(get_table(school_id=refs.school_id))
+    if session > sessions:
+        raise RowError(f"Invalid session '{session}', the bell schedule has only {sessions} sessions.")
+    return TimeEntry(
+        school_id=refs.school_id,
+        day=day,
+        session=session,
+        school_class_id=refs.school_class(row.get('class')),
+        subject_id=refs.subject(row.get('subject')),
+        teacher_id=refs.teacher(row.get('teacher')),
+        group=group,
+        room_id=refs.room(row.get('room')),
+        start_time=_parse_time(row.get('start_time')),
+        end_time=_parse_time(row.get('end_time')),
+    )
+
+
+def import_entries(rows, skip_invalid=False, dry_run=False, school_id=None):
+    """
+    Validate and insert timetable rows into a school (default: the current one) in one batch.
+
+    Rows are checked against the existing timetable and against each other.
+    By default nothing is written if any row fails; with skip_invalid the
+    valid rows are still inserted. Returns an ImportReport with 1-based row numbers.
+    """
+    report = ImportReport()
+    rows = list(rows)
+
+    if school_id is None:
+        school_id = current_school_id()
+
+    with transaction.atomic():
+        refs = References(school_id)
+        new_entries = []
+        for n, row in enumerate(rows, start=1):
+            try:
+                new_entries.append((n, _build_entry(row, refs)))
+            except RowError as exc:
+                report.errors.append((n, str(exc)))
+
+        lock_for([e for _, e in new_entries])
+        occupancy = Occupancy.load(school_id, days={e.day for _, e in new_entries})
+        valid = []
+        for n, entry in new_entries:
+            slot = slot_of(entry)
+            problems = occupancy.violations(slot)
+            if problems:
+                report.errors.append((n, ' '.join(message for _, message in problems)))
+                continue
+            occupancy.add(slot)
+            valid.append(entry)
+        report.errors.sort()
+        new_entries = valid
+
+        if dry_run or (report.errors and not skip_invalid):
+            return report
+
+        TimeEntry.objects.bulk_create(new_entries, batch_size=500)
+        report.created = len(new_entries)
+        # bulk_create skips post_save, so the caches have to be told directly
+        transaction.on_commit(partial(timetable_changed, school_id))
+
+    return report
+
+
+def read_rows(path):
+    """Read rows from a .json (list of objects) or .csv (header row) file."""
+    if str(path).lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get('entries', [])
+        return data
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
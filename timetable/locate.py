@@ -0,0 +1,105 @@
+"""
+Batch "where is each of these pupils" lookup.
+
+Two queries regardless of how many pupils are asked for: one for the pupils
+(with their classes) and one for every lesson of those classes in the slot.
+alocate_pupils() runs the same two queries on the async ORM.
+A pupil in group '1' or '2' only gets lessons of their group or 'all'.
+The date's calendar exceptions (holidays, other bell times, lesson changes;
+see calendar.py) are applied from memory.
+"""
+from dataclasses import dataclass, field
+
+from django.utils import timezone
+
+from .calendar import calendar
+from .models import Pupil, TimeEntry
+from .now_index import format_entry
+from .schools import current_school_id
+
+MAX_PUPILS = 500
+
+
+@dataclass
+class Whereabouts:
+    day: str = None
+    session: int = None
+    pupils: list = field(default_factory=list)
+    missing: list = field(default_factory=list)  # requested ids with no pupil
+
+
+def _local(when):
+    return timezone.localtime(when) if timezone.is_aware(when) else when
+
+
+def slot_at(when, school_id=None):
+    """(day code, session) for an aware or naive local datetime; either may be None."""
+    when = _local(when)
+    plan = calendar.of(school_id or current_school_id()).plan(when.date())
+    return plan.day, plan.table.current_session(when.time())
+
+
+def lessons_for(entries, pupil_group):
+    if not pupil_group:
+        return entries
+    return [e for e in entries if e['group_code'] in ('all', pupil_group)]
+
+
+def _queries(pupil_ids, school_id, day, session):
+    if len(pupil_ids) > MAX_PUPILS:
+        raise ValueError(f"At most {MAX_PUPILS} pupils per lookup.")
+    pupils = Pupil.objects.filter(school_id=school_id, pk__in=pupil_ids).select_related('school_class')
+    entries = (TimeEntry.objects
+               .filter(school_id=school_id, day=day, session=session,
+                       school_class__in=pupils.values('school_class_id'))
+               .select_related('subject', 'teacher')
+               .order_by('group'))
+    return pupils, entries
+
+
+def _whereabouts(pupil_ids, plan, session, pupils, entries):
+    day = plan.day
+    result = Whereabouts(day=day, session=session)
+    found = {p.pk for p in pupils}
+    result.missing = [pk for pk in pupil_ids if pk not in found]
+
+    by_class = {}
+    for e in entries:
+        by_class.setdefault(e.school_class_id, []).append(format_entry(e))
+    if day and session:
+        for class_id in {p.school_class_id for p in pupils}:
+            if plan.differs(session, class_id):
+                by_class[class_id] = list(plan.apply(session, class_id, by_class.get(class_id, [])))
+
+    order = {pk: i for i, pk in enumerate(pupil_ids)}
+    for p in sorted(pupils, key=lambda p: order[p.pk]):
+        result.pupils.append({
+            'id': p.pk,
+            'pupil': f"{p.first_name} {p.last_name}",
+            'class': str(p.school_class),
+            'group': p.group,
+            'entries': lessons_for(by_class.get(p.school_class_id, []), p.group),
+        })
+    return result
+
+
+def locate_pupils(pupil_ids, when=None, school_id=None):
+    """Where each pupil of a school (default: the current one) is at `when` (default: now)."""
+    school_id = school_id or current_school_id()
+    when = _local(when or timezone.now())
+    plan = calendar.of(school_id).plan(when.date())
+    session = plan.table.current_session(when.time())
+    pupils, entries = _queries(pupil_ids, school_id, plan.day, session)
+    return _whereabouts(pupil_ids, plan, session, list(pupils), list(entries) if plan.day and session else [])
+
+
+async def alocate_pupils(pupil_ids, when=None, school_id=None):
+    """locate_pupils() for async views, on the async ORM."""
+    school_id = school_id or current_school_id()
+    when = _local(when or timezone.now())
+    plan = await calendar.of(school_id).aplan(when.date())
+    session = plan.table.current_session(when.time())
+    pupils, entries = _queries(pupil_ids, school_id, plan.day, session)
+    pupils = [p async for p in pupils]
+    entries = [e async for e in entries] if plan.day and session else []
+    return _whereabouts(pupil_ids, plan, session, pupils, entries)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from timetable.rooms import allocate
+from timetable.schools import school_id_or_error
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign rooms to the week's lessons, slot by slot, by room kind and capacity. "
+        "See timetable/rooms.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replace', action='store_true',
+                            help="Reassign every lesson, not only those without a room")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report the allocation without saving it")
+        parser.add_argument('--school', help="Slug of the school (default: the default school)")
+
+    def handle(self, *args, **options):
+        report = allocate(school_id_or_error(options['school']), replace=options['replace'],
+                          dry_run=options['dry_run'])
+        for entry, size in report.unassigned:
+            kind = entry.subject.get_room_kind_display() or "any room"
+            self.stderr.write(f"{entry}: no free room ({kind}, {size} pupils)")
+        self.stdout.write(
+            f"{report.assigned} lessons got a room, {report.kept} kept theirs, "
+            f"{len(report.unassigned)} without one ({report.seconds:.3f} s)."
+        )
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Saved."))
@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+    teardown_test_environment
+
+from timetable import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark pupil_now, the simulator, week grids, admin changelists and TimeEntry.save() "
+        "on synthetic schools, a pupil_now burst under WSGI vs ASGI, and a bell surge with and without the "
+        "warm-up. Runs in a throwaway test database, never in the real one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,10',
+                            help="Comma separated school size multipliers (default 1,10)")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clients', type=int, default=200,
+                            help="Concurrent clients in the pupil_now burst (default 200)")
+        parser.add_argument('--threads', type=int, default=8,
+                            help="WSGI worker threads serving the burst (default 8)")
+        parser.add_argument('--label', default='', help="Release or branch name stored with the results")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--compare', help="Earlier results JSON to check for regressions")
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help="Percent p50 slowdown reported as a regression (default 20)")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(s) for s in options['scales'].split(',') if s.strip()]
+        except ValueError:
+            raise CommandError("--scales must be comma separated integers")
+
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = benchmark.run(scales, options['iterations'], options['seed'], options['label'],
+                                    options['clients'], options['threads'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for scale, scenarios in results['scales'].items():
+            size = scenarios['size']
+            self.stdout.write(f"\n{scale}: {size['classes']} classes, {size['pupils']} pupils, "
+                              f"{size['teachers']} teachers, {size['entries']} entries")
+            for name, stats in scenarios.items():
+                if name == 'size':
+                    continue
+                if 'queries' in stats:
+                    extra = f"{stats['queries']} queries"
+                elif 'requests_per_s' in stats:
+                    extra = f"{stats['requests_per_s']} requests/s"
+                    if 'renders' in stats:
+                        extra += f", {stats['renders']} renders"
+                else:
+                    extra = f"{stats['saves_per_s']} saves/s"
+                p99 = f"  p99 {stats['p99_ms']:9.2f}ms" if 'p99_ms' in stats else ''
+                self.stdout.write(f"  {name:28} p50 {stats['p50_ms']:9.2f}ms  p95 {stats['p95_ms']:9.2f}ms{p99}  {extra}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"\nResults written to {options['output']}")
+
+        if previous is not None:
+            regressions = benchmark.compare(results, previous, options['threshold'])
+            for line in regressions:
+                self.stderr.write(f"REGRESSION {line}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS("No regressions."))
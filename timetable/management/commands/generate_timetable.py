@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable.generator import draft_solution, load_problem, solve, write_solution
+from timetable.importer import RowError
+from timetable.models import Class, Subject, Teacher
+from timetable.schools import school_id_or_error
+from timetable.slots import DAYS, SESSIONS_PER_DAY
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a conflict-free week from per-class subject hours and teacher "
+        "qualifications. See timetable/generator.py for the spec format."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', help="JSON file with 'classes' and optional 'qualifications'")
+        parser.add_argument('--time-budget', type=float, default=5.0,
+                            help="Seconds the solver may spend (default 5)")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--replace', action='store_true',
+                            help="Delete the existing entries of the classes in the spec first")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Print the generated week instead of saving it")
+        parser.add_argument('--draft', action='store_true',
+                            help="Keep the result as a draft version to publish later instead of saving it")
+        parser.add_argument('--allow-partial', action='store_true',
+                            help="Save the lessons that could be placed even if some could not")
+        parser.add_argument('--school', help="Slug of the school (default: the default school)")
+
+    def handle(self, *args, **options):
+        school_id = school_id_or_error(options['school'])
+        try:
+            with open(options['spec'], encoding='utf-8') as f:
+                spec = json.load(f)
+            problem = load_problem(spec, replace=options['replace'], school_id=school_id)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['spec']}: {exc}")
+        except RowError as exc:
+            raise CommandError(str(exc))
+
+        solution = solve(problem, time_budget=options['time_budget'], seed=options['seed'])
+        self.stdout.write(
+            f"{len(solution.entries)} entries placed after {solution.attempts} attempt(s)."
+        )
+
+        if solution.unplaced:
+            classes = {c.pk: str(c) for c in Class.objects.filter(school_id=school_id)}
+            subjects = {s.pk: str(s) for s in Subject.objects.filter(school_id=school_id)}
+            for class_id, subject_id, hours in solution.unplaced:
+                self.stderr.write(f"{classes[class_id]}: {hours}h of {subjects[subject_id]} could not be placed")
+            if not options['allow_partial'] and not options['dry_run']:
+                raise CommandError("Timetable incomplete, nothing saved (use --allow-partial to keep it).")
+
+        if options['dry_run']:
+            self._print(solution, school_id)
+            return
+
+        if options['draft']:
+            version = draft_solution(solution, replace=options['replace'], school_id=school_id,
+                                     note=f"Generated from {options['spec']}")
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved as draft v{version.number} ({version.entry_count} entries); "
+                f"publish it with: manage.py timetable_versions publish {version.number}"))
+            return
+
+        report = write_solution(solution, replace=options['replace'], school_id=school_id)
+        for n, message in report.errors:
+            self.stderr.write(f"entry {n}: {message}")
+        if not report.ok:
+            raise CommandError("Generated entries clash with the stored timetable, nothing saved.")
+        self.stdout.write(self.style.SUCCESS(f"Saved {report.created} timetable entries."))
+
+    def _print(self, solution, school_id):
+        classes = {c.pk: str(c) for c in Class.objects.filter(school_id=school_id)}
+        subjects = {s.pk: s.name for s in Subject.objects.filter(school_id=school_id)}
+        teachers = {t.pk: str(t) for t in Teacher.objects.filter(school_id=school_id)}
+        grid = {}
+        for day, session, class_id, subject_id, teacher_id, group in solution.entries:
+            label = subjects[subject_id] if group == 'all' else f"{subjects[subject_id]}/{group}"
+            grid.setdefault(class_id, {}).setdefault((day, session), []).append(
+                f"{label} ({teachers[teacher_id]})")
+        for class_id in sorted(grid, key=lambda c: classes[c]):
+            self.stdout.write(f"\n{classes[class_id]}")
+            for day in DAYS:
+                cells = [', '.join(grid[class_id].get((day, s), ['-'])) for s in range(1, SESSIONS_PER_DAY + 1)]
+                self.stdout.write(f"  {day}: " + ' | '.join(cells))
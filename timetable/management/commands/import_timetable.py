@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable.importer import ROW_FIELDS, import_entries, read_rows
+from timetable.schools import school_id_or_error
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import timetable entries from a CSV or JSON file. "
+        f"Columns: {', '.join(ROW_FIELDS)} (room, start_time and end_time optional)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file with a header row, or JSON list of objects")
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help="Insert the valid rows even if some rows fail")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate only, write nothing")
+        parser.add_argument('--school', help="Slug of the school to import into (default: the default school)")
+
+    def handle(self, *args, **options):
+        school_id = school_id_or_error(options['school'])
+        try:
+            rows = read_rows(options['path'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+
+        report = import_entries(rows, skip_invalid=options['skip_invalid'], dry_run=options['dry_run'],
+                                school_id=school_id)
+
+        for n, message in report.errors:
+            self.stderr.write(f"row {n}: {message}")
+
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: {len(rows) - len(report.errors)} of {len(rows)} rows are valid.")
+        elif report.errors and not options['skip_invalid']:
+            raise CommandError(f"{len(report.errors)} invalid rows, nothing imported.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {report.created} timetable entries."))
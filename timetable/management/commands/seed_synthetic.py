@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable.models import School
+from timetable.synthetic import seed_school
+
+
+class Command(BaseCommand):
+    help = "Create a synthetic school (classes, teachers, pupils) with a conflict-free week."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=14)
+        parser.add_argument('--pupils', type=int, default=400)
+        parser.add_argument('--teachers', type=int, default=28,
+                            help="Teachers in all, shared out by the hours each subject needs (at least 8)")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--time-budget', type=float, default=10.0,
+                            help="Seconds the timetable generator may spend (default 10)")
+        parser.add_argument('--flush', action='store_true',
+                            help="Delete the school's classes, teachers, pupils and entries first")
+        parser.add_argument('--school', help="Slug of the school to fill, created if needed (default: the default school)")
+
+    def handle(self, *args, **options):
+        school_id = None
+        if options['school']:
+            school_id = School.objects.get_or_create(
+                slug=options['school'], defaults={'name': options['school']})[0].pk
+        try:
+            report = seed_school(
+                options['classes'], options['pupils'], options['teachers'],
+                seed=options['seed'], time_budget=options['time_budget'], flush=options['flush'],
+                school_id=school_id,
+            )
+        except (ValueError, RuntimeError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.classes} classes, {report.teachers} teachers, {report.rooms} rooms, "
+            f"{report.pupils} pupils and {report.entries} timetable entries."
+        ))
+        if report.unplaced_hours:
+            self.stderr.write(f"{report.unplaced_hours} lesson hours could not be placed; add teachers.")
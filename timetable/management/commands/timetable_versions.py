@@ -0,0 +1,84 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable.models import Class, Room, Subject, Teacher, TimetableVersion
+from timetable.schools import school_id_or_error
+from timetable.versions import PublishError, diff, live_rows, publish, rollback, snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Timetable versions: list them, snapshot the live week, diff two versions "
+        "(or one against the live week), publish one, or roll back. See timetable/versions.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'snapshot', 'diff', 'publish', 'rollback'])
+        parser.add_argument('numbers', nargs='*', type=int,
+                            help="diff: one or two version numbers (one: against the live week); publish: one")
+        parser.add_argument('--note', default='', help="snapshot: what the version is for")
+        parser.add_argument('--school', help="Slug of the school (default: the default school)")
+
+    def handle(self, *args, **options):
+        school_id = school_id_or_error(options['school'])
+        action, numbers = options['action'], options['numbers']
+        versions = TimetableVersion.objects.filter(school_id=school_id)
+
+        if action == 'list':
+            for v in versions.defer('rows'):
+                published = f" published {v.published_at:%Y-%m-%d %H:%M}" if v.published_at else ""
+                self.stdout.write(f"v{v.number:<4} {v.get_status_display():<10} {v.entry_count:>5} entries  "
+                                  f"{v.created_at:%Y-%m-%d %H:%M}{published}  {v.note}")
+        elif action == 'snapshot':
+            version = snapshot(options['note'], school_id=school_id)
+            self.stdout.write(self.style.SUCCESS(f"Saved the live week as v{version.number} "
+                                                 f"({version.entry_count} entries)."))
+        elif action == 'diff':
+            if len(numbers) not in (1, 2):
+                raise CommandError("diff takes one or two version numbers.")
+            old = self._version(versions, numbers[0]).rows
+            new = self._version(versions, numbers[1]).rows if len(numbers) == 2 else live_rows(school_id)
+            self._print_diff(diff(old, new), school_id)
+        elif action == 'publish':
+            if len(numbers) != 1:
+                raise CommandError("publish takes one version number.")
+            try:
+                changes = publish(self._version(versions, numbers[0]))
+            except PublishError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(
+                f"Published v{numbers[0]}: {len(changes.added)} added, {len(changes.removed)} removed, "
+                f"{len(changes.changed)} changed."))
+        else:
+            try:
+                version = rollback(school_id)
+            except PublishError as exc:
+                raise CommandError(str(exc))
+            if version is None:
+                raise CommandError("Nothing to roll back to.")
+            self.stdout.write(self.style.SUCCESS(f"Rolled back to v{version.number}."))
+
+    def _version(self, versions, number):
+        try:
+            return versions.get(number=number)
+        except TimetableVersion.DoesNotExist:
+            raise CommandError(f"No version {number}.")
+
+    def _print_diff(self, changes, school_id):
+        names = {}
+        for model in (Class, Subject, Teacher, Room):
+            names[model] = {o.pk: str(o) for o in model.objects.filter(school_id=school_id)}
+
+        def label(row):
+            day, session, class_id, group, subject_id, teacher_id, room_id, *_ = row
+            room = f" in {names[Room].get(room_id, room_id)}" if room_id else ""
+            return (f"{day} {session} {names[Class].get(class_id, class_id)} ({group}): "
+                    f"{names[Subject].get(subject_id, subject_id)}, {names[Teacher].get(teacher_id, teacher_id)}{room}")
+
+        for row in changes.removed:
+            self.stdout.write(f"- {label(row)}")
+        for row in changes.added:
+            self.stdout.write(f"+ {label(row)}")
+        for old, new in changes.changed:
+            self.stdout.write(f"~ {label(old)}\n  -> {label(new)}")
+        self.stdout.write(f"{len(changes.added)} added, {len(changes.removed)} removed, "
+                          f"{len(changes.changed)} changed.")
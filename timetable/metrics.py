@@ -0,0 +1,212 @@
+"""
+Opt-in request instrumentation.
+
+With TIMETABLE_METRICS = True in settings, MetricsMiddleware measures every
+request: query count, DB time, template render time and the remaining Python
+time. It puts them into a Server-Timing header and into a rolling window per
+URL name, which /metrics exports in Prometheus text format (p50/p95/p99).
+
+Queries are timed by an execute wrapper that every database connection gets
+when it opens, so those made in sync_to_async threads under ASGI count too:
+the request's RequestTiming travels with the context, and each thread adds to
+counters of its own.
+
+When the setting is off, the middleware raises MiddlewareNotUsed, so Django
+drops it from the chain and nothing is patched or wrapped.
+"""
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+WINDOW = 1000          # samples kept per view
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = ContextVar('timetable_request_timing', default=None)
+
+
+class RequestTiming:
+    __slots__ = ('threads', 'template', 'template_depth')
+
+    def __init__(self):
+        self.threads = {}  # thread id -> [queries, DB seconds], each updated by its own thread only
+        self.template = 0.0
+        self.template_depth = 0
+
+    @property
+    def queries(self):
+        return sum(counts[0] for counts in list(self.threads.values()))
+
+    @property
+    def db(self):
+        return sum(counts[1] for counts in list(self.threads.values()))
+
+
+class Recorder:
+    """Rolling window of per-request samples, per URL name."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}  # view -> deque of (total, db, template, queries)
+        self._counts = {}   # view -> [count, total seconds]
+
+    def add(self, view, total, db, template, queries):
+        with self._lock:
+            samples = self._samples.get(view)
+            if samples is None:
+                samples = self._samples[view] = deque(maxlen=self.window)
+                self._counts[view] = [0, 0.0]
+            samples.append((total, db, template, queries))
+            self._counts[view][0] += 1
+            self._counts[view][1] += total
+
+    def snapshot(self):
+        with self._lock:
+            return {v: list(s) for v, s in self._samples.items()}, {v: list(c) for v, c in self._counts.items()}
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+recorder = Recorder()
+
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def prometheus_text():
+    samples, counts = recorder.snapshot()
+    metrics = (
+        ('timetable_request_seconds', 'Request wall time', 0),
+        ('timetable_db_seconds', 'Time spent in database queries', 1),
+        ('timetable_template_seconds', 'Time spent rendering templates', 2),
+        ('timetable_db_queries', 'Database queries per request', 3),
+    )
+    lines = []
+    for name, doc, column in metrics:
+        lines.append(f"# HELP {name} {doc} (last {recorder.window} requests per view).")
+        lines.append(f"# TYPE {name} summary")
+        for view in sorted(samples):
+            values = sorted(s[column] for s in samples[view])
+            for q in QUANTILES:
+                lines.append(f'{name}{{view="{view}",quantile="{q}"}} {_quantile(values, q):.6g}')
+            if column == 0:
+                count, total = counts[view]
+                lines.append(f'{name}_count{{view="{view}"}} {count}')
+                lines.append(f'{name}_sum{{view="{view}"}} {total:.6g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _patch_template_render():
+    """Make Template.render report its time to the current request (once per process)."""
+    from django.template import base
+
+    if getattr(base.Template.render, '_timetable_timed', False):
+        return
+    original = base.Template.render
+
+    def render(self, context):
+        timing = _current.get()
+        if timing is None:
+            return original(self, context)
+        # includes and extends render nested templates; count the outermost only
+        timing.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            timing.template_depth -= 1
+            if not timing.template_depth:
+                timing.template += time.perf_counter() - start
+
+    render._timetable_timed = True
+    base.Template.render = render
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    counts = timing.threads.get(threading.get_ident())
+    if counts is None:
+        counts = timing.threads[threading.get_ident()] = [0, 0.0]
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counts[0] += 1
+        counts[1] += time.perf_counter() - start
+
+
+def _wrap_connection(connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _wrap_connections():
+    """Time the queries of every connection, in any thread (once per process)."""
+    connection_created.connect(_wrap_connection, dispatch_uid='timetable.metrics')
+    for connection in connections.all(initialized_only=True):
+        _wrap_connection(connection)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TIMETABLE_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        _patch_template_render()
+        _wrap_connections()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, timing, time.perf_counter() - start)
+
+    @staticmethod
+    def _record(request, response, timing, total):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        if view != 'timetable:metrics':
+            recorder.add(view, total, timing.db, timing.template, timing.queries)
+
+        app = max(total - timing.db - timing.template, 0.0)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timing.db * 1000:.2f};desc="{timing.queries} queries"',
+            f'tpl;dur={timing.template * 1000:.2f}',
+            f'app;dur={app * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
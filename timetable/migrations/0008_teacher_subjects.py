@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0007_alter_timeentry_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacher',
+            name='subjects',
+            field=models.ManyToManyField(blank=True, related_name='teachers', to='timetable.subject'),
+        ),
+    ]
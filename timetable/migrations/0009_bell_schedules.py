@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:38
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0008_teacher_subjects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BellSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('is_default', models.BooleanField(default=False)),
+                ('day_start', models.TimeField(default=datetime.time(8, 30))),
+                ('lesson_minutes', models.PositiveSmallIntegerField(default=45)),
+                ('short_break_minutes', models.PositiveSmallIntegerField(default=5)),
+                ('long_break_minutes', models.PositiveSmallIntegerField(default=45)),
+                ('long_break_after', models.PositiveSmallIntegerField(default=4)),
+                ('sessions', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8')], default=8)),
+                ('version', models.PositiveIntegerField(default=1, editable=False)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BellPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='periods', to='timetable.bellschedule')),
+            ],
+            options={
+                'ordering': ['schedule', 'session'],
+                'constraints': [models.UniqueConstraint(fields=('schedule', 'session'), name='unique_period_per_schedule_session')],
+            },
+        ),
+    ]
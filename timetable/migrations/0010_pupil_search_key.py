@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+from timetable.names import pupil_search_key
+
+
+def fill_search_keys(apps, schema_editor):
+    Pupil = apps.get_model('timetable', 'Pupil')
+    pupils = list(Pupil.objects.all())
+    for p in pupils:
+        p.search_key = pupil_search_key(p.first_name, p.last_name)
+    Pupil.objects.bulk_update(pupils, ['search_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0009_bell_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pupil',
+            name='search_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=201),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0010_pupil_search_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['day', 'session', 'teacher'], name='timeentry_day_session_teacher'),
+        ),
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['school_class', 'day', 'start_time', 'end_time'], name='timeentry_class_day_times'),
+        ),
+    ]
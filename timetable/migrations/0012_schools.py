@@ -0,0 +1,157 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import timetable.schools
+
+SCHOOL_MODELS = ('Class', 'Teacher', 'Subject', 'BellSchedule', 'Pupil', 'TimeEntry')
+
+
+def assign_default_school(apps, schema_editor):
+    """Existing rows all belong to the one school this database used to hold."""
+    School = apps.get_model('timetable', 'School')
+    models_ = [apps.get_model('timetable', name) for name in SCHOOL_MODELS]
+    if not any(model.objects.exists() for model in models_):
+        return
+    school, _ = School.objects.get_or_create(
+        slug=timetable.schools.default_slug(), defaults={'name': "Default school"})
+    for model in models_:
+        model.objects.update(school=school)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0011_timeentry_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='School',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='class',
+            name='school',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='classes', to='timetable.school'),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='school',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='teachers', to='timetable.school'),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='school',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to='timetable.school'),
+        ),
+        migrations.AddField(
+            model_name='bellschedule',
+            name='school',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bell_schedules', to='timetable.school'),
+        ),
+        migrations.AddField(
+            model_name='pupil',
+            name='school',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pupils', to='timetable.school'),
+        ),
+        migrations.AddField(
+            model_name='timeentry',
+            name='school',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='time_entries', to='timetable.school'),
+        ),
+        migrations.RunPython(assign_default_school, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='class',
+            name='school',
+            field=models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='classes', to='timetable.school'),
+        ),
+        migrations.AlterField(
+            model_name='teacher',
+            name='school',
+            field=models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='teachers', to='timetable.school'),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='school',
+            field=models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to='timetable.school'),
+        ),
+        migrations.AlterField(
+            model_name='bellschedule',
+            name='school',
+            field=models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='bell_schedules', to='timetable.school'),
+        ),
+        migrations.AlterField(
+            model_name='pupil',
+            name='school',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='pupils', to='timetable.school'),
+        ),
+        migrations.AlterField(
+            model_name='timeentry',
+            name='school',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='time_entries', to='timetable.school'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='class',
+            unique_together={('school', 'number', 'letter')},
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='name',
+            field=models.CharField(choices=[('math', 'Mathematics'), ('physics', 'Physics'), ('chemistry', 'Chemistry'), ('biology', 'Biology'), ('english', 'English'), ('history', 'History'), ('geography', 'Geography'), ('it', 'Information Technology')], max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name='subject',
+            unique_together={('school', 'name')},
+        ),
+        migrations.AlterField(
+            model_name='bellschedule',
+            name='name',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bellschedule',
+            unique_together={('school', 'name')},
+        ),
+        migrations.AlterField(
+            model_name='pupil',
+            name='search_key',
+            field=models.CharField(default='', editable=False, max_length=201),
+        ),
+        migrations.AddIndex(
+            model_name='pupil',
+            index=models.Index(fields=['school', 'search_key'], name='pupil_school_search_key'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='timeentry',
+            name='unique_entry_per_class_day_session_group',
+        ),
+        migrations.AddConstraint(
+            model_name='timeentry',
+            constraint=models.UniqueConstraint(fields=('school', 'day', 'session', 'school_class', 'group'), name='unique_entry_per_class_day_session_group'),
+        ),
+        migrations.RemoveIndex(
+            model_name='timeentry',
+            name='timeentry_day_session_teacher',
+        ),
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['school', 'day', 'session', 'teacher'], name='timeentry_day_session_teacher'),
+        ),
+        migrations.RemoveIndex(
+            model_name='timeentry',
+            name='timeentry_class_day_times',
+        ),
+        migrations.AddIndex(
+            model_name='timeentry',
+            index=models.Index(fields=['school', 'school_class', 'day', 'start_time', 'end_time'], name='timeentry_class_day_times'),
+        ),
+    ]
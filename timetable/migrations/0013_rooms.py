@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:13
+
+import django.db.models.deletion
+import timetable.schools
+from django.db import migrations, models
+
+# timetable.rooms.SUBJECT_ROOM_KINDS when this migration was written
+SUBJECT_ROOM_KINDS = {'physics': 'lab', 'chemistry': 'lab', 'biology': 'lab', 'it': 'it'}
+
+
+def set_room_kinds(apps, schema_editor):
+    Subject = apps.get_model('timetable', 'Subject')
+    for name, kind in SUBJECT_ROOM_KINDS.items():
+        Subject.objects.filter(name=name).update(room_kind=kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0012_schools'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subject',
+            name='room_kind',
+            field=models.CharField(blank=True, choices=[('classroom', 'Classroom'), ('lab', 'Science lab'), ('it', 'IT room')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('kind', models.CharField(choices=[('classroom', 'Classroom'), ('lab', 'Science lab'), ('it', 'IT room')], default='classroom', max_length=10)),
+                ('capacity', models.PositiveSmallIntegerField(default=30)),
+                ('school', models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='rooms', to='timetable.school')),
+            ],
+            options={
+                'ordering': ['name'],
+                'unique_together': {('school', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='timeentry',
+            name='room',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='time_entries', to='timetable.room'),
+        ),
+        migrations.RunPython(set_room_kinds, migrations.RunPython.noop),
+    ]
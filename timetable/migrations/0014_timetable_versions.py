@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+import django.db.models.deletion
+import timetable.schools
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0013_rooms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimetableVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(editable=False)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('published', 'Published'), ('archived', 'Archived')], default='draft', editable=False, max_length=10)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('rows', models.JSONField(default=list, editable=False)),
+                ('entry_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('previous', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='timetable.timetableversion')),
+                ('school', models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='timetable_versions', to='timetable.school')),
+            ],
+            options={
+                'ordering': ['school', '-number'],
+                'constraints': [models.UniqueConstraint(fields=('school', 'number'), name='unique_version_number_per_school'), models.UniqueConstraint(condition=models.Q(('status', 'published')), fields=('school',), name='one_published_version_per_school')],
+            },
+        ),
+    ]
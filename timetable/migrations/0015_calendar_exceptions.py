@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:21
+
+import django.db.models.deletion
+import timetable.schools
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0014_timetable_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='rotation_start',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('closed', models.BooleanField(default=False)),
+                ('follows', models.CharField(blank=True, choices=[('mon', 'Monday'), ('tue', 'Tuesday'), ('wed', 'Wednesday'), ('thu', 'Thursday'), ('fri', 'Friday')], max_length=3)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('schedule', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='timetable.bellschedule')),
+                ('school', models.ForeignKey(default=timetable.schools.school_default, on_delete=django.db.models.deletion.CASCADE, related_name='calendar_days', to='timetable.school')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('school', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LessonChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(blank=True, null=True)),
+                ('week', models.CharField(blank=True, choices=[('A', 'Week A'), ('B', 'Week B')], max_length=1)),
+                ('day', models.CharField(blank=True, choices=[('mon', 'Monday'), ('tue', 'Tuesday'), ('wed', 'Wednesday'), ('thu', 'Thursday'), ('fri', 'Friday')], max_length=3)),
+                ('session', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8')])),
+                ('group', models.CharField(choices=[('1', 'Group 1'), ('2', 'Group 2'), ('all', 'All students')], default='all', max_length=3)),
+                ('cancelled', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='timetable.room')),
+                ('school', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='lesson_changes', to='timetable.school')),
+                ('school_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_changes', to='timetable.class')),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='timetable.subject')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='timetable.teacher')),
+            ],
+            options={
+                'ordering': ['date', 'week', 'day', 'session'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('date__isnull', False)), fields=('school', 'date', 'session', 'school_class', 'group'), name='unique_change_per_date_slot'), models.UniqueConstraint(condition=models.Q(('date__isnull', True)), fields=('school', 'week', 'day', 'session', 'school_class', 'group'), name='unique_change_per_week_slot')],
+            },
+        ),
+    ]
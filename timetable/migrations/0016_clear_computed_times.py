@@ -0,0 +1,46 @@
+from django.db import migrations
+
+from timetable.bells import DEFAULT_TABLE, SessionTable
+
+
+def clear_computed_times(apps, schema_editor):
+    """
+    TimeEntry.clean() used to copy the bell schedule's times into start_time/end_time.
+    Empty them where they equal the school's default schedule, so the times follow
+    later schedule changes; other stored times are real overrides and stay.
+    """
+    School = apps.get_model('timetable', 'School')
+    BellSchedule = apps.get_model('timetable', 'BellSchedule')
+    TimeEntry = apps.get_model('timetable', 'TimeEntry')
+    TimetableVersion = apps.get_model('timetable', 'TimetableVersion')
+    for school_id in School.objects.values_list('pk', flat=True):
+        schedule = (BellSchedule.objects.filter(school_id=school_id, is_default=True)
+                    .prefetch_related('periods').first())
+        table = SessionTable.from_schedule(schedule) if schedule else DEFAULT_TABLE
+        entries = TimeEntry.objects.filter(school_id=school_id)
+        for session in range(1, len(table) + 1):
+            start, end = table.times(session)
+            entries.filter(session=session, start_time=start).update(start_time=None)
+            entries.filter(session=session, end_time=end).update(end_time=None)
+        for version in TimetableVersion.objects.filter(school_id=school_id):
+            rows = []
+            for row in version.rows:
+                session = row[1]
+                if session <= len(table):
+                    start, end = table.label(session)
+                    row = [*row[:-2], None if row[-2] == start else row[-2], None if row[-1] == end else row[-1]]
+                rows.append(row)
+            if rows != version.rows:
+                version.rows = rows
+                version.save(update_fields=['rows'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0015_calendar_exceptions'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_computed_times, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def use_wal(apps, schema_editor):
+    """
+    Switch an SQLite database file to WAL mode, so readers don't block the writer.
+    The mode is stored in the file: set once here, not on every connection.
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and not connection.is_in_memory_db():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class Migration(migrations.Migration):
+    # the journal mode can't change inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('timetable', '0016_clear_computed_times'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_wal, migrations.RunPython.noop),
+    ]
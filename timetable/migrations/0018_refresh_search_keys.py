@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from timetable.names import pupil_search_key
+
+
+def refresh_search_keys(apps, schema_editor):
+    """normalize() used to turn a ´ apostrophe into a space; recompute the keys that change."""
+    Pupil = apps.get_model('timetable', 'Pupil')
+    changed = []
+    for p in Pupil.objects.all():
+        key = pupil_search_key(p.first_name, p.last_name)
+        if key != p.search_key:
+            p.search_key = key
+            changed.append(p)
+    Pupil.objects.bulk_update(changed, ['search_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0017_sqlite_wal'),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+import timetable.schools
+
+
+def create_default_school(apps, schema_editor):
+    """0012 only created the default school when there were rows to assign to it."""
+    School = apps.get_model('timetable', 'School')
+    School.objects.get_or_create(slug=timetable.schools.default_slug(), defaults={'name': "Default school"})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0018_refresh_search_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_school, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,33 @@
 
 from django.db import models
 
+from .names import pupil_search_key
+from .schools import school_default
+
+
+class School(models.Model):
+    """A tenant: every other row belongs to exactly one school (see schools.py)."""
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=50, unique=True)  # subdomain / X-School header
+    # a Monday of an "A" week; weeks alternate A/B from there (see calendar.py). Blank: no rotation.
+    rotation_start = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Class(models.Model):
     CLASS_NUMBERS = [(i, str(i)) for i in range(5, 12)]  # 5 to 11 inclusive
 
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='classes', default=school_default)
     number = models.IntegerField(choices=CLASS_NUMBERS)
     letter = models.CharField(max_length=1)  # e.g. 'A', 'B', 'C'
 
     class Meta:
-        unique_together = ('number', 'letter')  # prevent duplicates like 6A twice
+        unique_together = ('school', 'number', 'letter')  # prevent duplicates like 6A twice
         ordering = ['number', 'letter']
 
     def __str__(self):
@@ -21,23 +40,62 @@ GROUP_CHOICES = [
 ]
 
 class Pupil(models.Model):
+    # always the class's school, copied so per-school queries need no join
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='pupils', editable=False)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     school_class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='pupils')
     group = models.CharField(max_length=1, choices=GROUP_CHOICES, null=True, blank=True)
+    # normalized "first last" (see names.py), so lookups are an indexed equality
+    search_key = models.CharField(max_length=201, editable=False, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['school', 'search_key'], name='pupil_school_search_key'),
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        self.search_key = pupil_search_key(self.first_name, self.last_name)
+        self.school_id = self.school_class.school_id
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_key', 'school'}
+        return super().save(*args, **kwargs)
+
 
 class Teacher(models.Model):
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='teachers', default=school_default)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
+    # subjects the teacher is qualified to teach (used by the timetable generator)
+    subjects = models.ManyToManyField('Subject', blank=True, related_name='teachers')
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
 
+class Room(models.Model):
+    KIND_CHOICES = [
+        ('classroom', 'Classroom'),
+        ('lab', 'Science lab'),
+        ('it', 'IT room'),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='rooms', default=school_default)
+    name = models.CharField(max_length=50)  # e.g. '204', 'Chemistry lab'
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='classroom')
+    capacity = models.PositiveSmallIntegerField(default=30)  # seats
+
+    class Meta:
+        unique_together = ('school', 'name')
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Subject(models.Model):
     SUBJECT_CHOICES = [
         ('math', 'Mathematics'),
@@ -50,16 +108,28 @@ class Subject(models.Model):
         ('it', 'Information Technology'),
     ]
 
-    name = models.CharField(max_length=50, choices=SUBJECT_CHOICES, unique=True)
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='subjects', default=school_default)
+    name = models.CharField(max_length=50, choices=SUBJECT_CHOICES)
+    # lessons need a room of this kind; blank: any room, classrooms first (see rooms.py)
+    room_kind = models.CharField(max_length=10, choices=Room.KIND_CHOICES, blank=True)
+
+    class Meta:
+        unique_together = ('school', 'name')
 
     def __str__(self):
         return dict(self.SUBJECT_CHOICES).get(self.name, self.name)
+
+    def save(self, *args, **kwargs):
+        from .rooms import SUBJECT_ROOM_KINDS
+
+        if self._state.adding and not self.room_kind:
+            self.room_kind = SUBJECT_ROOM_KINDS.get(self.name, '')
+        return super().save(*args, **kwargs)
     
 
-from datetime import time, timedelta, datetime
+from datetime import time
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.utils import timezone
 
 # Reuse your existing models (adjust import if in different module)
 # from .models import Class, Teacher, Subject, Pupil
@@ -72,6 +142,9 @@ DAY_CHOICES = [
     ('fri', 'Friday'),
 ]
 
+# datetime.weekday() -> day code; weekends have no code
+WEEKDAY_TO_CODE = {i: code for i, (code, _) in enumerate(DAY_CHOICES)}
+
 GROUP_CHOICES = [
     ('1', 'Group 1'),
     ('2', 'Group 2'),
@@ -81,35 +154,14 @@ GROUP_CHOICES = [
 SESSION_CHOICES = [(i, str(i)) for i in range(1, 9)]  # 1..8
 
 
-# Helper: compute session start/end times based on school policy.
-# School start: 08:30, lesson 45 min, short break 5 min, after 4th lesson big break 45 min.
-def session_times(session_index: int):
-    if session_index < 1 or session_index > 8:
-        raise ValueError("session_index must be between 1 and 8")
-
-    # base start
-    start = datetime.combine(datetime.today(), time(hour=8, minute=30))
-
-    # accumulate time up to session_index
-    current = start
-    for s in range(1, session_index):
-        # add lesson
-        current += timedelta(minutes=45)
-        # break after lesson s
-        if s == 4:
-            current += timedelta(minutes=45)  # big break after 4th lesson
-        else:
-            current += timedelta(minutes=5)  # short break
-
-    lesson_start = current.time()
-    lesson_end_dt = (current + timedelta(minutes=45)).time()
-    return lesson_start, lesson_end_dt
-
-
 class TimeEntry(models.Model):
     """
     A single lesson slot in the timetable.
     """
+    # always the class's school (set in clean()), copied so every index can lead with it
+    school = models.ForeignKey(
+        'School', on_delete=models.CASCADE, related_name='time_entries', editable=False
+    )
     day = models.CharField(max_length=3, choices=DAY_CHOICES)
     school_class = models.ForeignKey(
         'Class', on_delete=models.CASCADE, related_name='time_entries'
@@ -122,6 +174,9 @@ class TimeEntry(models.Model):
         'Teacher', on_delete=models.PROTECT, related_name='time_entries'
     )
     group = models.CharField(max_length=3, choices=GROUP_CHOICES, default='all')
+    room = models.ForeignKey(
+        'Room', on_delete=models.SET_NULL, related_name='time_entries', null=True, blank=True
+    )
     # Optional custom times if you ever want to override computed times
     start_time = models.TimeField(blank=True, null=True)
     end_time = models.TimeField(blank=True, null=True)
@@ -133,10 +188,18 @@ class TimeEntry(models.Model):
         # Basic DB-level uniqueness to avoid exact dupes:
         constraints = [
             models.UniqueConstraint(
-                fields=['day', 'session', 'school_class', 'group'],
+                fields=['school', 'day', 'session', 'school_class', 'group'],
                 name='unique_entry_per_class_day_session_group'
             )
         ]
+        # The unique constraint above already serves (school, day, session[, school_class]) lookups.
+        indexes = [
+            # a teacher's lessons in a slot
+            models.Index(fields=['school', 'day', 'session', 'teacher'], name='timeentry_day_session_teacher'),
+            # timetable_simulator: class + day, then a range on the stored times
+            models.Index(fields=['school', 'school_class', 'day', 'start_time', 'end_time'],
+                         name='timeentry_class_day_times'),
+        ]
 
     def __str__(self):
         return f"{self.get_day_display()} {self.session} - {self.school_class} ({self.group}) {self.subject}"
@@ -144,65 +207,311 @@ class TimeEntry(models.Model):
     def clean(self):
         """
         Validate timetable rules:
-        - computed start/end time fill if not provided
+        - the session must exist in the school's bell schedule
         - teacher must not be assigned to another lesson at the same day/session (overlap)
         - a class can have at most 2 groups at same day/session
         - if group='all' exists, no other group allowed for that class/session
         - if either group '1' or '2' exists and an 'all' exists, block
+        - a room can't hold two lessons at the same time
+        All violated rules are reported together (see conflicts.py).
         """
         super().clean()
+        if not self.day or not self.session or not self.school_class_id:
+            return  # field validation already reports these
+        self.school_id = self.school_class.school_id
+        others = {
+            name: "Must belong to the class's school."
+            for name in ('teacher', 'subject', 'room')
+            if getattr(self, f'{name}_id') and getattr(self, name).school_id != self.school_id
+        }
+        if others:
+            raise ValidationError(others)
+
+        # empty start/end stay empty: readers take them from the bell schedule,
+        # so a schedule change moves the lesson too
+        from .bells import get_table
+
+        sessions = len(get_table(school_id=self.school_id))
+        if self.session > sessions:
+            raise ValidationError({'session': f"The bell schedule has only {sessions} sessions."})
+
+        from .conflicts import Occupancy
+
+        # one query for the whole (day, session), then bitmap checks
+        occupancy = Occupancy.load(self.school_id, day=self.day, session=self.session,
+                                   exclude=[self.pk] if self.pk else ())
+        errors = occupancy.errors(self)
+        if errors:
+            raise ValidationError(errors)
 
-        # fill start/end if not provided using session_times
-        s_time, e_time = session_times(self.session)
-        if not self.start_time:
-            self.start_time = s_time
-        if not self.end_time:
-            self.end_time = e_time
-
-        # Query existing entries for same day/session
-        qs = TimeEntry.objects.filter(day=self.day, session=self.session)
+    def save(self, *args, **kwargs):
+        from .conflicts import lock_for
 
-        # Exclude self when updating
-        if self.pk:
-            qs = qs.exclude(pk=self.pk)
+        # Validate and write in one transaction, holding the class/teacher locks,
+        # so two concurrent edits can't both pass validation for the same slot.
+        with transaction.atomic():
+            lock_for([self])
+            if self.school_class_id:
+                self.school_id = self.school_class.school_id
+            self.full_clean()
+            return super().save(*args, **kwargs)
 
-        # 1) Teacher conflict: teacher can't be in two lessons at the same time
-        teacher_conflict = qs.filter(teacher=self.teacher)
-        if teacher_conflict.exists():
-            raise ValidationError({
-                'teacher': "This teacher is already scheduled for another lesson at this time."
-            })
+    @property
+    def computed_start_end(self):
+        """
+        (start_time, end_time) of the session from the bell schedule, ignoring the
+        stored start/end; (None, None) past the schedule's last session.
+        """
+        from .bells import get_table
 
-        # 2) Class/group logic:
-        class_entries = qs.filter(school_class=self.school_class)
+        table = get_table(school_id=self.school_id)
+        return table.times(self.session) if self.session <= len(table) else (None, None)
 
-        # if there's an 'all' existing, no other entries allowed
-        all_exists = class_entries.filter(group='all').exists()
-        if all_exists:
-            raise ValidationError("This class already has 'all' scheduled at this session; no other groups allowed.")
 
-        # if this new entry is 'all' and any group exists, block it
-        if self.group == 'all' and class_entries.exists():
-            raise ValidationError("Cannot schedule 'all' for this class/session because group split already exists.")
+class BellSchedule(models.Model):
+    """
+    A named bell schedule (normal day, shortened day, exam day...) of one school.
+    Session times follow from the rules below; BellPeriod rows override single sessions.
+    """
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='bell_schedules',
+                               default=school_default)
+    name = models.CharField(max_length=50)
+    is_default = models.BooleanField(default=False)
+    day_start = models.TimeField(default=time(8, 30))
+    lesson_minutes = models.PositiveSmallIntegerField(default=45)
+    short_break_minutes = models.PositiveSmallIntegerField(default=5)
+    long_break_minutes = models.PositiveSmallIntegerField(default=45)
+    long_break_after = models.PositiveSmallIntegerField(default=4)
+    sessions = models.PositiveSmallIntegerField(choices=SESSION_CHOICES, default=8)
+    # bumped on every change, so caches can key on (name, version)
+    version = models.PositiveIntegerField(default=1, editable=False)
 
-        # allow at most 2 group entries for the class at same session
-        # (group entries might be '1' and '2'—so max 2)
-        groups_count = class_entries.count()
-        if groups_count >= 2:
-            raise ValidationError("This class already has 2 group lessons at this session.")
+    class Meta:
+        ordering = ['name']
+        unique_together = ('school', 'name')
 
-        # If there's 1 group already and it's same group as this one, block duplicate
-        if class_entries.filter(group=self.group).exists():
-            raise ValidationError(f"Group '{self.get_group_display()}' for this class is already scheduled at this session.")
+    def __str__(self):
+        return f"{self.name} (v{self.version})"
 
     def save(self, *args, **kwargs):
-        # Run full_clean to ensure validation fires on save
-        self.full_clean()
-        # Wrap in transaction to reduce race conditions when many concurrent writes
+        if self.pk:
+            self.version += 1
         with transaction.atomic():
+            if self.is_default:
+                # only one default schedule per school
+                (BellSchedule.objects.filter(school_id=self.school_id, is_default=True)
+                 .exclude(pk=self.pk).update(is_default=False))
             return super().save(*args, **kwargs)
 
-    @property
-    def computed_start_end(self):
-        """Return computed (start_time, end_time) tuple based on session index (ignores stored start/end)."""
-        return session_times(self.session)
+
+class BellPeriod(models.Model):
+    """Explicit start/end for one session of a schedule."""
+    schedule = models.ForeignKey(BellSchedule, on_delete=models.CASCADE, related_name='periods')
+    session = models.PositiveSmallIntegerField(choices=SESSION_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['schedule', 'session']
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'session'], name='unique_period_per_schedule_session')
+        ]
+
+    def __str__(self):
+        return f"{self.schedule.name} {self.session}: {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+    def clean(self):
+        super().clean()
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError("Session must end after it starts.")
+
+
+class TimetableVersion(models.Model):
+    """
+    An immutable snapshot of a school's whole week (see versions.py).
+    The live week is TimeEntry; publishing a version writes it there.
+    """
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('published', 'Published'),
+        ('archived', 'Archived'),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='timetable_versions',
+                               default=school_default)
+    number = models.PositiveIntegerField(editable=False)  # 1, 2, ... per school
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft', editable=False)
+    note = models.CharField(max_length=200, blank=True)
+    # [[day, session, class id, group, subject id, teacher id, room id, 'HH:MM' or None, ...], ...]
+    rows = models.JSONField(default=list, editable=False)
+    entry_count = models.PositiveIntegerField(default=0, editable=False)  # len(rows), without loading them
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # what was live before this version was first published: the target of a rollback
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, related_name='+',
+                                 null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['school', '-number']
+        constraints = [
+            models.UniqueConstraint(fields=['school', 'number'], name='unique_version_number_per_school'),
+            models.UniqueConstraint(fields=['school'], condition=models.Q(status='published'),
+                                    name='one_published_version_per_school'),
+        ]
+
+    def __str__(self):
+        return f"v{self.number} ({self.get_status_display()})"
+
+
+class CalendarDay(models.Model):
+    """
+    A date that differs from the usual week (see calendar.py): a holiday, a day on
+    another bell schedule (shortened or exam day), or a day that runs another weekday's lessons.
+    """
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='calendar_days',
+                               default=school_default)
+    date = models.DateField()
+    closed = models.BooleanField(default=False)  # no lessons at all
+    schedule = models.ForeignKey(BellSchedule, on_delete=models.SET_NULL, related_name='+',
+                                 null=True, blank=True)
+    follows = models.CharField(max_length=3, choices=DAY_CHOICES, blank=True)  # e.g. a Saturday make-up day
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ('school', 'date')
+
+    def __str__(self):
+        return f"{self.date}: {self.note or ('closed' if self.closed else 'special day')}"
+
+    def clean(self):
+        super().clean()
+        if self.schedule_id and self.schedule.school_id != self.school_id:
+            raise ValidationError({'schedule': "Must belong to the same school."})
+
+
+class LessonChange(models.Model):
+    """
+    One lesson slot that differs on a date, or in every A or B week: the lesson is
+    cancelled, or taught by another teacher / in another subject or room, or added.
+    """
+    WEEK_CHOICES = [
+        ('A', 'Week A'),
+        ('B', 'Week B'),
+    ]
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='lesson_changes', editable=False)
+    # either a date, or a rotation week and a weekday
+    date = models.DateField(null=True, blank=True)
+    week = models.CharField(max_length=1, choices=WEEK_CHOICES, blank=True)
+    day = models.CharField(max_length=3, choices=DAY_CHOICES, blank=True)
+    session = models.PositiveSmallIntegerField(choices=SESSION_CHOICES)
+    school_class = models.ForeignKey('Class', on_delete=models.CASCADE, related_name='lesson_changes')
+    group = models.CharField(max_length=3, choices=GROUP_CHOICES, default='all')
+    cancelled = models.BooleanField(default=False)
+    # replacements; blank keeps the regular lesson's
+    subject = models.ForeignKey('Subject', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    teacher = models.ForeignKey('Teacher', on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    room = models.ForeignKey('Room', on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    note = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['date', 'week', 'day', 'session']
+        constraints = [
+            models.UniqueConstraint(fields=['school', 'date', 'session', 'school_class', 'group'],
+                                    condition=models.Q(date__isnull=False), name='unique_change_per_date_slot'),
+            models.UniqueConstraint(fields=['school', 'week', 'day', 'session', 'school_class', 'group'],
+                                    condition=models.Q(date__isnull=True), name='unique_change_per_week_slot'),
+        ]
+
+    def __str__(self):
+        when = self.date or f"{self.get_week_display()} {self.get_day_display()}"
+        what = "cancelled" if self.cancelled else "changed"
+        return f"{when} {self.session} - {self.school_class} ({self.group}) {what}"
+
+    def clean(self):
+        super().clean()
+        if bool(self.date) == bool(self.week):
+            raise ValidationError("Give either a date or a rotation week.")
+        if self.week and not self.day:
+            raise ValidationError({'day': "A rotation week change needs a weekday."})
+        if not self.school_class_id:
+            return
+        self.school_id = self.school_class.school_id
+        others = {
+            name: "Must belong to the class's school."
+            for name in ('teacher', 'subject', 'room')
+            if getattr(self, f'{name}_id') and getattr(self, name).school_id != self.school_id
+        }
+        if others:
+            raise ValidationError(others)
+        if self.cancelled and (self.subject_id or self.teacher_id or self.room_id):
+            raise ValidationError("A cancelled lesson has no replacement subject, teacher or room.")
+        if self.teacher_id and self._teacher_busy():
+            raise ValidationError({'teacher': "Already teaching another class in this session."})
+        clash = self._group_clash()
+        if clash:
+            raise ValidationError(clash)
+
+    def _runs_on(self):
+        """(weekday, rotation week) the change applies to; weekday None on a closed date."""
+        from .calendar import calendar
+
+        if self.date:
+            # closed days, days following another weekday and the rotation week
+            plan = calendar.of(self.school_id).plan(self.date)
+            return plan.day, plan.week
+        return self.day, self.week
+
+    def _session_changes(self, day, week, **filters):
+        """The changes of the session in force when this one is, by (class id, group); the date's own win."""
+        when = models.Q(date__isnull=True, week=week, day=day)
+        if self.date:
+            when |= models.Q(date=self.date)
+        changes = LessonChange.objects.filter(when, school_id=self.school_id, session=self.session, **filters)
+        slots = {}
+        for change in sorted(changes, key=lambda c: c.date is not None):
+            slots[(change.school_class_id, change.group)] = change
+        return slots
+
+    def _group_clash(self):
+        """For an added lesson: the all-vs-group rule of conflicts.Occupancy against the slot as it runs."""
+        from .conflicts import group_clash
+
+        if self.cancelled or not (self.subject_id and self.teacher_id):
+            return None
+        day, week = self._runs_on()
+        if day is None:
+            return None
+        regular = set(TimeEntry.objects.filter(school_class_id=self.school_class_id, day=day, session=self.session)
+                      .values_list('group', flat=True))
+        if self.group in regular:
+            return None  # changes a regular lesson, adds none
+        changes = {group: c for (_, group), c in
+                   self._session_changes(day, week, school_class_id=self.school_class_id).items()
+                   if group != self.group}
+        running = {g for g in regular if not getattr(changes.get(g), 'cancelled', False)}
+        running |= {g for g, c in changes.items()
+                    if g not in regular and not c.cancelled and c.subject_id and c.teacher_id}
+        return group_clash(self.group, running)
+
+    def _teacher_busy(self):
+        """Whether the teacher teaches another class in the session, as the date (or week) runs."""
+        day, week = self._runs_on()
+        if day is None:
+            return False
+        slots = {key: c for key, c in self._session_changes(day, week).items()
+                 if key[0] != self.school_class_id}
+        if any(c.teacher_id == self.teacher_id and not c.cancelled for c in slots.values()):
+            return True
+        entries = (TimeEntry.objects.filter(teacher_id=self.teacher_id, day=day, session=self.session)
+                   .exclude(school_class_id=self.school_class_id))
+        for slot in entries.values_list('school_class_id', 'group'):
+            change = slots.get(slot)
+            if change is None or not (change.cancelled or change.teacher_id):
+                return True
+        return False
+
+    def save(self, *args, **kwargs):
+        self.school_id = self.school_class.school_id
+        return super().save(*args, **kwargs)
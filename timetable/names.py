@@ -0,0 +1,39 @@
+"""
+Name normalization for pupil search.
+
+Pupil names are typed in Uzbek Latin, Uzbek Cyrillic or Russian-style Latin
+("Xakimov", "Хакимов", "Khakimov"). normalize() maps all of these to one ASCII
+form so they can be compared with a plain indexed equality or prefix lookup.
+"""
+import re
+import unicodedata
+
+# Uzbek Cyrillic -> Uzbek Latin (1995 alphabet), applied after casefold()
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': "g'", 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'қ': 'q', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ў': "o'",
+    'ф': 'f', 'х': 'x', 'ҳ': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '',
+    'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+_TRANSLIT = str.maketrans(CYRILLIC_TO_LATIN)
+
+# oʻ / gʻ are written with any of these; the key drops them all
+_APOSTROPHES = str.maketrans('', '', "'`ʻʼ‘’´")
+_SEPARATORS = re.compile(r'[\s\-_.]+')
+_FOLDS = (('kh', 'x'),)
+
+
+def normalize(text):
+    """Casefold, transliterate Cyrillic, strip diacritics and apostrophes."""
+    # apostrophes first: NFKD would split ´ into a space and a combining accent
+    text = (text or '').casefold().translate(_TRANSLIT).translate(_APOSTROPHES)
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    for a, b in _FOLDS:
+        text = text.replace(a, b)
+    return _SEPARATORS.sub(' ', text).strip()
+
+
+def pupil_search_key(first_name, last_name):
+    return f"{normalize(first_name)} {normalize(last_name)}"
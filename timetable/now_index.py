@@ -0,0 +1,196 @@
+import threading
+
+from asgiref.sync import sync_to_async
+
+from .models import Pupil, TimeEntry
+from .names import pupil_search_key
+from .routers import use_replicas
+from .schools import PerSchool
+
+
+def format_entry(e):
+    """Turn a TimeEntry into the dict rendered by pupil_results.html."""
+    start = e.start_time or e.computed_start_end[0]
+    end = e.end_time or e.computed_start_end[1]
+    return {
+        'subject': str(e.subject),
+        'teacher': str(e.teacher),
+        'group': e.get_group_display(),
+        'group_code': e.group,
+        'start': start.strftime("%H:%M") if start else '',
+        'end': end.strftime("%H:%M") if end else '',
+    }
+
+
+class NowIndex:
+    """
+    Process-wide "who is where now" index of one school, used by pupil_now.
+
+    slots:  (day, session, class_id)     -> tuple of formatted entries, ordered by group
+    pupils: Pupil.search_key             -> tuple of pupil rows
+
+    The index is built lazily on first use and then patched from model signals
+    (see timetable/signals.py), so steady-state lookups never hit the database.
+    Each process keeps its own copy; a signal only patches the process it fires in.
+    """
+
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self._lock = threading.RLock()
+        self._built = False
+        self._slots = {}
+        self._entry_slot = {}   # entry id -> (slot key, formatted entry)
+        self._pupils = {}
+        self._pupil_key = {}    # pupil id -> name key
+
+    # --- building ---
+
+    @use_replicas(False)
+    def rebuild(self):
+        slots = {}
+        entry_slot = {}
+        for e in TimeEntry.objects.filter(school_id=self.school_id).select_related('subject', 'teacher'):
+            key = (e.day, e.session, e.school_class_id)
+            row = format_entry(e)
+            slots.setdefault(key, []).append(row)
+            entry_slot[e.pk] = (key, row)
+
+        pupils = {}
+        pupil_key = {}
+        for p in Pupil.objects.filter(school_id=self.school_id).select_related('school_class'):
+            key = pupil_search_key(p.first_name, p.last_name)
+            pupils.setdefault(key, []).append(self._pupil_row(p))
+            pupil_key[p.pk] = key
+
+        with self._lock:
+            self._slots = {k: self._sorted(v) for k, v in slots.items()}
+            self._entry_slot = entry_slot
+            self._pupils = {k: tuple(v) for k, v in pupils.items()}
+            self._pupil_key = pupil_key
+            self._built = True
+
+    def invalidate(self):
+        """Drop everything; the next lookup rebuilds from the database."""
+        with self._lock:
+            self._built = False
+            self._slots = {}
+            self._entry_slot = {}
+            self._pupils = {}
+            self._pupil_key = {}
+
+    def _ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.rebuild()
+
+    def _pupil_table(self):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+            return self._pupils
+
+    async def aensure_built(self):
+        """
+        For async views: build in a worker thread, so the event loop never waits on queries.
+        Returns the pupil table for `match_pupils`, which a later invalidation cannot send back to the database.
+        """
+        with self._lock:
+            if self._built:
+                return self._pupils
+        return await sync_to_async(self._pupil_table)()
+
+    @staticmethod
+    def _sorted(rows):
+        return tuple(sorted(rows, key=lambda r: r['group_code']))
+
+    @staticmethod
+    def _pupil_row(p):
+        return {
+            'id': p.pk,
+            'first_name': p.first_name,
+            'last_name': p.last_name,
+            'class_id': p.school_class_id,
+            'class': str(p.school_class),
+            'group': p.group,
+        }
+
+    # --- incremental patches ---
+
+    def _drop_entry(self, pk):
+        old = self._entry_slot.pop(pk, None)
+        if old is None:
+            return
+        key, row = old
+        rest = tuple(r for r in self._slots.get(key, ()) if r is not row)
+        if rest:
+            self._slots[key] = rest
+        else:
+            self._slots.pop(key, None)
+
+    def update_entry(self, entry):
+        with self._lock:
+            if not self._built:
+                return
+            self._drop_entry(entry.pk)
+            key = (entry.day, entry.session, entry.school_class_id)
+            row = format_entry(entry)
+            self._slots[key] = self._sorted(self._slots.get(key, ()) + (row,))
+            self._entry_slot[entry.pk] = (key, row)
+
+    def remove_entry(self, pk):
+        with self._lock:
+            if self._built:
+                self._drop_entry(pk)
+
+    def _drop_pupil(self, pk):
+        key = self._pupil_key.pop(pk, None)
+        if key is None:
+            return
+        rest = tuple(r for r in self._pupils.get(key, ()) if r['id'] != pk)
+        if rest:
+            self._pupils[key] = rest
+        else:
+            self._pupils.pop(key, None)
+
+    def update_pupil(self, pupil):
+        with self._lock:
+            if not self._built:
+                return
+            self._drop_pupil(pupil.pk)
+            key = pupil_search_key(pupil.first_name, pupil.last_name)
+            self._pupils[key] = self._pupils.get(key, ()) + (self._pupil_row(pupil),)
+            self._pupil_key[pupil.pk] = key
+
+    def remove_pupil(self, pk):
+        with self._lock:
+            if self._built:
+                self._drop_pupil(pk)
+
+    # --- lookups ---
+
+    def find_pupils(self, first, last):
+        self._ensure_built()
+        return match_pupils(self._pupils, first, last)
+
+    def pupil(self, pk):
+        """A pupil's row (class and group), or None."""
+        self._ensure_built()
+        return next((r for r in self._pupils.get(self._pupil_key.get(pk), ()) if r['id'] == pk), None)
+
+    def lessons(self, day, session, class_id):
+        self._ensure_built()
+        return self._slots.get((day, session, class_id), ())
+
+    def pupil_slots(self):
+        """Every (class id, group) some pupil is in: what lesson lookups are keyed on."""
+        self._ensure_built()
+        return {(r['class_id'], r['group']) for rows in list(self._pupils.values()) for r in rows}
+
+
+def match_pupils(pupils, first, last):
+    """NowIndex.find_pupils over a table returned by NowIndex.aensure_built; never queries."""
+    return pupils.get(pupil_search_key(first, last), ())
+
+
+now_index = PerSchool(NowIndex)
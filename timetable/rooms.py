@@ -0,0 +1,156 @@
+"""
+Room allocation for a whole week.
+
+Every (day, session) is a bipartite matching of its lessons to the school's
+rooms. A lesson can use a room that seats its audience (the pupils of the
+class, or of the group for a split lesson) and is of the kind its subject
+needs (Subject.room_kind; blank means any room, classrooms first). Slots are
+independent, so the week is 40 small matchings on plain ints, loaded with one
+query each for the lessons, the rooms and the audience sizes.
+
+In each slot the lessons with the fewest usable rooms go first and take the
+best free room: the right kind, then the fewest empty seats. Lessons left
+without a room then look for an augmenting path (Kuhn's algorithm), which moves
+placed lessons to other rooms. The result is a maximum matching, so a lesson
+that still has no room could not get one in any assignment.
+"""
+import time as _time
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Pupil, Room, TimeEntry
+from .schools import current_school_id
+from .signals import timetable_changed
+
+# Subject.room_kind of new subjects created without one (Subject.save)
+SUBJECT_ROOM_KINDS = {'physics': 'lab', 'chemistry': 'lab', 'biology': 'lab', 'it': 'it'}
+GENERAL_KIND = 'classroom'
+
+
+@dataclass
+class AllocationReport:
+    assigned: int = 0
+    kept: int = 0
+    unassigned: list = field(default_factory=list)  # [(TimeEntry, audience size), ...]
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return not self.unassigned
+
+
+def audience_sizes(school_id):
+    """{(class_id, group): pupils} of a school; group 'all' is the whole class."""
+    sizes = {}
+    rows = (Pupil.objects.filter(school_id=school_id).order_by()
+            .values_list('school_class_id', 'group').annotate(n=Count('pk')))
+    for class_id, group, n in rows:
+        sizes[(class_id, 'all')] = sizes.get((class_id, 'all'), 0) + n
+        if group:
+            sizes[(class_id, group)] = n
+    return sizes
+
+
+def room_options(kind, size, rooms, kinds):
+    """
+    Ids of the rooms (pk, kind, capacity) a lesson of `size` pupils needing `kind`
+    can use, best first. A kind the school has no room of is not enforced.
+    """
+    strict = kind in kinds
+    preferred = kind or GENERAL_KIND
+    usable = sorted(
+        (room_kind != preferred, capacity - size, pk)
+        for pk, room_kind, capacity in rooms
+        if capacity >= size and (not strict or room_kind == kind)
+    )
+    return [pk for _, _, pk in usable]
+
+
+def match(options, taken=()):
+    """
+    Maximum matching of lessons to rooms: options[i] lists the rooms lesson i can
+    use, best first; rooms in `taken` are held already. Returns a room id or None per lesson.
+    """
+    owner = dict.fromkeys(taken, -1)
+    assigned = [None] * len(options)
+    order = sorted(range(len(options)), key=lambda i: len(options[i]))
+    for i in order:
+        for room in options[i]:
+            if room not in owner:
+                owner[room] = i
+                assigned[i] = room
+                break
+    for i in order:
+        if assigned[i] is None and options[i]:
+            _augment(i, options, owner, assigned, set())
+    return assigned
+
+
+def _augment(i, options, owner, assigned, seen):
+    for room in options[i]:
+        if room in seen:
+            continue
+        seen.add(room)
+        j = owner.get(room)
+        if j is None or (j >= 0 and _augment(j, options, owner, assigned, seen)):
+            owner[room] = i
+            assigned[i] = room
+            return True
+    return False
+
+
+def allocate(school_id=None, replace=False, dry_run=False):
+    """
+    Give every lesson of a school's week a room; returns an AllocationReport.
+    Lessons that have a room keep it unless `replace` is set.
+    """
+    school_id = school_id or current_school_id()
+    started = _time.perf_counter()
+    report = AllocationReport()
+    with transaction.atomic():
+        rooms = list(Room.objects.filter(school_id=school_id).values_list('pk', 'kind', 'capacity'))
+        kinds = {kind for _, kind, _ in rooms}
+        sizes = audience_sizes(school_id)
+        entries = TimeEntry.objects.filter(school_id=school_id).select_related('school_class', 'subject')
+        slots = {}
+        for e in entries:
+            slots.setdefault((e.day, e.session), []).append(e)
+
+        changed = []
+        options = {}  # (kind, size) -> room ids; most lessons share a few of these
+        for slot_entries in slots.values():
+            taken, pending = set(), []
+            for e in slot_entries:
+                if e.room_id is not None and not replace:
+                    taken.add(e.room_id)
+                    report.kept += 1
+                else:
+                    pending.append((e, (e.subject.room_kind, sizes.get((e.school_class_id, e.group), 0))))
+            for _, key in pending:
+                if key not in options:
+                    options[key] = room_options(*key, rooms, kinds)
+            found = match([options[key] for _, key in pending], taken)
+            for (e, (_, size)), room_id in zip(pending, found):
+                if room_id is None:
+                    report.unassigned.append((e, size))
+                else:
+                    report.assigned += 1
+                if room_id != e.room_id:
+                    e.room_id = room_id
+                    changed.append(e)
+
+        if changed and not dry_run:
+            # one UPDATE per room: much faster than bulk_update's CASE over thousands of rows
+            by_room = {}
+            for e in changed:
+                by_room.setdefault(e.room_id, []).append(e.pk)
+            for room_id, pks in by_room.items():
+                for start in range(0, len(pks), 500):
+                    TimeEntry.objects.filter(pk__in=pks[start:start + 500]).update(room_id=room_id)
+            # update() skips post_save, so the caches have to be told directly
+            transaction.on_commit(partial(timetable_changed, school_id))
+    report.seconds = _time.perf_counter() - started
+    return report
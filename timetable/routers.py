@@ -0,0 +1,64 @@
+"""
+Read replica routing.
+
+Everything reads and writes on the primary ('default'), except code running
+under use_replicas() (views: @replica_reads): the read-only pupil lookup and the simulator, whose
+reads go to one of settings.TIMETABLE_READ_REPLICAS. A replica may lag the
+primary by a moment, which those pages can live with; admin pages and every
+write stay on the primary. Without replicas this router changes nothing.
+"""
+import functools
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+_replica_reads = ContextVar('timetable_replica_reads', default=False)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """
+    Context manager or decorator of sync functions: reads inside may (or,
+    with enabled=False, may not) go to a replica. The shared in-process caches load with
+    enabled=False, since a snapshot taken from a lagging replica right after
+    an invalidation would be kept until the next change.
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view):
+    """View decorator, sync or async: the view's reads may go to a replica."""
+    if iscoroutinefunction(view):
+        async def wrapper(request, *args, **kwargs):
+            with use_replicas():
+                return await view(request, *args, **kwargs)
+    else:
+        def wrapper(request, *args, **kwargs):
+            with use_replicas():
+                return view(request, *args, **kwargs)
+    return functools.wraps(view)(wrapper)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'TIMETABLE_READ_REPLICAS', ())
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
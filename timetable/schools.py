@@ -0,0 +1,197 @@
+"""
+Schools (tenants).
+
+Every Class, Teacher, Subject, Pupil, TimeEntry and BellSchedule belongs to a
+School. SchoolMiddleware resolves the school of a request from an X-School
+header or the first label of the host name (<slug>.timetable.example), and
+falls back to the default school (settings.TIMETABLE_DEFAULT_SCHOOL). The id
+is kept in a ContextVar for the rest of the request; code running outside a
+request (commands, shell) gets the default school unless it uses use_school().
+
+The process-wide caches (now index, grids, timeline, ...) are kept per school
+with PerSchool, so each school's lookups only ever see its own rows and cost
+the same however many schools share the deployment.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.http import Http404
+
+_current = ContextVar('timetable_school', default=None)
+_lock = threading.Lock()
+_slugs = None        # slug -> school id
+_default_id = None
+
+
+def default_slug():
+    return getattr(settings, 'TIMETABLE_DEFAULT_SCHOOL', 'default')
+
+
+def invalidate():
+    """Forget the cached slugs; called from signals when a School changes."""
+    global _slugs, _default_id
+    with _lock:
+        _slugs = None
+        _default_id = None
+
+
+def school_id_for(slug):
+    global _slugs
+    slugs = _slugs
+    if slugs is None:
+        from .models import School
+
+        slugs = dict(School.objects.values_list('slug', 'pk'))
+        with _lock:
+            _slugs = slugs
+    return slugs.get(slug)
+
+
+def school_id_or_error(slug):
+    """Id of the school with `slug` (None: the default one), for management commands."""
+    from django.core.management.base import CommandError
+
+    if slug is None:
+        return default_school_id()
+    school_id = school_id_for(slug)
+    if school_id is None:
+        raise CommandError(f"Unknown school '{slug}'.")
+    return school_id
+
+
+def ensure_default_school():
+    """Id of the default school, creating it if needed."""
+    global _default_id
+    from .models import School
+
+    # Migration 0012 calls this (field defaults) before School's newest columns exist,
+    # so only the pk is read and a missing school is inserted with the columns 0012 made.
+    alias = router.db_for_write(School)
+    schools = School.objects.using(alias).filter(slug=default_slug()).values_list('pk', flat=True)
+    pk = schools.first()
+    if pk is None:
+        connection = connections[alias]
+        table, name, slug = (connection.ops.quote_name(n) for n in (School._meta.db_table, 'name', 'slug'))
+        try:
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {table} ({name}, {slug}) VALUES (%s, %s)",
+                               ["Default school", default_slug()])
+        except IntegrityError:
+            pass  # created by a concurrent request
+        pk = schools.get()
+    _default_id = pk
+    return pk
+
+
+def default_school_id():
+    return _default_id or ensure_default_school()
+
+
+def current_school_id():
+    """The school of the running request, or the default school."""
+    return _current.get() or default_school_id()
+
+
+def school_default():
+    """Field default for new rows: the current school."""
+    # checked against the database: a cached id may belong to a rolled back transaction
+    return _current.get() or ensure_default_school()
+
+
+@contextmanager
+def use_school(school):
+    """Run a block as `school` (a School or its id)."""
+    token = _current.set(getattr(school, 'pk', school))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class PerSchool:
+    """
+    One instance of a process-wide cache per school, created on first use.
+    Attribute access goes to the current school's instance, so
+    `now_index.lessons(...)` reads like a module singleton; use .of(id) for
+    another school (signals do, with the changed row's school).
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._instances = {}
+
+    def of(self, school_id):
+        instance = self._instances.get(school_id)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(school_id)
+                if instance is None:
+                    instance = self._instances[school_id] = self._factory(school_id)
+        return instance
+
+    def all(self):
+        return list(self._instances.values())
+
+    def __getattr__(self, name):
+        return getattr(self.of(current_school_id()), name)
+
+
+def _resolve(request):
+    slug = request.headers.get('X-School')
+    if slug:
+        school_id = school_id_for(slug)
+        if school_id is None:
+            raise Http404(f"Unknown school '{slug}'.")
+        return school_id
+    labels = request.get_host().split(':')[0].split('.')
+    # a subdomain names the school; bare hosts (localhost, an IP) don't
+    school_id = school_id_for(labels[0]) if len(labels) > 2 else None
+    return school_id or default_school_id()
+
+
+def _preload():
+    school_id_for(default_slug())
+    default_school_id()
+
+
+class SchoolMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from .fragments import check_version
+
+        request.school_id = _resolve(request)
+        # another process may have changed the timetable (see fragments.py)
+        check_version(request.school_id)
+        token = _current.set(request.school_id)
+        try:
+            return self.get_response(request)
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        # slugs and the default school are loaded once per process; only then is there a query
+        if _slugs is None or _default_id is None:
+            await sync_to_async(_preload)()
+        from .fragments import acheck_version
+
+        request.school_id = _resolve(request)
+        await acheck_version(request.school_id)
+        token = _current.set(request.school_id)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current.reset(token)
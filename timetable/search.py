@@ -0,0 +1,130 @@
+"""
+In-memory typeahead index over pupil names.
+
+Every token of every normalized name goes into one sorted list, so a prefix
+query is two bisects per typed word. When nothing matches by prefix (typos,
+missing letters), a trigram index gives fuzzy candidates ranked by shared
+trigrams. Like the now-index it is built lazily and dropped from signals.
+"""
+import threading
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+
+from .models import Pupil
+from .names import normalize
+from .routers import use_replicas
+from .schools import PerSchool
+
+MIN_QUERY = 2
+MAX_RESULTS = 20
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PupilSearchIndex:
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self._lock = threading.Lock()
+        self._built = False
+        self._generation = 0
+        self._rows = []      # idx -> dict returned to clients
+        self._keys = []      # idx -> normalized "first last"
+        self._tokens = []    # sorted [(token, idx), ...]
+        self._trigrams = None  # trigram -> [idx, ...], built lazily
+
+    @use_replicas(False)
+    def rebuild(self):
+        generation = self._generation
+        rows, keys, tokens = [], [], []
+        pupils = (Pupil.objects.filter(school_id=self.school_id).order_by('last_name', 'first_name', 'pk')
+                  .values_list('pk', 'first_name', 'last_name', 'search_key',
+                               'school_class__number', 'school_class__letter'))
+        for idx, (pk, first, last, key, number, letter) in enumerate(pupils):
+            rows.append({'id': pk, 'name': f"{first} {last}", 'class': f"{number}{letter}"})
+            key = key or normalize(f"{first} {last}")
+            keys.append(key)
+            for token in set(key.split()):
+                tokens.append((token, idx))
+        tokens.sort()
+        with self._lock:
+            # not kept if pupils changed while it was read
+            if generation == self._generation:
+                self._rows, self._keys, self._tokens, self._trigrams = rows, keys, tokens, None
+                self._built = True
+        return rows, keys, tokens
+
+    def _trigram_index(self, keys):
+        # only needed when a prefix search finds nothing, so built on first use
+        trigrams = {}
+        for idx, key in enumerate(keys):
+            for token in set(key.split()):
+                for tri in _trigrams(token):
+                    trigrams.setdefault(tri, []).append(idx)
+        with self._lock:
+            if self._keys is keys:
+                self._trigrams = trigrams
+        return trigrams
+
+    def invalidate(self):
+        with self._lock:
+            self._built = False
+            self._generation += 1
+            self._rows, self._keys, self._tokens, self._trigrams = [], [], [], None
+
+    def _prefix(self, tokens, prefix):
+        i = bisect_left(tokens, (prefix,))
+        found = set()
+        while i < len(tokens) and tokens[i][0].startswith(prefix):
+            found.add(tokens[i][1])
+            i += 1
+        return found
+
+    def _fuzzy(self, trigrams_index, words):
+        scores = {}
+        wanted = set()
+        for word in words:
+            wanted |= _trigrams(word)
+        for tri in wanted:
+            for idx in trigrams_index.get(tri, ()):
+                scores[idx] = scores.get(idx, 0) + 1
+        threshold = max(2, len(wanted) // 2)
+        return sorted((idx for idx, n in scores.items() if n >= threshold),
+                      key=lambda idx: -scores[idx])
+
+    async def aensure_built(self):
+        """For async views: build in a worker thread, so the event loop never waits on queries."""
+        if not self._built:
+            await sync_to_async(self.rebuild)()
+
+    def search(self, query, limit=10):
+        """Pupils whose name words start with the typed words, best matches first."""
+        words = normalize(query).split()
+        if not words or len(''.join(words)) < MIN_QUERY:
+            return []
+        # take one consistent view of the structures
+        rows, keys, tokens, trigrams = self._rows, self._keys, self._tokens, self._trigrams
+        if not self._built:
+            (rows, keys, tokens), trigrams = self.rebuild(), None
+
+        found = None
+        for word in words:
+            matches = self._prefix(tokens, word)
+            found = matches if found is None else found & matches
+            if not found:
+                break
+        phrase = ' '.join(words)
+        if found:
+            # whole-name prefix first, then alphabetical (idx order)
+            ranked = sorted(found, key=lambda idx: (not keys[idx].startswith(phrase), idx))
+        else:
+            if trigrams is None:
+                trigrams = self._trigram_index(keys)
+            ranked = self._fuzzy(trigrams, words)
+        return [rows[idx] for idx in ranked[:min(limit, MAX_RESULTS)]]
+
+
+pupil_search = PerSchool(PupilSearchIndex)
@@ -0,0 +1,183 @@
+"""
+Cache upkeep from model signals.
+
+Every in-process cache (now index, grids, timeline, teacher book, calendar,
+bell tables, pupil search) is patched or dropped only once the change is
+committed: a signal queues the work with transaction.on_commit(), so a
+rolled back transaction leaves the caches alone and a reader that rebuilt a
+cache from the old rows in between is dropped by the invalidation that follows
+(the caches keep a generation and don't store a build that straddled one).
+Each change also bumps the school's timetable version, which tells the other
+processes to drop their copies (see fragments.py).
+"""
+from copy import copy
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import bells, changelist, fragments, grids, schools
+from .broadcast import broadcaster
+from .calendar import calendar
+from .models import (BellPeriod, BellSchedule, CalendarDay, Class, LessonChange, Pupil, School, Subject,
+                     Teacher, TimeEntry)
+from .now_index import now_index
+from .search import pupil_search
+from .substitutes import teacher_book
+from .timeline import timeline
+
+
+def timetable_changed(school_id=None):
+    """
+    Drop every cache derived from a school's timetable (None: every school);
+    for bulk writes that bypass signals, which call it from transaction.on_commit().
+    """
+    school_ids = [school_id] if school_id is not None else list(School.objects.values_list('pk', flat=True))
+    for school_id in school_ids:
+        now_index.of(school_id).invalidate()
+        _entries_changed(school_id)
+
+
+def _derived_changed(school_id):
+    calendar.of(school_id).invalidate()  # its plans memoize lessons
+    changelist.boundaries.clear()  # page boundaries of the admin lists of every school
+    grids.invalidate(school_id)
+    timeline.of(school_id).invalidate()
+    teacher_book.of(school_id).invalidate()
+    broadcaster.of(school_id).notify_changed()
+
+
+def _entries_changed(school_id):
+    _derived_changed(school_id)
+    fragments.bump_version(school_id)
+
+
+def drop_local_caches(school_id):
+    """
+    Drop every in-process cache of a school without bumping its version;
+    fragments calls it when another process has changed the school's timetable.
+    """
+    bells.invalidate(school_id)
+    now_index.of(school_id).invalidate()
+    pupil_search.of(school_id).invalidate()
+    _derived_changed(school_id)
+
+
+def _after_commit(fn, *args):
+    transaction.on_commit(partial(fn, *args))
+
+
+def _entry_saved(entry):
+    now_index.of(entry.school_id).update_entry(entry)
+    _entries_changed(entry.school_id)
+
+
+def _entry_deleted(school_id, pk):
+    now_index.of(school_id).remove_entry(pk)
+    _entries_changed(school_id)
+
+
+@receiver(post_save, sender=TimeEntry)
+def time_entry_saved(sender, instance, **kwargs):
+    # a copy: the instance may still change before the commit
+    _after_commit(_entry_saved, copy(instance))
+
+
+@receiver(post_delete, sender=TimeEntry)
+def time_entry_deleted(sender, instance, **kwargs):
+    _after_commit(_entry_deleted, instance.school_id, instance.pk)
+
+
+def _pupil_saved(pupil):
+    now_index.of(pupil.school_id).update_pupil(pupil)
+    pupil_search.of(pupil.school_id).invalidate()
+    fragments.bump_version(pupil.school_id)  # for the other processes' indexes
+
+
+def _pupil_deleted(school_id, pk):
+    now_index.of(school_id).remove_pupil(pk)
+    pupil_search.of(school_id).invalidate()
+    fragments.bump_version(school_id)
+
+
+@receiver(post_save, sender=Pupil)
+def pupil_saved(sender, instance, **kwargs):
+    _after_commit(_pupil_saved, copy(instance))
+
+
+@receiver(post_delete, sender=Pupil)
+def pupil_deleted(sender, instance, **kwargs):
+    _after_commit(_pupil_deleted, instance.school_id, instance.pk)
+
+
+# Class/Teacher/Subject names are baked into many index rows; renames are rare,
+# so just drop the school's indexes and let the next lookup rebuild them.
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def reference_changed(sender, instance, **kwargs):
+    _after_commit(timetable_changed, instance.school_id)
+    if sender is Class:
+        # class labels are part of the results
+        _after_commit(pupil_search.of(instance.school_id).invalidate)
+
+
+def _qualifications_changed(school_id):
+    teacher_book.of(school_id).invalidate()
+    fragments.bump_version(school_id)
+
+
+@receiver(m2m_changed, sender=Teacher.subjects.through)
+def qualifications_changed(sender, instance, **kwargs):
+    _after_commit(_qualifications_changed, instance.school_id)
+
+
+def _bells_changed(school_id):
+    bells.invalidate(school_id)
+    timetable_changed(school_id)
+
+
+@receiver(post_save, sender=BellPeriod)
+@receiver(post_delete, sender=BellPeriod)
+def bell_period_changed(sender, instance, **kwargs):
+    schedules = BellSchedule.objects.filter(pk=instance.schedule_id)
+    schedules.update(version=F('version') + 1)
+    school_id = schedules.values_list('school_id', flat=True).first()
+    _after_commit(_bells_changed, school_id)
+
+
+@receiver(post_save, sender=BellSchedule)
+@receiver(post_delete, sender=BellSchedule)
+def bell_schedule_changed(sender, instance, **kwargs):
+    _after_commit(_bells_changed, instance.school_id)
+
+
+def _school_changed(school_id):
+    schools.invalidate()
+    calendar.of(school_id).invalidate()  # rotation_start
+    fragments.bump_version(school_id)
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def school_changed(sender, instance, **kwargs):
+    _after_commit(_school_changed, instance.pk)
+
+
+def _calendar_changed(school_id):
+    calendar.of(school_id).invalidate()
+    broadcaster.of(school_id).notify_changed()
+    fragments.bump_version(school_id)
+
+
+@receiver(post_save, sender=CalendarDay)
+@receiver(post_delete, sender=CalendarDay)
+@receiver(post_save, sender=LessonChange)
+@receiver(post_delete, sender=LessonChange)
+def calendar_changed(sender, instance, **kwargs):
+    _after_commit(_calendar_changed, instance.school_id)
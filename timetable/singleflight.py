@@ -0,0 +1,71 @@
+"""
+Single-flight: concurrent calls for the same key share one computation.
+
+At a bell every pupil's phone asks for the same few (class, group, session)
+lessons within seconds. Whatever is not cached yet is computed once: the first
+caller runs it and the others wait for its result (or its exception) instead
+of repeating it. Flight is for threads (WSGI workers, sync_to_async), AsyncFlight
+for coroutines on one event loop. Nothing is kept after a call returns; caching
+the result is up to the caller.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Flight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call in progress
+        self.shared = 0   # calls answered by another caller's computation
+
+    def do(self, key, fn):
+        """fn(), unless a call for `key` is in progress: then its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncFlight:
+    def __init__(self):
+        self._calls = {}  # (event loop, key) -> Task in progress
+        self.shared = 0
+
+    async def do(self, key, fn):
+        """await fn(), unless a call for `key` is in progress on this loop: then its result."""
+        key = (asyncio.get_running_loop(), key)
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+        # one cancelled caller must not cancel the others' computation
+        return await asyncio.shield(task)
@@ -0,0 +1,32 @@
+"""
+Week slots as bits: day_index * 8 + session - 1, so a whole week of one teacher
+or class fits in a 40-bit int and "is this slot free" is a single AND.
+"""
+from .models import DAY_CHOICES, SESSION_CHOICES
+
+DAYS = [code for code, _ in DAY_CHOICES]
+SESSIONS_PER_DAY = len(SESSION_CHOICES)
+SLOTS = len(DAYS) * SESSIONS_PER_DAY
+FULL = (1 << SLOTS) - 1
+DAY_MASKS = [((1 << SESSIONS_PER_DAY) - 1) << (d * SESSIONS_PER_DAY) for d in range(len(DAYS))]
+
+
+def sessions_mask(sessions):
+    """The week's slots of sessions 1..`sessions` of every day."""
+    return sum(((1 << sessions) - 1) << (d * SESSIONS_PER_DAY) for d in range(len(DAYS)))
+
+
+def slot_bit(day, session):
+    return DAYS.index(day) * SESSIONS_PER_DAY + session - 1
+
+
+def bit_slot(bit):
+    return DAYS[bit // SESSIONS_PER_DAY], bit % SESSIONS_PER_DAY + 1
+
+
+def bits(mask):
+    """Indexes of the set bits, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
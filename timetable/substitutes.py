@@ -0,0 +1,145 @@
+"""
+Teacher occupancy bitmaps, free slots and the substitute finder.
+
+TeacherBook loads a school's whole timetable once (a handful of queries) into one
+40-bit occupancy int per teacher (see slots.py), plus each teacher's lessons,
+the classes they teach and their qualifications. "Is teacher T free at (day,
+session)" is then a bit test, so ranking substitutes for every lesson of an
+absent teacher over a day or week takes microseconds, not a query per slot.
+Dropped with the other timetable caches and rebuilt lazily.
+"""
+import threading
+from dataclasses import dataclass
+
+from .models import Class, Subject, Teacher, TimeEntry
+from .routers import use_replicas
+from .schools import PerSchool
+from .slots import DAY_MASKS, DAYS, FULL, SESSIONS_PER_DAY, bit_slot, bits
+
+
+@dataclass(frozen=True)
+class Lesson:
+    bit: int
+    class_id: int
+    subject_id: int
+    group: str
+
+
+class TeacherBook:
+    def __init__(self):
+        self.busy = {}       # teacher_id -> occupancy mask
+        self.lessons = {}    # teacher_id -> [Lesson, ...] sorted by slot
+        self.classes = {}    # teacher_id -> set of class ids they teach
+        self.qualified = {}  # subject_id -> set of teacher ids
+        self.names = {}      # teacher_id -> str
+        self.class_names = {}
+        self.subject_names = {}
+
+    @classmethod
+    @use_replicas(False)
+    def load(cls, school_id):
+        book = cls()
+        book.names = {t.pk: str(t) for t in Teacher.objects.filter(school_id=school_id)}
+        book.class_names = {c.pk: str(c) for c in Class.objects.filter(school_id=school_id)}
+        book.subject_names = {s.pk: str(s) for s in Subject.objects.filter(school_id=school_id)}
+        qualifications = Teacher.subjects.through.objects.filter(teacher__school_id=school_id)
+        for teacher_id, subject_id in qualifications.values_list('teacher_id', 'subject_id'):
+            book.qualified.setdefault(subject_id, set()).add(teacher_id)
+        rows = (TimeEntry.objects.filter(school_id=school_id).order_by()
+                .values_list('teacher_id', 'day', 'session', 'school_class_id', 'subject_id', 'group'))
+        for teacher_id, day, session, class_id, subject_id, group in rows:
+            if day not in DAYS:
+                continue
+            bit = DAYS.index(day) * SESSIONS_PER_DAY + session - 1
+            book.busy[teacher_id] = book.busy.get(teacher_id, 0) | (1 << bit)
+            book.lessons.setdefault(teacher_id, []).append(Lesson(bit, class_id, subject_id, group))
+            book.classes.setdefault(teacher_id, set()).add(class_id)
+        for lessons in book.lessons.values():
+            lessons.sort(key=lambda l: l.bit)
+        return book
+
+    def is_free(self, teacher_id, bit):
+        return not (self.busy.get(teacher_id, 0) >> bit) & 1
+
+    def free_slots(self, teacher_id, day=None):
+        """[(day, session), ...] the teacher has no lesson in."""
+        mask = FULL & ~self.busy.get(teacher_id, 0)
+        if day is not None:
+            mask &= DAY_MASKS[DAYS.index(day)]
+        return [bit_slot(b) for b in bits(mask)]
+
+    def free_teachers(self, bit):
+        return [t for t in self.names if self.is_free(t, bit)]
+
+    def candidates(self, lesson, absent_id):
+        """
+        Free teachers qualified for the lesson's subject, best first:
+        already teaches the class, then fewest lessons that day, then fewest that week.
+        """
+        day_mask = DAY_MASKS[lesson.bit // SESSIONS_PER_DAY]
+        found = []
+        for t in self.qualified.get(lesson.subject_id, ()):
+            if t == absent_id or not self.is_free(t, lesson.bit):
+                continue
+            busy = self.busy.get(t, 0)
+            found.append((
+                lesson.class_id not in self.classes.get(t, ()),
+                (busy & day_mask).bit_count(),
+                busy.bit_count(),
+                self.names[t],
+                t,
+            ))
+        found.sort()
+        return [
+            {
+                'id': t,
+                'name': name,
+                'teaches_class': not unknown_class,
+                'lessons_that_day': day_load,
+                'lessons_that_week': week_load,
+            }
+            for unknown_class, day_load, week_load, name, t in found
+        ]
+
+    def substitutes(self, absent_id, day=None, limit=5):
+        """Every lesson of the absent teacher (one day or the whole week) with ranked cover."""
+        result = []
+        for lesson in self.lessons.get(absent_id, ()):
+            lesson_day, session = bit_slot(lesson.bit)
+            if day is not None and lesson_day != day:
+                continue
+            result.append({
+                'day': lesson_day,
+                'session': session,
+                'class': self.class_names.get(lesson.class_id),
+                'subject': self.subject_names.get(lesson.subject_id),
+                'group': lesson.group,
+                'candidates': self.candidates(lesson, absent_id)[:limit],
+            })
+        return result
+
+
+class _BookCache:
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self._lock = threading.Lock()
+        self._book = None
+        self._generation = 0
+
+    def get(self):
+        book = self._book
+        if book is None:
+            generation = self._generation
+            book = TeacherBook.load(self.school_id)
+            with self._lock:
+                if generation == self._generation:
+                    self._book = book
+        return book
+
+    def invalidate(self):
+        with self._lock:
+            self._book = None
+            self._generation += 1
+
+
+teacher_book = PerSchool(_BookCache)
@@ -0,0 +1,174 @@
+"""
+Synthetic school generator for benchmarks and load tests.
+
+Creates classes, teachers with subject qualifications, rooms, and pupils with
+Uzbek names. It then fills the week with the timetable generator, so the data passes
+the same rules as hand-entered entries.
+"""
+import random
+import string
+from dataclasses import dataclass
+from functools import partial
+
+from django.db import transaction
+
+from .bells import get_table
+from .generator import Problem, Requirement, solve, write_solution
+from .models import Class, Pupil, Room, Subject, Teacher, TimeEntry
+from .names import pupil_search_key
+from .schools import current_school_id
+from .search import pupil_search
+from .signals import timetable_changed
+
+FIRST_NAMES = [
+    'Aziz', 'Bekzod', 'Dilshod', 'Eldor', 'Farrux', 'Jasur', 'Javohir', 'Sardor', 'Shahzod', 'Sherzod',
+    'Otabek', 'Ulugbek', 'Timur', 'Rustam', 'Nodir', 'Akmal', 'Bobur', 'Islom', 'Doniyor', 'Temur',
+    'Dilnoza', 'Gulnora', 'Madina', 'Malika', 'Nigora', 'Nilufar', 'Sevara', 'Shahnoza', 'Zarina', 'Kamola',
+    'Mohira', 'Feruza', 'Dildora', 'Nargiza', 'Sabina', 'Laylo', 'Munisa', 'Ozoda', 'Yulduz', 'Zebo',
+]
+LAST_NAMES = [
+    'Abdullayev', 'Aliyev', 'Azimov', 'Ergashev', 'Hasanov', 'Ibragimov', 'Ismoilov', 'Jurayev',
+    'Karimov', 'Mahmudov', 'Mirzayev', 'Nazarov', 'Normatov', 'Qodirov', 'Rahimov', 'Rasulov',
+    'Saidov', 'Salimov', 'Sharipov', 'Sobirov', 'Tursunov', 'Umarov', 'Usmonov', 'Xakimov',
+    'Xolmatov', 'Yusupov', 'Zokirov', "G'ulomov", "To'xtayev", "Qo'chqorov",
+]
+
+# weekly hours per class; tuples are split into groups '1'/'2'
+WEEKLY_HOURS = {
+    'math': 6, 'physics': 3, 'chemistry': 2, 'biology': 2,
+    'english': (4,), 'history': 3, 'geography': 2, 'it': (2,),
+}
+
+GRADES = [number for number, _ in Class.CLASS_NUMBERS]
+LETTERS = string.ascii_uppercase
+MAX_CLASSES = len(GRADES) * len(LETTERS)  # Class is unique on (school, number, letter)
+
+
+@dataclass
+class SeedReport:
+    classes: int
+    teachers: int
+    rooms: int
+    pupils: int
+    entries: int
+    unplaced_hours: int
+
+
+def _teacher_hours(subject):
+    # a split lesson needs two teachers at once
+    hours = WEEKLY_HOURS[subject]
+    return hours[0] * 2 if isinstance(hours, tuple) else hours
+
+
+def _staffing(teachers):
+    """Teachers per subject, in proportion to the hours they have to cover and exactly `teachers` in all."""
+    demand = {name: _teacher_hours(name) for name in WEEKLY_HOURS}
+    total = sum(demand.values())
+    share = {name: teachers * h / total for name, h in demand.items()}
+    counts = {name: max(1, int(s)) for name, s in share.items()}
+    # the rounding goes to (or comes from) the subjects furthest from their share
+    while sum(counts.values()) < teachers:
+        counts[max(counts, key=lambda n: share[n] - counts[n])] += 1
+    while sum(counts.values()) > teachers:
+        counts[min((n for n in counts if counts[n] > 1), key=lambda n: share[n] - counts[n])] -= 1
+    return counts
+
+
+def _rooms(school_id, pupils, classes, rng):
+    """
+    A classroom per class plus small ones for split groups, and labs and IT rooms
+    for the peak of their lessons; seats from the largest class. Rooms are left unassigned.
+    """
+    sizes = {}
+    for p in pupils:
+        sizes[p.school_class_id] = sizes.get(p.school_class_id, 0) + 1
+    seats = max(sizes.values(), default=30)
+    layout = [('classroom', classes, seats), ('classroom', -(-classes // 3), seats // 2 + 4),
+              ('lab', -(-classes // 2), seats), ('it', -(-classes // 3), seats // 2 + 4)]
+    taken = set(Room.objects.filter(school_id=school_id).values_list('name', flat=True))
+    rooms, number = [], 100
+    for kind, count, capacity in layout:
+        for _ in range(count):
+            number += 1
+            while str(number) in taken:
+                number += 1
+            rooms.append(Room(school_id=school_id, name=str(number), kind=kind,
+                              capacity=capacity + rng.randint(0, 4)))
+    return Room.objects.bulk_create(rooms)
+
+
+def seed_school(classes, pupils, teachers, seed=None, time_budget=10.0, flush=False, school_id=None):
+    """Fill `school_id` (default: the current school) with synthetic data; returns a SeedReport."""
+    school_id = school_id or current_school_id()
+    if classes > MAX_CLASSES:
+        raise ValueError(f"At most {MAX_CLASSES} classes fit the (number, letter) uniqueness rule.")
+    if teachers < len(WEEKLY_HOURS):
+        raise ValueError(f"At least {len(WEEKLY_HOURS)} teachers are needed, one per subject.")
+    rng = random.Random(seed)
+
+    with transaction.atomic():
+        if flush:
+            for model in (TimeEntry, Pupil, Class, Teacher, Room):
+                model.objects.filter(school_id=school_id).delete()
+
+        subjects = {}
+        for name, _ in Subject.SUBJECT_CHOICES:
+            # Subject.save gives new ones their default room kind
+            subjects[name] = Subject.objects.get_or_create(school_id=school_id, name=name)[0]
+
+        taken = set(Class.objects.filter(school_id=school_id).values_list('number', 'letter'))
+        new_classes = []
+        for letter in LETTERS:
+            for number in GRADES:
+                if len(new_classes) == classes:
+                    break
+                if (number, letter) not in taken:
+                    new_classes.append(Class(school_id=school_id, number=number, letter=letter))
+        school_classes = Class.objects.bulk_create(new_classes)
+
+        staff = []
+        for name, count in _staffing(teachers).items():
+            for _ in range(count):
+                teacher = Teacher(school_id=school_id, first_name=rng.choice(FIRST_NAMES),
+                                  last_name=rng.choice(LAST_NAMES))
+                staff.append((teacher, name))
+        Teacher.objects.bulk_create([t for t, _ in staff])
+        Teacher.subjects.through.objects.bulk_create([
+            Teacher.subjects.through(teacher_id=t.pk, subject_id=subjects[name].pk) for t, name in staff
+        ])
+
+        # bulk_create skips Pupil.save(), so the search key and school are filled here
+        new_pupils = []
+        for _ in range(pupils if school_classes else 0):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            new_pupils.append(Pupil(
+                school_id=school_id, first_name=first, last_name=last, search_key=pupil_search_key(first, last),
+                school_class=rng.choice(school_classes), group=rng.choice('12'),
+            ))
+        Pupil.objects.bulk_create(new_pupils, batch_size=1000)
+        new_rooms = _rooms(school_id, new_pupils, len(school_classes), rng)
+        transaction.on_commit(partial(timetable_changed, school_id))
+        transaction.on_commit(pupil_search.of(school_id).invalidate)
+
+        qualified = {}
+        for t, name in staff:
+            qualified.setdefault(subjects[name].pk, []).append(t.pk)
+        requirements = []
+        for c in school_classes:
+            for name, hours in WEEKLY_HOURS.items():
+                split = isinstance(hours, tuple)
+                requirements.append(Requirement(c.pk, subjects[name].pk, hours[0] if split else hours, split))
+        problem = Problem(requirements, qualified, sessions=len(get_table(school_id=school_id)))
+        solution = solve(problem, time_budget=time_budget, seed=seed)
+        report = write_solution(solution, school_id=school_id)
+        if not report.ok:
+            raise RuntimeError(f"Generated timetable was rejected: {report.errors[:3]}")
+
+    return SeedReport(
+        classes=len(school_classes),
+        teachers=len(staff),
+        rooms=len(new_rooms),
+        pupils=len(new_pupils),
+        entries=report.created,
+        unplaced_hours=sum(h for _, _, h in solution.unplaced),
+    )
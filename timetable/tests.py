@@ -1,3 +1,1001 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import date, datetime, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from config.databases import database
+
+from . import bells, changelist, fragments, generator, grids, ics, importer, metrics, rooms, schools, versions, warmup
+from .broadcast import QUEUE_SIZE, broadcaster, build_snapshot
+from .calendar import calendar
+from .changelist import CachedRelatedFilter, EstimatedCountPaginator, KeysetPaginator
+from .changesets import apply_changeset
+from .locate import locate_pupils
+from .names import normalize, pupil_search_key
+from .models import BellSchedule, CalendarDay, Class, LessonChange, Pupil, Room, School, Subject, Teacher, TimeEntry
+from .now_index import match_pupils, now_index
+from .routers import ReplicaRouter, use_replicas
+from .search import pupil_search
+from .substitutes import teacher_book
+from .timeline import lessons_at, timeline
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite syntax")
+class HotQueryPlanTests(TestCase):
+    """
+    Every hot query must be answered through an index. A plan line like
+    "SCAN timetable_timeentry" means a full table scan and fails the test.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.subject = Subject.objects.create(name='math')
+        TimeEntry.objects.create(
+            day='mon', session=1, school_class=cls.school_class,
+            subject=cls.subject, teacher=cls.teacher,
+        )
+        Pupil.objects.create(first_name='John', last_name='Smith', school_class=cls.school_class)
+        cls.school = cls.school_class.school
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset):
+        plan = self.plan(queryset)
+        scans = [line for line in plan if line.startswith('SCAN ') and 'USING' not in line]
+        self.assertFalse(scans, f"full table scan in plan: {plan}")
+        return plan
+
+    def assertUsesIndex(self, queryset, fragment):
+        # fragment: an index name, or the columns SQLite reports for an autoindex
+        plan = self.assertNoFullScan(queryset)
+        self.assertTrue(any(fragment in line for line in plan), f"{fragment} not in plan: {plan}")
+
+    def test_pupil_now_lessons(self):
+        qs = TimeEntry.objects.filter(
+            school=self.school, day='mon', session=1, school_class=self.school_class,
+        ).select_related('subject', 'teacher').order_by('group')
+        self.assertUsesIndex(qs, 'school_id=? AND day=? AND session=? AND school_class_id=?')
+
+    def test_clean_teacher_conflict(self):
+        qs = TimeEntry.objects.filter(school=self.school, day='mon', session=1, teacher=self.teacher).exclude(pk=1)
+        self.assertUsesIndex(qs, 'timeentry_day_session_teacher')
+
+    def test_clean_class_entries(self):
+        qs = TimeEntry.objects.filter(
+            school=self.school, day='mon', session=1, school_class=self.school_class, group='all')
+        self.assertUsesIndex(qs, 'school_id=? AND day=? AND session=? AND school_class_id=? AND group=?')
+
+    def test_clean_occupancy_slot(self):
+        qs = TimeEntry.objects.filter(school=self.school, day='mon', session=1).exclude(pk=1).values_list(
+            'pk', 'day', 'session', 'school_class_id', 'group', 'teacher_id')
+        self.assertUsesIndex(qs, 'school_id=? AND day=? AND session=?')
+
+    def test_simulator_range(self):
+        qs = TimeEntry.objects.filter(
+            school=self.school, day='mon', school_class=self.school_class,
+            start_time__lte=time(9, 0), end_time__gte=time(9, 0),
+        )
+        self.assertUsesIndex(qs, 'timeentry_class_day_times')
+
+    def test_teacher_week(self):
+        qs = TimeEntry.objects.filter(teacher=self.teacher).select_related('school_class', 'subject', 'teacher')
+        self.assertNoFullScan(qs)
+
+    def test_pupil_search_key(self):
+        qs = Pupil.objects.filter(school=self.school, search_key='john smith').select_related('school_class')
+        self.assertUsesIndex(qs, 'pupil_school_search_key')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LessonFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.math = Subject.objects.create(name='math')
+        cls.physics = Subject.objects.create(name='physics')
+        cls.entry = TimeEntry.objects.create(
+            day='mon', session=1, school_class=cls.school_class,
+            subject=cls.math, teacher=cls.teacher, group='1',
+        )
+        cls.pupil = {'id': 1, 'class_id': cls.school_class.pk, 'group': '1'}
+        cls.other_group = {'id': 2, 'class_id': cls.school_class.pk, 'group': '2'}
+        cls.now = timezone.make_aware(datetime(2026, 10, 19, 8, 40))
+
+    def setUp(self):
+        # these outlive the per-test rollback
+        schools.invalidate()
+        cache.clear()
+        now_index.invalidate()
+        calendar.invalidate()
+
+    def test_rows_are_cached_per_group(self):
+        rows = fragments.lesson_rows('mon', 1, [self.pupil, self.other_group], self.now)
+        self.assertEqual(len(rows[1]), 1)
+        self.assertIn('Mathematics', rows[1][0])
+        self.assertEqual(rows[2], [])
+        with self.assertNumQueries(0):
+            self.assertEqual(fragments.lesson_rows('mon', 1, [self.pupil], self.now)[1], rows[1])
+
+    def test_edit_bumps_version(self):
+        fragments.lesson_rows('mon', 1, [self.pupil], self.now)
+        version = fragments.timetable_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.subject = self.physics
+            self.entry.save()
+        self.assertGreater(fragments.timetable_version(), version)
+        self.assertIn('Physics', fragments.lesson_rows('mon', 1, [self.pupil], self.now)[1][0])
+
+    def test_change_in_another_process(self):
+        fragments.lesson_rows('mon', 1, [self.pupil], self.now)
+        # another process: no signals here, only the shared version moves
+        TimeEntry.objects.filter(pk=self.entry.pk).update(subject=self.physics)
+        cache.incr(fragments.VERSION_KEY.format(self.entry.school_id))
+        self.assertIn('Physics', fragments.lesson_rows('mon', 1, [self.pupil], self.now)[1][0])
+
+    def test_version_checked_per_request(self):
+        now_index.lessons('mon', 1, self.school_class.pk)
+        fragments.timetable_version()
+        TimeEntry.objects.filter(pk=self.entry.pk).update(subject=self.physics)
+        cache.incr(fragments.VERSION_KEY.format(self.entry.school_id))
+        with mock.patch.object(fragments, 'VERSION_CHECK_SECONDS', 0):
+            self.client.get(f'/grid/class/{self.school_class.pk}/')
+        self.assertEqual(now_index.lessons('mon', 1, self.school_class.pk)[0]['subject'], 'Physics')
+
+    def test_expires_at_next_bell(self):
+        # session 1 ends at 09:15
+        self.assertEqual(fragments.seconds_to_next_bell(self.now), 35 * 60)
+
+    def test_warm_up_before_the_bell(self):
+        Pupil.objects.create(first_name='John', last_name='Smith', school_class=self.school_class, group='1')
+        bell = warmup.next_start(timezone.localtime(self.now), self.school_class.school_id)
+        self.assertEqual(bell.time(), time(9, 20))  # session 2
+        with mock.patch('django.utils.timezone.now', return_value=bell - timedelta(minutes=1)):
+            self.assertEqual(warmup.warm(bell, self.school_class.school_id), 1)
+        with mock.patch.object(fragments, '_render') as render, self.assertNumQueries(0):
+            fragments.lesson_rows('mon', 2, [self.pupil], bell)
+        render.assert_not_called()
+
+    async def test_concurrent_lookups_share_one_computation(self):
+        with mock.patch.object(fragments, 'slot_rows', wraps=fragments.slot_rows) as computed:
+            results = await asyncio.gather(*(
+                fragments.alesson_rows('mon', 1, [self.pupil], self.now) for _ in range(20)))
+        self.assertEqual(computed.call_count, 1)
+        self.assertIn('Mathematics', results[19][1][0])
+
+
+class CommitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.physics = Subject.objects.create(name='physics')
+        cls.entry = TimeEntry.objects.create(
+            day='mon', session=1, school_class=cls.school_class, subject=Subject.objects.create(name='math'),
+            teacher=Teacher.objects.create(first_name='Alice', last_name='Johnson'),
+        )
+
+    def setUp(self):
+        schools.invalidate()
+        now_index.invalidate()
+        timeline.invalidate()
+        grids.invalidate()
+
+    def subjects(self):
+        grid = json.loads(grids.get_grid('class', self.school_class.pk).body)
+        return (now_index.lessons('mon', 1, self.school_class.pk)[0]['subject'],
+                str(timeline.at('mon', time(8, 40))[0].subject),
+                grid['grid']['mon'][0][0]['subject'])
+
+    def test_caches_change_on_commit(self):
+        self.assertEqual(self.subjects(), ('Mathematics',) * 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.entry.subject = self.physics
+                self.entry.save()
+                # other readers still get the committed week
+                self.assertEqual(self.subjects(), ('Mathematics',) * 3)
+        self.assertEqual(self.subjects(), ('Physics',) * 3)
+
+    def test_rollback_leaves_caches_alone(self):
+        self.subjects()
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.entry.subject = self.physics
+                self.entry.save()
+                raise RuntimeError
+        self.assertEqual(self.subjects(), ('Mathematics',) * 3)
+
+    def test_week_grid_etag(self):
+        url = f'/grid/class/{self.school_class.pk}/'
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.entry.subject = self.physics
+            self.entry.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Physics', response.content.decode())
+
+
+class ImporterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        Subject.objects.create(name='math')
+
+    def row(self, **values):
+        return {'day': 'mon', 'class': '5A', 'session': 1, 'subject': 'Mathematics', 'teacher': 'alice  johnson',
+                **values}
+
+    def test_bad_row_stops_the_batch(self):
+        rows = [self.row(), self.row(session=2, day='sun'), self.row(session=3, start_time='9am')]
+        report = importer.import_entries(rows)
+        self.assertEqual([n for n, _ in report.errors], [2, 3])
+        self.assertEqual(TimeEntry.objects.count(), 0)
+        report = importer.import_entries(rows, skip_invalid=True)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(TimeEntry.objects.get().session, 1)
+
+    def test_duplicate_slot(self):
+        report = importer.import_entries([self.row(), self.row(**{'class': '5a'}), self.row(group='1')])
+        self.assertEqual([n for n, _ in report.errors], [2, 3])  # the same slot, then a group in it
+        self.assertTrue(importer.import_entries([self.row()]).ok)
+        report = importer.import_entries([self.row()])  # against the stored week
+        self.assertEqual([n for n, _ in report.errors], [1])
+
+    def test_unknown_teacher(self):
+        report = importer.import_entries([self.row(teacher='Bob Brown'), self.row(session=2, teacher=999)])
+        self.assertEqual(report.errors, [(1, "Unknown teacher 'Bob Brown'."), (2, "Unknown teacher '999'.")])
+        Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        report = importer.import_entries([self.row()])
+        self.assertIn("ambiguous", report.errors[0][1])
+
+
+class NameTests(TestCase):
+    def test_apostrophe_variants(self):
+        spellings = ["G'ulomov", "Gʻulomov", "G‘ulomov", "G’ulomov", "G`ulomov", "Gʼulomov", "G´ulomov"]
+        self.assertEqual({normalize(name) for name in spellings}, {'gulomov'})
+        self.assertEqual(normalize("O‘tkir"), normalize("O'tkir"))
+
+    def test_latin_and_cyrillic_keys(self):
+        key = pupil_search_key('Shohruh', 'Xakimov')
+        self.assertEqual(key, 'shohruh xakimov')
+        self.assertEqual(pupil_search_key('Шоҳруҳ', 'Хакимов'), key)
+        self.assertEqual(pupil_search_key(' shohruh ', 'Khakimov'), key)
+        self.assertEqual(pupil_search_key('Ўткир', 'Ғуломов'), pupil_search_key("O‘tkir", "G'ulomov"))
+
+        school_class = Class.objects.create(number=5, letter='A')
+        pupil = Pupil.objects.create(first_name='Шоҳруҳ', last_name='Хакимов', school_class=school_class)
+        self.assertEqual(Pupil.objects.get(search_key=key), pupil)
+        pupil_search.invalidate()
+        self.assertEqual([p['id'] for p in pupil_search.search('Khakimov Sh')], [pupil.pk])
+
+
+class SubstituteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        math = Subject.objects.create(name='math')
+        cls.five_a, five_b = Class.objects.create(number=5, letter='A'), Class.objects.create(number=5, letter='B')
+        cls.absent, cls.busy, cls.free, cls.unqualified, cls.regular = (
+            Teacher.objects.create(first_name=name, last_name='Teacher')
+            for name in ('Alice', 'Bob', 'Carol', 'Dave', 'Erin'))
+        for teacher in (cls.busy, cls.free, cls.regular):
+            teacher.subjects.add(math)
+        for teacher, school_class, session in ((cls.absent, cls.five_a, 1), (cls.busy, five_b, 1),
+                                               (cls.regular, cls.five_a, 2)):
+            TimeEntry.objects.create(day='mon', session=session, school_class=school_class,
+                                     subject=math, teacher=teacher)
+
+    def setUp(self):
+        schools.invalidate()
+        teacher_book.invalidate()
+
+    def test_free_qualified_teachers_cover(self):
+        response = self.client.get(f'/teachers/{self.absent.pk}/substitutes/', {'day': 'mon'})
+        slot, = response.json()['slots']
+        self.assertEqual((slot['session'], slot['class']), (1, '5A'))
+        # Bob is busy and Dave can't teach math; Erin already teaches 5A
+        self.assertEqual([c['id'] for c in slot['candidates']], [self.regular.pk, self.free.pk])
+        self.assertEqual([c['teaches_class'] for c in slot['candidates']], [True, False])
+        self.assertEqual(self.client.get(f'/teachers/{self.absent.pk}/substitutes/', {'day': 'tue'}).json()['slots'],
+                         [])
+
+
+class EntryTimesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.math = Subject.objects.create(name='math')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.entry = TimeEntry.objects.create(day='mon', session=2, school_class=cls.school_class,
+                                             subject=cls.math, teacher=cls.teacher)
+
+    def setUp(self):
+        schools.invalidate()
+        bells.invalidate()
+        now_index.invalidate()
+        grids.invalidate()
+
+    def tearDown(self):
+        bells.invalidate()  # the schedules below are rolled back, their tables aren't
+
+    def test_times_follow_the_bell_schedule(self):
+        self.assertIsNone(self.entry.start_time)
+        self.assertEqual(now_index.lessons('mon', 2, self.school_class.pk)[0]['start'], '09:20')
+        with self.captureOnCommitCallbacks(execute=True):
+            BellSchedule.objects.create(name='late', is_default=True, day_start=time(9, 0))
+        self.assertEqual(now_index.lessons('mon', 2, self.school_class.pk)[0]['start'], '09:50')
+        grid = json.loads(grids.get_grid('class', self.school_class.pk).body)
+        self.assertEqual(grid['grid']['mon'][1][0]['start'], '09:50')
+
+    def test_session_past_the_schedule_is_a_validation_error(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BellSchedule.objects.create(name='short', is_default=True, sessions=4)
+        entry = TimeEntry(day='tue', session=6, school_class=self.school_class,
+                          subject=self.math, teacher=self.teacher)
+        with self.assertRaises(ValidationError) as ctx:
+            entry.full_clean()
+        self.assertIn('session', ctx.exception.message_dict)
+        report = importer.import_entries([{'day': 'tue', 'class': '5A', 'session': 6,
+                                           'subject': 'math', 'teacher': 'Alice Johnson'}])
+        self.assertIn("only 4 sessions", report.errors[0][1])
+
+
+class SchoolTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.north = School.objects.create(name="North", slug='north')
+        cls.south = School.objects.create(name="South", slug='south')
+        cls.classes = {}
+        for school, subject_name in ((cls.north, 'math'), (cls.south, 'physics')):
+            with schools.use_school(school):
+                school_class = Class.objects.create(number=5, letter='A')
+                TimeEntry.objects.create(
+                    day='mon', session=1, school_class=school_class,
+                    subject=Subject.objects.create(name=subject_name),
+                    teacher=Teacher.objects.create(first_name='Alice', last_name='Johnson'),
+                )
+            cls.classes[school.slug] = school_class
+
+    def setUp(self):
+        schools.invalidate()
+        for school in (self.north, self.south):
+            now_index.of(school.pk).invalidate()
+            teacher_book.of(school.pk).invalidate()
+            pupil_search.of(school.pk).invalidate()
+
+    def test_rows_get_the_class_school(self):
+        entry = TimeEntry.objects.get(school_class=self.classes['north'])
+        self.assertEqual(entry.school_id, self.north.pk)
+        pupil = Pupil.objects.create(first_name='John', last_name='Smith', school_class=self.classes['south'])
+        self.assertEqual(pupil.school_id, self.south.pk)
+
+    def test_caches_are_per_school(self):
+        north = now_index.of(self.north.pk).lessons('mon', 1, self.classes['north'].pk)
+        self.assertEqual([e['subject'] for e in north], ['Mathematics'])
+        self.assertEqual(now_index.of(self.north.pk).lessons('mon', 1, self.classes['south'].pk), ())
+
+    def test_request_school_from_header(self):
+        pk = self.classes['south'].pk
+        self.assertEqual(self.client.get(f'/grid/class/{pk}/', HTTP_X_SCHOOL='south').status_code, 200)
+        self.assertEqual(self.client.get(f'/grid/class/{pk}/', HTTP_X_SCHOOL='north').status_code, 404)
+        self.assertEqual(self.client.get(f'/grid/class/{pk}/', HTTP_X_SCHOOL='east').status_code, 404)
+
+    def test_pupil_autocomplete(self):
+        for first in ('Anna', 'Andrew', 'Anton', 'Boris'):
+            Pupil.objects.create(first_name=first, last_name='Smith', school_class=self.classes['north'])
+        Pupil.objects.create(first_name='Anya', last_name='Jones', school_class=self.classes['south'])
+
+        def names(school, **params):
+            response = self.client.get('/pupils/autocomplete/', params, HTTP_X_SCHOOL=school)
+            return [r['name'] for r in response.json()['results']]
+
+        self.assertEqual(names('north', q='an'), ["Andrew Smith", "Anna Smith", "Anton Smith"])
+        self.assertEqual(names('north', q='an smi', limit=2), ["Andrew Smith", "Anna Smith"])
+        self.assertEqual(names('south', q='an'), ["Anya Jones"])
+        self.assertEqual(names('south', q='smith'), [])
+        self.assertEqual(names('north', q='a'), [])  # too short
+
+    def test_admin_filters_across_schools(self):
+        from django.contrib.auth.models import User
+
+        def teacher_choices(**params):
+            response = self.client.get('/admin/timetable/timeentry/', params)
+            spec, = (f for f in response.context['cl'].filter_specs
+                     if isinstance(f, CachedRelatedFilter) and f.field.name == 'teacher')
+            return [name for _, name in spec.lookup_choices], response.context['cl'].result_count
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        alice = Teacher.objects.get(school=self.south)
+        Teacher.objects.create(first_name='Bob', last_name='Brown', school=self.south)
+        self.assertEqual(teacher_choices(teacher__id__exact=alice.pk), (
+            ["Alice Johnson (North)", "Alice Johnson (South)", "Bob Brown (South)"], 1))
+        self.assertEqual(teacher_choices(school__id__exact=self.south.pk), (["Alice Johnson", "Bob Brown"], 1))
+
+    def test_teacher_of_another_school_is_rejected(self):
+        entry = TimeEntry(day='tue', session=1, school_class=self.classes['north'],
+                          subject=Subject.objects.get(school=self.north),
+                          teacher=Teacher.objects.get(school=self.south))
+        with self.assertRaises(ValidationError) as ctx:
+            entry.full_clean()
+        self.assertIn('teacher', ctx.exception.message_dict)
+
+
+class ChangelistTests(TestCase):
+    ORDERING = ('school_id', 'day', 'session', 'school_class_id', 'group')
+
+    @classmethod
+    def setUpTestData(cls):
+        school_class = Class.objects.create(number=5, letter='A')
+        subject = Subject.objects.create(name='math')
+        teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        for session in range(1, 7):
+            TimeEntry.objects.create(day='mon', session=session, school_class=school_class,
+                                     subject=subject, teacher=teacher)
+
+    def setUp(self):
+        changelist.boundaries.clear()
+
+    def test_estimated_count(self):
+        entries = TimeEntry.objects.order_by('pk')
+        with mock.patch.object(changelist, 'estimated_count', return_value=50000):
+            self.assertEqual(EstimatedCountPaginator(entries, 2).count, 50000)
+            self.assertEqual(EstimatedCountPaginator(entries.filter(session__lte=3), 2).count, 3)
+        with mock.patch.object(changelist, 'estimated_count', return_value=100):
+            self.assertEqual(EstimatedCountPaginator(entries, 2).count, 6)  # small tables are counted
+        with mock.patch.object(changelist, 'estimated_count', return_value=None):
+            self.assertEqual(EstimatedCountPaginator(entries, 2).count, 6)
+
+    def sessions(self, *numbers):
+        paginator = KeysetPaginator(TimeEntry.objects.order_by(*self.ORDERING), 2)
+        paginator.keyset = self.ORDERING
+        return [[e.session for e in paginator.page(n)] for n in numbers or paginator.page_range]
+
+    def test_keyset_pages(self):
+        self.assertEqual(self.sessions(), [[1, 2], [3, 4], [5, 6]])
+        with CaptureQueriesContext(connection) as queries:
+            self.sessions()
+        self.assertFalse([q for q in queries if 'OFFSET' in q['sql']])  # every next page seeks
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeEntry.objects.get(session=2).delete()
+        # straight to page 3: page 2 ends at another row now
+        self.assertEqual(self.sessions(3), [[6]])
+        self.assertEqual(self.sessions(), [[1, 3], [4, 5], [6]])
+
+
+class RoomTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lab = Room.objects.create(name='Lab', kind='lab', capacity=30)
+        cls.small = Room.objects.create(name='101', capacity=10)
+        cls.large = Room.objects.create(name='102', capacity=30)
+        cls.entries = []
+        # 5A physics for 8 pupils, 5B math for 12, 5C English for group 1 (8 of 9)
+        lessons = (('A', 'physics', 'all', 8), ('B', 'math', 'all', 12), ('C', 'english', '1', 8))
+        for letter, subject, group, pupils in lessons:
+            school_class = Class.objects.create(number=5, letter=letter)
+            cls.entries.append(TimeEntry.objects.create(
+                day='mon', session=1, school_class=school_class, group=group,
+                subject=Subject.objects.create(name=subject, room_kind='lab' if subject == 'physics' else ''),
+                teacher=Teacher.objects.create(first_name='Alice', last_name=letter),
+            ))
+            for i in range(pupils):
+                Pupil.objects.create(first_name='John', last_name=str(i), school_class=school_class, group='1')
+        Pupil.objects.create(first_name='Jane', last_name='Doe', school_class=school_class, group='2')
+
+    def test_allocation_by_kind_and_capacity(self):
+        self.assertTrue(rooms.allocate().ok)
+        physics, math, english = (TimeEntry.objects.get(pk=e.pk).room for e in self.entries)
+        self.assertEqual((physics, math, english), (self.lab, self.large, self.small))
+        self.assertEqual(rooms.allocate().kept, 3)
+
+    def test_room_double_booking_is_rejected(self):
+        for entry in self.entries[:2]:
+            entry.room = self.large
+        self.entries[0].save()
+        with self.assertRaises(ValidationError) as ctx:
+            self.entries[1].save()
+        self.assertIn('room', ctx.exception.message_dict)
+
+    def test_room_grid_and_import(self):
+        physics = self.entries[0]
+        self.assertEqual(physics.subject.room_kind, 'lab')
+        self.assertEqual(Subject.objects.create(name='chemistry').room_kind, 'lab')  # the default
+        self.assertEqual(Subject.objects.create(name='history').room_kind, '')
+
+        row = {'day': 'tue', 'class': '5A', 'session': 2, 'subject': 'physics', 'teacher': 'Alice A', 'room': 'lab'}
+        self.assertTrue(importer.import_entries([row]).ok)
+        grids.invalidate()  # what the commit would do
+        grid = json.loads(grids.get_grid('room', self.lab.pk).body)
+        lesson, = grid['grid']['tue'][1]
+        self.assertEqual((lesson['class'], lesson['room']), ('5A', 'Lab'))
+        report = importer.import_entries([{**row, 'session': 3, 'room': '999'}])
+        self.assertEqual(report.errors, [(1, "Unknown room '999'.")])
+
+    def test_match_moves_placed_lessons(self):
+        self.assertEqual(rooms.match([[2, 1], [2, 3], [3]]), [1, 2, 3])
+        self.assertEqual(rooms.match([[1], [1]], taken={2}), [1, None])
+
+
+class GeneratorTests(TestCase):
+    SPEC = {
+        'classes': {'5A': {'math': 4, 'english': {'hours': 2, 'split': True}}, '5B': {'math': 4}},
+        'qualifications': {'Alice Johnson': ['math'], 'Bob Brown': ['english'], 'Carol White': ['english']},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        for letter in 'AB':
+            Class.objects.create(number=5, letter=letter)
+        for name in ('math', 'english'):
+            Subject.objects.create(name=name)
+        cls.alice = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        Teacher.objects.create(first_name='Bob', last_name='Brown')
+        Teacher.objects.create(first_name='Carol', last_name='White')
+
+    def test_solve_and_write(self):
+        solution = generator.solve(generator.load_problem(self.SPEC), seed=1)
+        self.assertTrue(solution.complete)
+        self.assertEqual(len(solution.entries), 12)  # the split lesson is two entries per hour
+        self.assertTrue(generator.write_solution(solution).ok)
+        self.assertEqual(TimeEntry.objects.count(), 12)
+        # Alice teaches math to both classes, never twice in one slot
+        self.assertEqual(len(set(TimeEntry.objects.filter(teacher=self.alice).values_list('day', 'session'))), 8)
+
+    def test_lessons_left_at_the_deadline_are_unplaced(self):
+        solution = generator.solve(generator.load_problem(self.SPEC), time_budget=-1)  # already past
+        self.assertFalse(solution.complete)
+        self.assertEqual(sum(hours for *_, hours in solution.unplaced), 10)
+        self.assertEqual(solution.entries, [])
+
+    def test_only_the_bell_schedule_sessions_are_used(self):
+        BellSchedule.objects.create(name='short', is_default=True, sessions=2)
+        bells.invalidate()
+        spec = dict(self.SPEC, classes={'5A': {'math': 6, 'english': {'hours': 5, 'split': True}}})
+        solution = generator.solve(generator.load_problem(spec), time_budget=0.2, seed=1)
+        # 11 hours, 10 slots in a week of two lessons a day
+        self.assertEqual(sum(hours for *_, hours in solution.unplaced), 1)
+        self.assertEqual({session for _, session, *_ in solution.entries}, {1, 2})
+
+
+class VersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.math = Subject.objects.create(name='math')
+        for session in (1, 2):
+            TimeEntry.objects.create(day='mon', session=session, school_class=cls.school_class,
+                                     subject=cls.math, teacher=cls.teacher)
+
+    def test_diff_publish_and_rollback(self):
+        first = versions.snapshot("term start")
+        TimeEntry.objects.get(session=2).delete()
+        TimeEntry.objects.create(day='tue', session=1, school_class=self.school_class,
+                                 subject=Subject.objects.create(name='physics'), teacher=self.teacher)
+        changes = versions.diff(first.rows, versions.live_rows())
+        self.assertEqual((len(changes.added), len(changes.removed), len(changes.changed)), (1, 1, 0))
+
+        second = versions.snapshot("with physics")
+        versions.publish(first)
+        self.assertFalse(versions.diff(first.rows, versions.live_rows()))
+        self.assertEqual(versions.published_number(), first.number)
+
+        TimeEntry.objects.filter(session=1).delete()  # a bad edit
+        versions.rollback()  # drops the edit
+        self.assertFalse(versions.diff(first.rows, versions.live_rows()))
+        versions.publish(second)
+        self.assertEqual(versions.rollback(), first)
+        self.assertEqual(TimeEntry.objects.count(), 2)
+
+    def test_publish_checks_the_rules(self):
+        row = versions.live_rows()[0]
+        clash = versions.save_version([row, [*row[:3], '1', *row[4:]]])
+        with self.assertRaises(versions.PublishError):
+            versions.publish(clash)
+        self.assertEqual(TimeEntry.objects.count(), 2)
+
+
+class ChangesetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.entries = [
+            TimeEntry.objects.create(day='mon', session=session, school_class=cls.school_class,
+                                     subject=Subject.objects.create(name=name), teacher=cls.teacher)
+            for session, name in ((1, 'math'), (2, 'physics'), (3, 'chemistry'))
+        ]
+
+    def slots(self):
+        return {e.subject.name: (e.day, e.session) for e in TimeEntry.objects.select_related('subject')}
+
+    def test_swap_and_rotation(self):
+        math, physics, chemistry = (e.pk for e in self.entries)
+        self.assertTrue(apply_changeset([{'op': 'swap', 'entries': [math, physics]}]).ok)
+        self.assertEqual(self.slots(), {'math': ('mon', 2), 'physics': ('mon', 1), 'chemistry': ('mon', 3)})
+        report = apply_changeset([
+            {'op': 'move', 'entry': math, 'session': 3},
+            {'op': 'move', 'entry': chemistry, 'session': 1},
+            {'op': 'move', 'entry': physics, 'session': 2},
+        ])
+        self.assertEqual((report.ok, report.updated), (True, 3))
+        self.assertEqual(self.slots(), {'math': ('mon', 3), 'physics': ('mon', 2), 'chemistry': ('mon', 1)})
+
+    def test_move_into_a_deleted_slot(self):
+        math, physics, _ = (e.pk for e in self.entries)
+        report = apply_changeset([{'op': 'delete', 'entry': physics}, {'op': 'move', 'entry': math, 'session': 2}])
+        self.assertEqual((report.ok, report.updated, report.deleted), (True, 1, 1))
+        self.assertEqual(self.slots(), {'math': ('mon', 2), 'chemistry': ('mon', 3)})
+        report = apply_changeset([{'op': 'move', 'entry': math, 'session': 3}])
+        self.assertEqual(report.errors[0][0], 1)  # chemistry is there
+
+    def test_malformed_operations(self):
+        math = self.entries[0].pk
+        report = apply_changeset([
+            {'op': 'swap', 'entries': 5},
+            {'op': 'swap', 'entries': '12'},
+            {'op': 'swap', 'entries': [math]},
+            {'op': 'swap', 'entries': [math, math]},
+            {'op': 'rename', 'entry': math},
+            {'op': 'move', 'entry': 'x'},
+        ])
+        self.assertEqual([n for n, _ in report.errors], [1, 2, 3, 4, 5, 6])
+        report = apply_changeset([{'op': 'move', 'entry': math, 'day': 'sun'}, {'op': 'delete', 'entry': 0}])
+        self.assertEqual([n for n, _ in report.errors], [2])
+        report = apply_changeset([{'op': 'move', 'entry': math, 'day': 'sun'}])
+        self.assertEqual([n for n, _ in report.errors], [1])
+        self.assertEqual(self.slots()['math'], ('mon', 1))
+
+
+class CalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.teacher = Teacher.objects.create(first_name='Alice', last_name='Johnson')
+        cls.substitute = Teacher.objects.create(first_name='Bob', last_name='Brown')
+        cls.math = Subject.objects.create(name='math')
+        cls.physics = Subject.objects.create(name='physics')
+        for session in (1, 2):
+            TimeEntry.objects.create(day='mon', session=session, school_class=cls.school_class,
+                                     subject=cls.math, teacher=cls.teacher)
+        cls.pupil = Pupil.objects.create(first_name='John', last_name='Smith', school_class=cls.school_class)
+        School.objects.filter(pk=cls.school_class.school_id).update(rotation_start=date(2026, 10, 19))
+
+    def setUp(self):
+        schools.invalidate()
+        now_index.invalidate()
+        calendar.invalidate()
+
+    def lessons(self, day, session):
+        return [(r['subject'], r['teacher'], r['start'])
+                for r in calendar.plan(day).lessons(session, self.school_class.pk)]
+
+    def test_changes_by_date_and_rotation_week(self):
+        LessonChange.objects.create(date=date(2026, 10, 19), session=1, school_class=self.school_class,
+                                    cancelled=True)
+        LessonChange.objects.create(date=date(2026, 10, 19), session=2, school_class=self.school_class,
+                                    teacher=self.substitute, note="cover")
+        LessonChange.objects.create(week='B', day='mon', session=1, school_class=self.school_class,
+                                    subject=self.physics)
+        self.assertEqual(self.lessons(date(2026, 10, 19), 1), [])
+        self.assertEqual(self.lessons(date(2026, 10, 19), 2), [('Mathematics', 'Bob Brown', '09:20')])
+        self.assertEqual(self.lessons(date(2026, 10, 26), 1), [('Physics', 'Alice Johnson', '08:30')])
+        self.assertEqual(self.lessons(date(2026, 11, 2), 1), [('Mathematics', 'Alice Johnson', '08:30')])
+        with self.assertNumQueries(0):
+            self.lessons(date(2026, 10, 26), 1)
+        # an added lesson gets the session's bell times
+        LessonChange.objects.create(date=date(2026, 10, 19), session=3, school_class=self.school_class,
+                                    subject=self.physics, teacher=self.substitute)
+        calendar.invalidate()
+        self.assertEqual(self.lessons(date(2026, 10, 19), 3), [('Physics', 'Bob Brown', '10:10')])
+
+        found = locate_pupils([self.pupil.pk], datetime(2026, 10, 19, 9, 30))
+        self.assertEqual(found.pupils[0]['entries'][0]['teacher'], 'Bob Brown')
+        snapshot = build_snapshot(timezone.make_aware(datetime(2026, 10, 19, 9, 30)))
+        lesson, = snapshot['lessons'].values()
+        self.assertEqual((lesson['teacher'], lesson['note']), ('Bob Brown', "cover"))
+        self.assertEqual(build_snapshot(timezone.make_aware(datetime(2026, 10, 19, 8, 40)))['lessons'], {})
+
+    def test_holidays_and_other_bell_times(self):
+        self.assertEqual(len(self.lessons(date(2026, 10, 19), 1)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            CalendarDay.objects.create(date=date(2026, 10, 19), closed=True, note="Autumn break")
+        self.assertIsNone(calendar.plan(date(2026, 10, 19)).day)
+        self.assertEqual(locate_pupils([self.pupil.pk], datetime(2026, 10, 19, 8, 40)).pupils[0]['entries'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            short = BellSchedule.objects.create(name='short', lesson_minutes=30)
+            CalendarDay.objects.create(date=date(2026, 11, 9), schedule=short)
+        self.assertEqual(self.lessons(date(2026, 11, 9), 2), [('Mathematics', 'Alice Johnson', '09:05')])
+        self.assertEqual(calendar.plan(date(2026, 11, 9)).table.current_session(time(9, 10)), 2)
+
+    def test_substitute_must_be_free(self):
+        other = Class.objects.create(number=6, letter='B')
+        TimeEntry.objects.create(day='mon', session=1, school_class=other, subject=self.math, teacher=self.substitute)
+
+        def check(day):
+            LessonChange(date=day, session=1, school_class=self.school_class, teacher=self.substitute).full_clean()
+
+        with self.assertRaises(ValidationError):
+            check(date(2026, 10, 19))
+        check(date(2026, 10, 20))  # a Tuesday
+        with self.captureOnCommitCallbacks(execute=True):
+            CalendarDay.objects.create(date=date(2026, 10, 20), follows='mon')
+        with self.assertRaises(ValidationError):
+            check(date(2026, 10, 20))
+
+        # freed by a change of their own lesson, then busy with another class's
+        LessonChange.objects.create(date=date(2026, 10, 19), session=1, school_class=other, cancelled=True)
+        check(date(2026, 10, 19))
+        third = Class.objects.create(number=7, letter='C')
+        LessonChange.objects.create(date=date(2026, 10, 19), session=1, school_class=third,
+                                    subject=self.math, teacher=self.substitute)
+        with self.assertRaises(ValidationError):
+            check(date(2026, 10, 19))
+
+    def test_added_lessons_keep_all_and_groups_apart(self):
+        monday = date(2026, 10, 19)
+
+        def add(session, group, **kwargs):
+            change = LessonChange(date=monday, session=session, school_class=self.school_class, group=group,
+                                  subject=self.physics, teacher=self.substitute, **kwargs)
+            try:
+                change.full_clean()
+            finally:
+                change.save()  # stored either way, as a bulk import could
+
+        with self.assertRaises(ValidationError):
+            add(1, '1')  # the whole class has math
+        add(3, '1')
+        with self.assertRaises(ValidationError):
+            add(3, 'all')
+        calendar.invalidate()
+        self.assertEqual([r['group_code'] for r in calendar.plan(monday).lessons(1, self.school_class.pk)], ['all'])
+        self.assertEqual([r['group_code'] for r in calendar.plan(monday).lessons(3, self.school_class.pk)], ['1'])
+
+        # a group lesson can take the place of a cancelled whole-class one
+        LessonChange.objects.filter(session=1).delete()
+        LessonChange.objects.create(date=monday, session=1, school_class=self.school_class, cancelled=True)
+        add(1, '2')
+        calendar.invalidate()
+        self.assertEqual([r['group_code'] for r in calendar.plan(monday).lessons(1, self.school_class.pk)], ['2'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CalendarFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        TimeEntry.objects.create(
+            day='mon', session=1, school_class=cls.school_class,
+            subject=Subject.objects.create(name='math'),
+            teacher=Teacher.objects.create(first_name='Alice', last_name='Johnson'),
+        )
+        cls.pupil = Pupil.objects.create(first_name='John', last_name='Smith',
+                                         school_class=cls.school_class, group='1')
+
+    def setUp(self):
+        schools.invalidate()
+        cache.clear()
+        now_index.invalidate()
+
+    def test_class_feed_and_revalidation(self):
+        url = f'/ics/class/{self.school_class.pk}.ics'
+        response = self.client.get(url)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn('RRULE:FREQ=WEEKLY;BYDAY=MO', body)
+        self.assertIn('DTSTART;TZID=Asia/Tashkent:', body)
+        self.assertIn('SUMMARY:Mathematics', body)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_event_uids_survive_new_rows(self):
+        def uids():
+            cache.clear()
+            body = b''.join(self.client.get(f'/ics/class/{self.school_class.pk}.ics').streaming_content)
+            return [line for line in body.decode().splitlines() if line.startswith('UID:')]
+
+        before = uids()
+        # publishing a version re-inserts the rows; SQLite may even reuse the ids, so move them
+        TimeEntry.objects.update(id=F('id') + 100)
+        self.assertEqual(uids(), before)
+
+    def test_pupil_feed_needs_a_signed_token(self):
+        response = self.client.get(f'/ics/pupil/{ics.pupil_token(self.pupil.pk)}.ics')
+        self.assertIn('SUMMARY:Mathematics', b''.join(response.streaming_content).decode())
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="pupil.ics"')
+        self.assertEqual(self.client.get(f'/ics/pupil/{self.pupil.pk}.ics').status_code, 404)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+        cls.entry = TimeEntry.objects.create(
+            day='mon', session=1, school_class=cls.school_class,
+            subject=Subject.objects.create(name='math'),
+            teacher=Teacher.objects.create(first_name='Alice', last_name='Johnson'),
+        )
+        cls.pupil = Pupil.objects.create(first_name='John', last_name='Smith', school_class=cls.school_class)
+
+    def setUp(self):
+        schools.invalidate()
+        now_index.invalidate()
+        timeline.invalidate()
+        calendar.invalidate()
+
+    def test_live_stream_needs_asgi(self):
+        self.assertEqual(self.client.get('/now/stream/').status_code, 501)
+
+    @mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 10, 19, 8, 40)))
+    async def test_live_stream_snapshot_then_diff(self, now):
+        board = broadcaster.of(self.school_class.school_id)
+        stream = board.stream()
+        try:
+            snapshot = await asyncio.wait_for(anext(stream), 5)
+            self.assertTrue(snapshot.startswith(b'event: snapshot'))
+            self.assertIn('Mathematics', snapshot.decode())
+
+            # what signals do once an edit is committed
+            physics = await Subject.objects.acreate(name='physics')
+            await TimeEntry.objects.filter(pk=self.entry.pk).aupdate(subject=physics)
+            now_index.invalidate()
+            calendar.invalidate()
+            board.notify_changed()
+            diff = json.loads((await asyncio.wait_for(anext(stream), 5)).decode().split('data: ')[1])
+            lesson, = diff['changed'].values()
+            self.assertEqual((lesson['subject'], diff['removed']), ('Physics', []))
+        finally:
+            await stream.aclose()
+            board._ticker.cancel()
+
+    def test_slow_client_resyncs_from_snapshot(self):
+        board = broadcaster.of(self.school_class.school_id)
+        board.snapshot_message = b'event: snapshot\n\n'
+        queue = board.subscribe()
+        for i in range(QUEUE_SIZE + 1):
+            board.publish(f'event: diff {i}\n\n'.encode())
+        board.unsubscribe(queue)
+        self.assertEqual(queue.qsize(), 1)
+        self.assertEqual(queue.get_nowait(), board.snapshot_message)
+
+    async def test_lookups_under_asgi(self):
+        response = await self.async_client.get('/pupils/where/', {
+            'ids': f'{self.pupil.pk},0', 'at': '2026-10-19T08:40:00'})
+        self.assertEqual(response.json()['pupils'][0]['entries'][0]['subject'], 'Mathematics')
+        self.assertEqual(response.json()['missing'], [0])
+        response = await self.async_client.post('/simulator/', {
+            'class_id': self.school_class.pk, 'day': 'mon', 'time': '08:40'})
+        self.assertContains(response, 'Alice')
+        for bad in ('9', '25:00', 'noon'):
+            response = await self.async_client.post('/simulator/', {
+                'class_id': self.school_class.pk, 'day': 'mon', 'time': bad})
+            self.assertEqual(response.status_code, 400)
+
+    def test_pupils_where(self):
+        other = Pupil.objects.create(first_name='Jane', last_name='Doe', school_class=self.school_class, group='2')
+        params = {'ids': f'{other.pk},0,{self.pupil.pk}', 'at': '2026-10-19T08:40:00'}
+        self.client.get('/pupils/where/', params)  # the school and the date's plan, loaded once per process
+        with self.assertNumQueries(2):
+            found = self.client.get('/pupils/where/', params).json()
+        self.assertEqual((found['day'], found['session'], found['missing']), ('mon', 1, [0]))
+        self.assertEqual([p['id'] for p in found['pupils']], [other.pk, self.pupil.pk])
+        self.assertEqual([e['subject'] for e in found['pupils'][0]['entries']], ['Mathematics'])
+        self.assertEqual(self.client.get('/pupils/where/', {'ids': 'x'}).status_code, 400)
+
+    def test_happening_at(self):
+        other = Class.objects.create(number=6, letter='B')
+        TimeEntry.objects.create(day='mon', session=1, school_class=other, subject=self.entry.subject,
+                                 teacher=Teacher.objects.create(first_name='Bob', last_name='Brown'))
+
+        def classes(**params):
+            response = self.client.get('/timeline/', {'day': 'mon', **params})
+            return [lesson['class_id'] for lesson in response.json()['lessons']]
+
+        # session 1 runs 08:30-09:15: the start minute is in, the end minute is out
+        self.assertEqual(classes(time='08:29'), [])
+        self.assertEqual(sorted(classes(time='08:30')), sorted([self.school_class.pk, other.pk]))
+        self.assertEqual(len(classes(time='09:14')), 2)
+        self.assertEqual(classes(time='09:15'), [])
+        self.assertEqual(classes(time='08:30', classes=f'{other.pk}'), [other.pk])
+        self.assertEqual(classes(time='08:30', classes='0'), [])
+        for params in ({'time': '9'}, {'time': 'noon'}, {'time': '08:30', 'classes': '5a'},
+                       {'time': '08:30', 'day': 'sun'}):
+            self.assertEqual(self.client.get('/timeline/', {'day': 'mon', **params}).status_code, 400)
+
+    async def test_lookup_survives_invalidation_after_build(self):
+        school_id = self.school_class.school_id
+        days = await timeline.of(school_id).aensure_built()
+        pupils = await now_index.of(school_id).aensure_built()
+        # an edit committed between the await and the lookup must not make it query on the event loop
+        timeline.of(school_id).invalidate()
+        now_index.of(school_id).invalidate()
+        self.assertEqual([e.pk for e in lessons_at(days, 'mon', time(8, 40))], [self.entry.pk])
+        self.assertEqual([p['id'] for p in match_pupils(pupils, 'john', 'smith')], [self.pupil.pk])
+
+
+@override_settings(TIMETABLE_METRICS=True)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school_class = Class.objects.create(number=5, letter='A')
+
+    def setUp(self):
+        schools.invalidate()
+        grids.invalidate()
+        metrics.recorder.clear()
+
+    def test_request_timings(self):
+        response = self.client.get(f'/grid/class/{self.school_class.pk}/')
+        self.assertIn('queries', response['Server-Timing'])
+        samples, counts = metrics.recorder.snapshot()
+        self.assertEqual(counts['timetable:week_grid'][0], 1)
+        self.assertGreater(samples['timetable:week_grid'][0][3], 0)
+        self.assertIn('view="timetable:week_grid"', self.client.get('/metrics').content.decode())
+
+    async def test_async_requests_and_worker_threads(self):
+        response = await self.async_client.get('/pupils/where/', {'ids': '0', 'at': '2026-10-19T08:40:00'})
+        self.assertIn('queries', response['Server-Timing'])
+
+        def select_one():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')  # the test transaction locks the tables
+            finally:
+                connection.close()
+
+        timing = metrics.RequestTiming()
+        token = metrics._current.set(timing)
+        try:
+            # a new thread opens a new connection
+            await sync_to_async(select_one, thread_sensitive=False)()
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(timing.queries, 1)
+
+
+@override_settings(TIMETABLE_READ_REPLICAS=['replica1'])
+class DatabaseProfileTests(SimpleTestCase):
+    def test_reads_go_to_replicas_only_when_allowed(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Pupil), 'default')
+        with use_replicas():
+            self.assertEqual(router.db_for_read(Pupil), 'replica1')
+            self.assertEqual(router.db_for_write(Pupil), 'default')
+            with use_replicas(False):
+                self.assertEqual(router.db_for_read(Pupil), 'default')
+
+    def test_database_urls(self):
+        sqlite = database('', '/srv/db.sqlite3')
+        self.assertEqual(sqlite['NAME'], '/srv/db.sqlite3')
+        self.assertEqual(sqlite['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertNotIn('journal_mode', sqlite['OPTIONS']['init_command'])  # set once by a migration
+        with self.assertRaises(ValueError):
+            database('sqlite://db.sqlite3', '/srv/db.sqlite3')
+        pg = database('postgres://tt:s%40cret@db:5433/timetable?sslmode=require', '')
+        self.assertEqual((pg['USER'], pg['PASSWORD'], pg['HOST'], pg['PORT']), ('tt', 's@cret', 'db', '5433'))
+        self.assertEqual(pg['OPTIONS']['sslmode'], 'require')
+        self.assertEqual(pg['CONN_MAX_AGE'], 0)  # pooled
+        self.assertTrue(pg['CONN_HEALTH_CHECKS'])
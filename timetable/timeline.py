@@ -0,0 +1,123 @@
+"""
+"What is happening at (day, time)" engine.
+
+All entries are loaded once (with class, subject and teacher) into one sorted
+interval list per day, using the stored start/end when set and the bell
+schedule otherwise. A query bisects to the lessons that started at most
+`longest lesson` ago and keeps those still running, so one class, a list of
+classes or the whole school is answered in one pass with no queries. Like the
+grids, the structure is dropped on any timetable change and rebuilt lazily.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+
+from asgiref.sync import sync_to_async
+
+from .bells import get_table
+from .models import DAY_CHOICES, TimeEntry
+from .routers import use_replicas
+from .schools import PerSchool
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute + t.second / 60
+
+
+class DayIntervals:
+    __slots__ = ('starts', 'items', 'max_span')
+
+    def __init__(self, items):
+        # items: [(start minute, end minute, entry), ...]
+        items.sort(key=lambda i: (i[0], i[2].school_class_id, i[2].group))
+        self.items = items
+        self.starts = [i[0] for i in items]
+        self.max_span = max((i[1] - i[0] for i in items), default=0)
+
+    def at(self, minute, class_ids=None):
+        """Entries with start <= minute < end, optionally only for class_ids."""
+        lo = bisect_left(self.starts, minute - self.max_span)
+        hi = bisect_right(self.starts, minute)
+        found = []
+        for start, end, entry in self.items[lo:hi]:
+            if minute < end and (class_ids is None or entry.school_class_id in class_ids):
+                found.append(entry)
+        return found
+
+
+class Timeline:
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self._lock = threading.Lock()
+        self._days = None
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._days = None
+            self._generation += 1
+
+    @use_replicas(False)
+    def build(self):
+        table = get_table(school_id=self.school_id)
+        days = {code: [] for code, _ in DAY_CHOICES}
+        entries = (TimeEntry.objects.filter(school_id=self.school_id)
+                   .select_related('school_class', 'subject', 'teacher'))
+        for e in entries:
+            if e.day not in days:
+                continue
+            computed = table.times(e.session) if e.session <= len(table) else (None, None)
+            # effective times: stored override, else the bell schedule
+            e.start_time = e.start_time or computed[0]
+            e.end_time = e.end_time or computed[1]
+            if not e.start_time or not e.end_time:
+                continue
+            days[e.day].append((_minutes(e.start_time), _minutes(e.end_time), e))
+        return {day: DayIntervals(items) for day, items in days.items()}
+
+    def _get_days(self):
+        days = self._days
+        if days is None:
+            generation = self._generation
+            days = self.build()
+            with self._lock:
+                if generation == self._generation:
+                    self._days = days
+        return days
+
+    async def aensure_built(self):
+        """
+        For async views: build in a worker thread, so the event loop never waits on queries.
+        Returns the built days for `lessons_at`, which a later invalidation cannot send back to the database.
+        """
+        days = self._days
+        if days is None:
+            days = await sync_to_async(self._get_days)()
+        return days
+
+    def at(self, day, when, class_ids=None):
+        """TimeEntry objects running on `day` at `when` (a datetime.time)."""
+        return lessons_at(self._get_days(), day, when, class_ids)
+
+
+def lessons_at(days, day, when, class_ids=None):
+    """Timeline.at over days returned by Timeline.aensure_built; never queries."""
+    intervals = days.get(day)
+    if intervals is None:
+        return []
+    return intervals.at(_minutes(when), set(class_ids) if class_ids is not None else None)
+
+
+def serialize(entry):
+    return {
+        'class_id': entry.school_class_id,
+        'class': str(entry.school_class),
+        'subject': str(entry.subject),
+        'teacher': str(entry.teacher),
+        'group': entry.group,
+        'session': entry.session,
+        'start': entry.start_time.strftime("%H:%M"),
+        'end': entry.end_time.strftime("%H:%M"),
+    }
+
+
+timeline = PerSchool(Timeline)
@@ -6,4 +6,14 @@ app_name = "timetable"  # ← this is crucial
 urlpatterns = [
     path("pupil-now/", views.pupil_now, name="pupil_now"),
     path("simulator/", views.timetable_simulator, name="simulator_view"),  # if you added one
+    path("pupils/autocomplete/", views.pupil_autocomplete, name="pupil_autocomplete"),
+    path("pupils/where/", views.pupils_where, name="pupils_where"),
+    path("grid/<str:kind>/<int:pk>/", views.week_grid, name="week_grid"),
+    path("ics/<str:kind>/<str:key>.ics", views.calendar_feed, name="calendar_feed"),
+    path("teachers/<int:pk>/free/", views.teacher_free_slots, name="teacher_free_slots"),
+    path("teachers/<int:pk>/substitutes/", views.teacher_substitutes, name="teacher_substitutes"),
+    path("timeline/", views.happening_at, name="happening_at"),
+    path("now/stream/", views.now_stream, name="now_stream"),
+    path("changesets/", views.changeset, name="changeset"),
+    path("metrics", views.metrics, name="metrics"),
 ]
@@ -0,0 +1,208 @@
+"""
+Timetable versions: drafts, the published week and its history.
+
+A TimetableVersion is an immutable snapshot of a school's whole week, kept in
+one row as a compact JSON list (ids instead of names, see ROW_FIELDS), so
+storing a version is one INSERT however many lessons it has. The live
+TimeEntry table stays what the site shows and the admin edits.
+
+- snapshot() keeps the live week as a new version (a draft by default), e.g.
+  before a big edit; generate_timetable --draft keeps a generated week as one.
+- diff() compares two row lists in O(n): rows are keyed on their
+  (day, session, class, group) slot, which is unique, and compared as dicts.
+- publish() makes a version the live week in one transaction. If the live week
+  has drifted from the published version it is kept as a version first, then
+  only the differences are written (one DELETE and one bulk INSERT) and the
+  caches are invalidated once.
+- rollback() first drops the edits made since the last publish, then steps
+  back to the version that was live before, and so on.
+
+Versions are numbered 1, 2, ... per school; published_number() is the one the
+live week came from.
+"""
+from dataclasses import dataclass, field
+from datetime import time
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .conflicts import Occupancy, Slot
+from .models import Class, Room, School, Subject, Teacher, TimeEntry, TimetableVersion
+from .schools import current_school_id
+from .signals import timetable_changed
+from .slots import slot_bit
+
+ROW_FIELDS = ('day', 'session', 'school_class_id', 'group',
+              'subject_id', 'teacher_id', 'room_id', 'start_time', 'end_time')
+KEY_SIZE = 4  # day, session, class, group: the TimeEntry unique constraint
+
+
+class PublishError(Exception):
+    pass
+
+
+@dataclass
+class Diff:
+    added: list = field(default_factory=list)    # rows
+    removed: list = field(default_factory=list)  # rows
+    changed: list = field(default_factory=list)  # (old row, new row)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+def _hhmm(value):
+    return value.strftime('%H:%M') if value else None
+
+
+def _keyed(rows):
+    return {tuple(r[:KEY_SIZE]): tuple(r[KEY_SIZE:]) for r in rows}
+
+
+def _live(school_id):
+    """The live week as rows, and {slot key: TimeEntry pk}."""
+    rows, pks = [], {}
+    qs = TimeEntry.objects.filter(school_id=school_id).order_by('day', 'session', 'school_class_id', 'group')
+    for pk, *row in qs.values_list('pk', *ROW_FIELDS):
+        row[-2:] = _hhmm(row[-2]), _hhmm(row[-1])
+        rows.append(row)
+        pks[tuple(row[:KEY_SIZE])] = pk
+    return rows, pks
+
+
+def live_rows(school_id=None):
+    return _live(school_id or current_school_id())[0]
+
+
+def diff(old_rows, new_rows):
+    """What changes from old_rows to new_rows (version.rows or live_rows())."""
+    old, new = _keyed(old_rows), _keyed(new_rows)
+    result = Diff()
+    for key, value in new.items():
+        before = old.get(key)
+        if before is None:
+            result.added.append([*key, *value])
+        elif before != value:
+            result.changed.append(([*key, *before], [*key, *value]))
+    result.removed = [[*key, *value] for key, value in old.items() if key not in new]
+    return result
+
+
+def save_version(rows, status='draft', note='', school_id=None, previous=None):
+    """Store rows as the school's next version (times only where a lesson overrides its session's)."""
+    school_id = school_id or current_school_id()
+    rows = [list(row) for row in rows]
+    with transaction.atomic():
+        # serializes the numbering
+        list(School.objects.select_for_update().filter(pk=school_id).values_list('pk', flat=True))
+        last = TimetableVersion.objects.filter(school_id=school_id).aggregate(n=Max('number'))['n'] or 0
+        return TimetableVersion.objects.create(
+            school_id=school_id, number=last + 1, status=status, note=note,
+            rows=rows, entry_count=len(rows), previous=previous,
+        )
+
+
+def snapshot(note='', status='draft', school_id=None):
+    """Keep the live week as a new version."""
+    school_id = school_id or current_school_id()
+    return save_version(live_rows(school_id), status, note, school_id)
+
+
+def published(school_id=None):
+    return TimetableVersion.objects.filter(school_id=school_id or current_school_id(), status='published').first()
+
+
+def published_number(school_id=None):
+    """Number of the version the live week was published from, or None."""
+    qs = TimetableVersion.objects.filter(school_id=school_id or current_school_id(), status='published')
+    return qs.values_list('number', flat=True).first()
+
+
+def _entries(rows, school_id):
+    return [
+        TimeEntry(
+            school_id=school_id, day=day, session=session, school_class_id=class_id, group=group,
+            subject_id=subject_id, teacher_id=teacher_id, room_id=room_id,
+            start_time=time.fromisoformat(start) if start else None,
+            end_time=time.fromisoformat(end) if end else None,
+        )
+        for day, session, class_id, group, subject_id, teacher_id, room_id, start, end in rows
+    ]
+
+
+def _check(rows, school_id):
+    """Messages for rows that refer to deleted objects or break the timetable rules."""
+    problems = []
+    references = ((Class, "class", 2), (Subject, "subject", 4), (Teacher, "teacher", 5), (Room, "room", 6))
+    for model, label, column in references:
+        wanted = {r[column] for r in rows} - {None}
+        missing = wanted - set(model.objects.filter(school_id=school_id, pk__in=wanted).values_list('pk', flat=True))
+        if missing:
+            problems.append(f"Unknown {label} ids: {', '.join(map(str, sorted(missing)))}.")
+    if problems:
+        return problems
+    occupancy = Occupancy()
+    for day, session, class_id, group, _, teacher_id, room_id, *_ in rows:
+        slot = Slot(slot_bit(day, session), class_id, group, teacher_id, room_id)
+        found = occupancy.violations(slot)
+        if found:
+            problems.append(f"{day} {session}, class {class_id} ({group}): "
+                            + ' '.join(message for _, message in found))
+        occupancy.add(slot)
+    return problems
+
+
+def publish(version, note=''):
+    """
+    Make `version` the live week of its school, in one transaction; returns the Diff
+    that was applied. Raises PublishError (and changes nothing) if its rows are invalid now.
+    """
+    school_id = version.school_id
+    with transaction.atomic():
+        list(School.objects.select_for_update().filter(pk=school_id).values_list('pk', flat=True))
+        version = TimetableVersion.objects.get(pk=version.pk)
+        problems = _check(version.rows, school_id)
+        if problems:
+            raise PublishError(' '.join(problems))
+
+        live, pks = _live(school_id)
+        current = was_live = published(school_id)
+        if live and (current is None or _keyed(current.rows) != _keyed(live)):
+            # edited since it was published: keep it, so this can be rolled back
+            was_live = save_version(live, 'archived', note or f"Live week before v{version.number} was published",
+                                    school_id, previous=current)
+        if version.status == 'draft' and was_live is not None:
+            version.previous = was_live
+
+        changes = diff(live, version.rows)
+        # changed rows are replaced too: bulk_update's per-row CASE is far slower than DELETE + INSERT
+        old = changes.removed + [o for o, _ in changes.changed]
+        new = changes.added + [n for _, n in changes.changed]
+        if old:
+            TimeEntry.objects.filter(pk__in=[pks[tuple(r[:KEY_SIZE])] for r in old]).delete()
+        if new:
+            TimeEntry.objects.bulk_create(_entries(new, school_id), batch_size=500)
+
+        TimetableVersion.objects.filter(school_id=school_id, status='published').update(status='archived')
+        TimetableVersion.objects.filter(pk=version.pk).update(
+            status='published', published_at=timezone.now(), previous=version.previous)
+        # bulk writes skip post_save, so the caches have to be told directly
+        transaction.on_commit(partial(timetable_changed, school_id))
+    return changes
+
+
+def rollback(school_id=None):
+    """
+    Undo: republish the published version if the live week was edited since,
+    else publish the version that was live before it. Returns the version published, or None.
+    """
+    school_id = school_id or current_school_id()
+    current = published(school_id)
+    if current is None:
+        return None
+    target = current if _keyed(current.rows) != _keyed(live_rows(school_id)) else current.previous
+    if target is not None:
+        publish(target)
+    return target
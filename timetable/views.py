@@ -1,63 +1,55 @@
-from datetime import datetime, time, timedelta
+import json
+from datetime import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.utils import timezone
-from django.db.models import Q
-from .models import Pupil, TimeEntry
-
-
-def session_times(session_index: int):
-    if session_index < 1 or session_index > 8:
-        raise ValueError("session_index must be between 1 and 8")
-
-    start = datetime.combine(datetime.today(), time(hour=8, minute=30))
-
-    current = start
-    for s in range(1, session_index):
-        current += timedelta(minutes=45)
-        if s == 4:
-            current += timedelta(minutes=45)  # big break after 4
-        else:
-            current += timedelta(minutes=5)
-    lesson_start = current.time()
-    lesson_end_dt = (current + timedelta(minutes=45)).time()
-    return lesson_start, lesson_end_dt
-
-
-# session lookup
-SESSION_RANGES = {i: session_times(i) for i in range(1, 9)}
-
-# simple weekday-to-code map, now with weekends included
-WEEKDAY_TO_CODE = {
-    0: 'mon',
-    1: 'tue',
-    2: 'wed',
-    3: 'thu',
-    4: 'fri',
-}
-
-
-def get_current_session(now_time):
-    """Return session index (int) or None if outside lessons."""
-    for i, (start, end) in SESSION_RANGES.items():
-        if start <= now_time < end:
-            return i
-    return None
-
-
-def pupil_now(request):     
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime, parse_time
+from django.views.decorators.http import condition, require_POST
+from .models import WEEKDAY_TO_CODE, Class
+from .calendar import calendar
+from .broadcast import broadcaster
+from .changesets import apply_changeset
+from .fragments import alesson_rows, simulator_results
+from .grids import get_grid
+from . import ics
+from .locate import alocate_pupils
+from .metrics import prometheus_text
+from .routers import replica_reads
+from .timeline import lessons_at, serialize, timeline
+from .now_index import match_pupils, now_index
+from .search import pupil_search
+from .substitutes import teacher_book
+from .warmup import warmer
+
+
+@replica_reads
+async def pupil_now(request):
     """
     q = full pupil name (first and last, both required)
     works even on weekends
+    Async: in the steady state everything is in memory, and a cold index or
+    the fragment cache is awaited instead of holding a worker thread.
     """
     q = request.GET.get('q', '').strip()
     results = []
     message = ''
+    if isinstance(request, ASGIRequest):
+        warmer.ensure_started()  # renders each session's fragments before its bell
     now = timezone.localtime(timezone.now())
-    weekday = now.weekday()
-    day_code = WEEKDAY_TO_CODE.get(weekday)
-    current_session = get_current_session(now.time())
-
-    if current_session is None:
+    # holidays, other bell times and lesson changes of the date (see calendar.py)
+    plan = await calendar.aplan(now.date())
+    day_code = plan.day
+    current_session = plan.table.current_session(now.time())
+
+    if plan.closed:
+        message = f"No lessons today: {plan.note or 'the school is closed'}."
+    elif current_session is None:
         message = f"No lesson right now. Current time {now.time().strftime('%H:%M')} is outside defined session ranges."
     elif not q:
         message = "SPECIAL-CASE"
@@ -67,44 +59,26 @@ def pupil_now(request):
             message = "Please enter both first and last name for privacy reasons."
         else:
             first, last = parts[0], parts[-1]
-            pupils = Pupil.objects.filter(
-                first_name__iexact=first,
-                last_name__iexact=last
-            ).select_related('school_class')
+            # served from the in-memory index, no queries in the steady state
+            pupils = match_pupils(await now_index.aensure_built(), first, last)
 
-            if not pupils.exists():
+            if not pupils:
                 message = "No pupil found with that full name."
             else:
                 pupils_with_lessons = 0
+                # rendered cells per (class, group, day, session), cached until the next bell
+                rows = await alesson_rows(day_code, current_session, pupils, now, plan=plan)
 
                 for pupil in pupils:
-                    entries = TimeEntry.objects.filter(
-                        day=day_code,
-                        session=current_session,
-                        school_class=pupil.school_class
-                    ).select_related('subject', 'teacher').order_by('group')
-
-                    formatted = []
-                    for e in entries:
-                        start, end = (
-                            e.start_time or e.computed_start_end[0],
-                            e.end_time or e.computed_start_end[1],
-                        )
-                        formatted.append({
-                            'subject': str(e.subject),
-                            'teacher': str(e.teacher),
-                            'group': e.get_group_display(),
-                            'start': start.strftime("%H:%M") if start else '',
-                            'end': end.strftime("%H:%M") if end else '',
-                        })
-
-                    if formatted:
+                    lessons = rows[pupil['id']]
+
+                    if lessons:
                         pupils_with_lessons += 1
 
                     results.append({
-                        'pupil': f"{pupil.first_name} {pupil.last_name}",
-                        'class': str(pupil.school_class),
-                        'entries': formatted,
+                        'pupil': f"{pupil['first_name']} {pupil['last_name']}",
+                        'class': pupil['class'],
+                        'lessons': lessons,
                     })
 
                 if pupils_with_lessons == 0:
@@ -121,25 +95,202 @@ def pupil_now(request):
     return render(request, 'timetable/pupil_results.html', context)
 
 
+async def pupils_where(request):
+    """
+    ids = comma separated pupil ids, at = optional ISO datetime (default now).
+    Answers for the whole list with two queries; used for attendance and the ID kiosk.
+    """
+    try:
+        ids = [int(x) for x in request.GET.get('ids', '').split(',') if x.strip()]
+    except ValueError:
+        return JsonResponse({'error': "ids must be comma separated integers."}, status=400)
+    when = None
+    if request.GET.get('at'):
+        when = parse_datetime(request.GET['at'])
+        if when is None:
+            return JsonResponse({'error': "at must be an ISO datetime."}, status=400)
+    try:
+        found = await alocate_pupils(ids, when)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'day': found.day,
+        'session': found.session,
+        'pupils': found.pupils,
+        'missing': found.missing,
+    })
+
+
+async def happening_at(request):
+    """
+    day = mon..fri, time = HH:MM, classes = optional comma separated class ids
+    (default: whole school). Lists every lesson running at that moment.
+    """
+    day = request.GET.get('day', '')
+    try:
+        hour, minute = map(int, request.GET.get('time', '').split(':'))
+        at = time(hour, minute)
+        class_ids = None
+        if request.GET.get('classes'):
+            class_ids = [int(x) for x in request.GET['classes'].split(',') if x.strip()]
+    except ValueError:
+        return JsonResponse({'error': "time must be HH:MM and classes comma separated ids."}, status=400)
+    if day not in WEEKDAY_TO_CODE.values():
+        return JsonResponse({'error': "day must be one of mon..fri."}, status=400)
+    lessons = lessons_at(await timeline.aensure_built(), day, at, class_ids)
+    return JsonResponse({
+        'day': day,
+        'time': at.strftime("%H:%M"),
+        'lessons': [serialize(e) for e in lessons],
+    })
+
+
+async def now_stream(request):
+    """
+    Server-Sent Events: a `snapshot` of every running lesson at each bell,
+    and a `diff` whenever the timetable is edited. ASGI only: under WSGI Django
+    would read the endless async stream to its end before sending anything.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("The live stream needs the ASGI server (config/asgi.py).\n",
+                            status=501, content_type='text/plain')
+    response = StreamingHttpResponse(broadcaster.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # keep nginx from buffering the stream
+    return response
+
+
+def teacher_free_slots(request, pk):
+    """Free (day, session) slots of a teacher, optionally for one ?day=."""
+    book = teacher_book.get()
+    day = request.GET.get('day') or None
+    if pk not in book.names:
+        raise Http404("No such teacher.")
+    if day is not None and day not in WEEKDAY_TO_CODE.values():
+        return JsonResponse({'error': "day must be one of mon..fri."}, status=400)
+    return JsonResponse({
+        'teacher': book.names[pk],
+        'free': [{'day': d, 'session': s} for d, s in book.free_slots(pk, day)],
+    })
+
+
+def teacher_substitutes(request, pk):
+    """
+    Every lesson of an absent teacher (?day= for one day, default the whole week)
+    with free, qualified teachers ranked as cover.
+    """
+    book = teacher_book.get()
+    day = request.GET.get('day') or None
+    if pk not in book.names:
+        raise Http404("No such teacher.")
+    if day is not None and day not in WEEKDAY_TO_CODE.values():
+        return JsonResponse({'error': "day must be one of mon..fri."}, status=400)
+    try:
+        limit = int(request.GET.get('limit', 5))
+    except ValueError:
+        limit = 5
+    return JsonResponse({
+        'teacher': book.names[pk],
+        'day': day,
+        'slots': book.substitutes(pk, day, limit=max(limit, 1)),
+    })
+
+
+@staff_member_required
+@require_POST
+def changeset(request):
+    """
+    Apply several moves/swaps/deletes at once (see changesets.py). JSON body:
+    {"operations": [...], "dry_run": false}. All or nothing; 400 with the errors otherwise.
+    """
+    try:
+        payload = json.loads(request.body)
+        operations = payload['operations']
+        if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "Body must be JSON with an 'operations' list of objects."}, status=400)
+    report = apply_changeset(operations, dry_run=bool(payload.get('dry_run')))
+    return JsonResponse({
+        'ok': report.ok,
+        'updated': report.updated,
+        'deleted': report.deleted,
+        'errors': [{'operation': n, 'message': message} for n, message in report.errors],
+    }, status=200 if report.ok else 400)
 
 
+def metrics(request):
+    """Prometheus text export of the request timings (TIMETABLE_METRICS must be on)."""
+    if not getattr(settings, 'TIMETABLE_METRICS', False):
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
+def _grid_etag(request, kind, pk):
+    grid = get_grid(kind, pk)
+    return grid.etag if grid else None
 
 
+def _feed_etag(request, kind, key):
+    target = ics.resolve(kind, key, request.school_id)
+    return ics.feed_etag(*target, request.school_id) if target else None
 
-from django.shortcuts import render
-from datetime import datetime
-from django.db.models import Q
-from .models import Class, Pupil
-from .models import TimeEntry as TimetableEntry
-
-def timetable_simulator(request):
-    classes = Class.objects.all()
-    entries = []
+
+@condition(etag_func=_feed_etag)
+def calendar_feed(request, kind, key):
+    """
+    iCalendar feed: /ics/class/<id>.ics, /ics/teacher/<id>.ics or /ics/pupil/<token>.ics
+    (token from ics.pupil_token). Calendar apps re-poll with If-None-Match and get 304
+    until the timetable changes.
+    """
+    target = ics.resolve(kind, key, request.school_id)
+    content = ics.feed(*target, request.school_id) if target else None
+    if content is None:
+        raise Http404("No such calendar.")
+    response = StreamingHttpResponse(content, content_type='text/calendar; charset=utf-8')
+    # a pupil's token carries their id in clear, so it stays out of the file name
+    filename = 'pupil.ics' if kind == 'pupil' else f'{kind}-{key}.ics'
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def pupil_autocomplete(request):
+    """
+    q = start of a pupil's first and/or last name, in Latin or Cyrillic.
+    Returns {"results": [{"id", "name", "class"}, ...]}.
+    """
+    q = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    await pupil_search.aensure_built()
+    return JsonResponse({'results': pupil_search.search(q, limit=max(limit, 1))})
+
+
+@condition(etag_func=_grid_etag)
+def week_grid(request, kind, pk):
+    """
+    Whole week of a class or teacher as JSON: grid[day][session - 1] is a list
+    of lessons (two when the class is split into groups).
+    Polling clients should send If-None-Match and will get 304 until the timetable changes.
+    """
+    grid = get_grid(kind, pk)
+    if grid is None:
+        raise Http404("No such class or teacher.")
+    response = HttpResponse(grid.body, content_type='application/json')
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@replica_reads
+async def timetable_simulator(request):
+    classes = Class.objects.filter(school_id=request.school_id)
     selected_class = None
     selected_day = None
     selected_time = None
+    results_html = ''
 
     if request.method == "POST":
         selected_class_id = request.POST.get("class_id")
@@ -147,21 +298,33 @@ def timetable_simulator(request):
         selected_time = request.POST.get("time")
 
         if selected_class_id and selected_day and selected_time:
-            selected_class = Class.objects.get(id=selected_class_id)
-            # Simulate a weekday date just to combine with time
-            fake_date = datetime.strptime("2025-10-13", "%Y-%m-%d")  # Monday
-            hour, minute = map(int, selected_time.split(":"))
-            now = fake_date.replace(hour=hour, minute=minute)
-            entries = TimetableEntry.objects.filter(
-                day=selected_day,
-                school_class=selected_class,
-                start_time__lte=now.time(),
-                end_time__gte=now.time(),
-            )
+            selected_class = await classes.filter(id=selected_class_id).afirst()
+            if selected_class is None:
+                raise Http404("No such class.")
+            try:
+                at = parse_time(selected_time)
+            except ValueError:
+                at = None
+            if at is None:
+                return HttpResponseBadRequest("time must be HH:MM.")
+
+            def render_results():
+                # effective (stored or bell schedule) times, subject/teacher preloaded
+                entries = lessons_at(days, selected_day, at, class_ids=[selected_class.pk])
+                return render_to_string("timetable/simulator_results.html", {
+                    "entries": entries,
+                    "selected_class": selected_class,
+                    "selected_day": selected_day,
+                    "selected_time": selected_time,
+                })
+
+            days = await timeline.aensure_built()
+            results_html = await sync_to_async(simulator_results)(
+                selected_class, selected_day, at, render_results)
 
     return render(request, "timetable_simulator.html", {
-        "classes": classes,
-        "entries": entries,
+        "classes": [c async for c in classes],
+        "results_html": results_html,
         "selected_class": selected_class,
         "selected_day": selected_day,
         "selected_time": selected_time,
@@ -0,0 +1,75 @@
+"""
+Fragment warm-up before each bell.
+
+The lesson fragments of pupil_now expire at every bell (see fragments.py), so
+without help the first lookups after it all miss at once. A minute before a
+session starts (the day's bell table, see calendar.py), warm() renders the
+coming session's fragments of every (class, group) that has pupils into the
+cache, to expire at the bell after it. The lookups at the bell then all hit.
+
+Under ASGI, one Warmer per school and process runs this on the event loop,
+started by the first pupil_now request like the live board's ticker. With a
+shared cache one process warming is enough; the others find the fragments too.
+"""
+import asyncio
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .bells import seconds_to_next_bell
+from .calendar import calendar
+from .fragments import slot_rows
+from .now_index import now_index
+from .schools import PerSchool
+
+WARM_AHEAD_SECONDS = 60
+
+
+def next_start(now, school_id):
+    """The next session start after `now` (aware, local), or the next midnight after the last one."""
+    plan = calendar.of(school_id).plan(now.date())
+    if plan.day is not None:
+        for start in plan.table.starts:
+            if start > now.time():
+                return datetime.combine(now.date(), start, now.tzinfo)
+    return datetime.combine(now.date() + timedelta(days=1), time.min, now.tzinfo)
+
+
+def warm(at, school_id):
+    """Render the fragments of the session running at `at` (aware); returns how many slots were warmed."""
+    at = timezone.localtime(at)
+    plan = calendar.of(school_id).plan(at.date())
+    session = plan.table.current_session(at.time())
+    if plan.day is None or session is None:
+        return 0
+    slots = now_index.of(school_id).pupil_slots()
+    # kept from now until the bell after `at`
+    timeout = seconds_to_next_bell(at, table=plan.table) + max((at - timezone.now()).total_seconds(), 0)
+    return len(slot_rows(plan.day, session, slots, at, school_id, plan, timeout))
+
+
+class Warmer:
+    def __init__(self, school_id):
+        self.school_id = school_id
+        self.loop = None
+        self._task = None
+
+    def ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self._task.done():
+            # first lookup, a new event loop (tests, server restart), or a failed warm-up
+            self.loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            now = timezone.localtime(timezone.now())
+            # in a thread: a new day's calendar plan may need queries
+            bell = await sync_to_async(next_start)(now, self.school_id)
+            await asyncio.sleep(max((bell - now).total_seconds() - WARM_AHEAD_SECONDS, 0))
+            await sync_to_async(warm)(bell, self.school_id)
+            await asyncio.sleep(max((bell - timezone.localtime(timezone.now())).total_seconds(), 0) + 0.05)
+
+
+warmer = PerSchool(Warmer)